@@ -1,8 +1,27 @@
+import asyncio
+import contextvars
+import json
 import os
 import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, List, Optional, Tuple, cast
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+    cast,
+)
 
+import httpx
 from dotenv import load_dotenv
 
 # Always load .env
@@ -12,159 +31,1193 @@ load_dotenv()
 if os.getenv("NO_API_KEY_MODE"):
     os.environ.pop("OPENROUTER_API_KEY", None)
 
-# pyright: ignore[reportUnknownVariableType] # langchain type stubs are incomplete
-from langchain.agents import AgentExecutor, create_openai_tools_agent
-from langchain.memory import ConversationBufferMemory
-from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain.schema import BaseMessage
-from langchain.tools import BaseTool
+# The LangChain executor and chat model are imported when the "langchain"
+# agent engine first needs them, so other callers don't pay for the import
+from langchain_core.agents import AgentAction, AgentFinish, AgentStep
+from langchain_core.callbacks import CallbackManagerForChainRun
 from langchain_core.language_models import BaseLanguageModel
-from langchain_openai import ChatOpenAI
-from openai import OpenAI
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    HumanMessage,
+    SystemMessage,
+    messages_from_dict,
+    messages_to_dict,
+)
+from langchain_core.tools import BaseTool
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from openai import NOT_GIVEN, AsyncOpenAI, OpenAI
+from pydantic import SecretStr
 
 # Add src to path for imports
 sys.path.insert(0, str(Path(__file__).parent))
 
+from ai_cache import cache_key, get_response_cache
 from ai_test_helpers import memoise_for_tests
-from helpers.context import Context
+from circuit_breaker import get_model_router
+from deadline import (
+    DeadlineExceeded,
+    bounded_timeout,
+    check_deadline,
+    raise_on_deadline,
+)
+from hedging import get_hedging_policy
+from helpers.context import CacheablePrompt, Context
+from helpers.json_schema import parse_json_reply, schema_errors
+from helpers.settings import CallSiteSettings, settings
+from scheduler import AsyncSchedulingTransport, RequestScheduler, SchedulingTransport
+from single_flight import AsyncSingleFlight, SingleFlight
 from tracing import (
     LogLevel,
     get_log_level,
     log_enter,
     log_error,
     log_exit,
+    log_info,
     log_llm_ai,
     log_llm_operator,
     log_llm_system,
     log_trace,
 )
 
+if TYPE_CHECKING:
+    from langchain.agents import AgentExecutor
+    from langchain_openai import ChatOpenAI
+
 DEFAULT_MODEL: str = os.getenv("DEFAULT_AI_MODEL", "openai/gpt-4o-mini")
 
-_client = None
+# Maximum number of ai_async() requests in flight at once (per event loop)
+_max_concurrency: int = int(os.getenv("AI_MAX_CONCURRENCY", "8"))
+
+# OpenAI-compatible endpoint used by both ai() and agent()
+OPENROUTER_BASE_URL: str = os.getenv(
+    "OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1"
+)
+
+# Models that need explicit cache_control markers for prompt caching on
+# OpenRouter (OpenAI, DeepSeek and others cache shared prefixes automatically)
+CACHE_CONTROL_MODEL_PREFIXES = ("anthropic/", "google/")
+
+# Providers ignore cache markers on prefixes shorter than about 1024 tokens
+MIN_CACHEABLE_PREFIX_CHARS = 4096
+
+# Models served with OpenRouter's json_schema structured outputs; others get
+# the schema in the prompt and their reply is validated locally
+STRUCTURED_OUTPUT_MODEL_PREFIXES = ("openai/", "google/")
+SCHEMA_INSTRUCTION = (
+    "\n\nRespond with only a JSON value that matches this JSON schema:\n"
+)
+
+# Structured reply of yesno(); the answer keeps the plain "YES" / "NO, ..." form
+YESNO_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {"answer": {"type": "string", "pattern": "^(YES|NO, .+)$"}},
+    "required": ["answer"],
+    "additionalProperties": False,
+}
+
+# Keep-alive pool shared by every client talking to OPENROUTER_BASE_URL
+HTTP_POOL_LIMITS = httpx.Limits(
+    max_connections=64, max_keepalive_connections=32, keepalive_expiry=120
+)
+
+# Every LLM request goes through this scheduler (see SchedulingTransport)
+scheduler = RequestScheduler(
+    requests_per_minute=float(os.getenv("AI_REQUESTS_PER_MINUTE", "600")),
+    tokens_per_minute=float(os.getenv("AI_TOKENS_PER_MINUTE", "2000000")),
+)
+
+# How many built agent executors to keep around
+AGENT_CACHE_SIZE = 16
+
+# agent() runs on LangChain's AgentExecutor ("langchain") or on a plain tool
+# calling loop over the OpenAI client ("native"); both share these limits
+AGENT_ENGINES = ("langchain", "native")
+DEFAULT_AGENT_ENGINE: str = os.getenv("AGENT_ENGINE", "langchain")
+AGENT_MAX_ITERATIONS = 10
+AGENT_MAX_EXECUTION_TIME = 300.0
+AGENT_STOPPED_OUTPUT = "Agent stopped due to iteration limit or time limit."
+
+# Tool calls returned in one agent step run concurrently on this pool
+_tool_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("AGENT_TOOL_CONCURRENCY", "8")),
+    thread_name_prefix="agent-tool",
+)
+
+_client: Optional[OpenAI] = None
+_http_client: Optional[httpx.Client] = None
+_async_http_client: Optional[httpx.AsyncClient] = None
+_chat_models: Dict[Tuple[str, Optional[int], Optional[float]], "ChatOpenAI"] = {}
+_agent_executors: "OrderedDict[Tuple[str, Tuple[int, ...], str, Optional[int], Optional[float]], AgentExecutor]" = (OrderedDict())
+_concurrent_agent_executor: Optional["type[AgentExecutor]"] = None
+_clients_lock = threading.Lock()
+
+# Identical requests currently in flight, keyed like the response cache
+_in_flight: SingleFlight[Optional[str]] = SingleFlight()
+_in_flight_async: AsyncSingleFlight[Optional[str]] = AsyncSingleFlight()
+
+# Async clients and semaphores are bound to the event loop they were created in,
+# so keep one per loop instead of a single global.
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = (
+    weakref.WeakKeyDictionary()
+)
+_semaphores: (
+    "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]"
+) = weakref.WeakKeyDictionary()
+
+
+def _api_key() -> str:
+    return os.getenv("OPENROUTER_API_KEY", "")
+
+
+def get_http_client() -> httpx.Client:
+    """Return the process-wide keep-alive HTTP client for LLM requests."""
+    global _http_client
+    with _clients_lock:
+        if _http_client is None:
+            _http_client = httpx.Client(
+                transport=SchedulingTransport(
+                    scheduler, httpx.HTTPTransport(limits=HTTP_POOL_LIMITS)
+                ),
+                timeout=None,
+            )
+        return _http_client
+
+
+class _LoopLocalAsyncTransport(httpx.AsyncBaseTransport):
+    """Async connection pool that keeps a separate pool per event loop.
+
+    Connections are bound to the loop that opened them, so this lets one
+    AsyncClient serve every loop the process runs (e.g. each asyncio.run).
+    """
+
+    def __init__(self) -> None:
+        self._transports: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncHTTPTransport]" = (weakref.WeakKeyDictionary())
+
+    def _transport(self) -> httpx.AsyncHTTPTransport:
+        loop = asyncio.get_running_loop()
+        transport = self._transports.get(loop)
+        if transport is None:
+            transport = httpx.AsyncHTTPTransport(limits=HTTP_POOL_LIMITS)
+            self._transports[loop] = transport
+        return transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self._transport().handle_async_request(request)
 
+    async def aclose(self) -> None:
+        await self._transport().aclose()
 
-def get_client():
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """Async counterpart of get_http_client(), usable from any event loop."""
+    global _async_http_client
+    with _clients_lock:
+        if _async_http_client is None:
+            _async_http_client = httpx.AsyncClient(
+                transport=AsyncSchedulingTransport(
+                    scheduler, _LoopLocalAsyncTransport()
+                ),
+                timeout=None,
+            )
+        return _async_http_client
+
+
+def get_client() -> OpenAI:
     global _client
-    if _client is None:
-        _client = OpenAI(
-            base_url="https://openrouter.ai/api/v1",
-            api_key=os.getenv("OPENROUTER_API_KEY"),
+    http_client = get_http_client()
+    with _clients_lock:
+        if _client is None:
+            _client = OpenAI(
+                base_url=OPENROUTER_BASE_URL,
+                api_key=_api_key(),
+                http_client=http_client,
+                max_retries=0,  # Retries happen in the scheduler
+            )
+        return _client
+
+
+def get_async_client() -> AsyncOpenAI:
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = AsyncOpenAI(
+            base_url=OPENROUTER_BASE_URL,
+            api_key=_api_key(),
+            http_client=get_async_http_client(),
+            max_retries=0,  # Retries happen in the scheduler
         )
-    return _client
+        _async_clients[loop] = client
+    return client
+
+
+def get_chat_model(
+    model: str, max_tokens: Optional[int] = None, timeout: Optional[float] = None
+) -> "ChatOpenAI":
+    """Return a LangChain chat model for model that shares the HTTP pools."""
+    from langchain_openai import ChatOpenAI
+
+    http_client = get_http_client()
+    http_async_client = get_async_http_client()
+    key = (model, max_tokens, timeout)
+    with _clients_lock:
+        chat_model = _chat_models.get(key)
+        if chat_model is None:
+            chat_model = ChatOpenAI(
+                model=model,
+                temperature=0,
+                base_url=OPENROUTER_BASE_URL,
+                api_key=SecretStr(_api_key()),
+                http_client=http_client,
+                http_async_client=http_async_client,
+                max_retries=0,  # Retries happen in the scheduler
+                stream_usage=True,  # For token accounting
+                max_completion_tokens=max_tokens,
+                timeout=timeout,
+            )
+            _chat_models[key] = chat_model
+        return chat_model
+
+
+def _concurrent_agent_executor_class() -> "type[AgentExecutor]":
+    """ConcurrentAgentExecutor, defined on first use with LangChain imported."""
+    global _concurrent_agent_executor
+    if _concurrent_agent_executor is not None:
+        return _concurrent_agent_executor
+
+    from langchain.agents import AgentExecutor
+
+    class ConcurrentAgentExecutor(AgentExecutor):
+        """AgentExecutor that runs the tool calls of one step concurrently.
+
+        The stock executor performs the actions of a step one after another.
+        Here each action is submitted to a thread pool as soon as the step is
+        planned and the observations are collected in their original order, so
+        the chat history is the same as with sequential execution. Tools that
+        share state must do their own locking.
+        """
+
+        def _iter_next_step(
+            self,
+            name_to_tool_map: Dict[str, BaseTool],
+            color_mapping: Dict[str, str],
+            inputs: Dict[str, str],
+            intermediate_steps: List[Tuple[AgentAction, str]],
+            run_manager: Optional[CallbackManagerForChainRun] = None,
+        ) -> Iterator[Union[AgentFinish, AgentAction, AgentStep]]:
+            pending: List[AgentStep] = []
+            for item in super()._iter_next_step(
+                name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager
+            ):
+                if isinstance(item, AgentStep) and isinstance(item.observation, Future):
+                    pending.append(item)
+                else:
+                    yield item
+            for step in pending:
+                observation = cast("Future[Any]", step.observation).result()
+                yield AgentStep(action=step.action, observation=observation)
+
+        def _perform_agent_action(
+            self,
+            name_to_tool_map: Dict[str, BaseTool],
+            color_mapping: Dict[str, str],
+            agent_action: AgentAction,
+            run_manager: Optional[CallbackManagerForChainRun] = None,
+        ) -> AgentStep:
+            perform = super()._perform_agent_action
+
+            def run() -> Any:
+                return perform(
+                    name_to_tool_map, color_mapping, agent_action, run_manager
+                ).observation
+
+            # Carry context variables such as the usage stage into the worker
+            future = _tool_executor.submit(contextvars.copy_context().run, run)
+            return AgentStep(action=agent_action, observation=future)
+
+    _concurrent_agent_executor = ConcurrentAgentExecutor
+    return ConcurrentAgentExecutor
+
+
+def _get_agent_executor(
+    model: str,
+    tools: List[BaseTool],
+    system_prompt: str,
+    max_tokens: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> "AgentExecutor":
+    """Build, or reuse, the agent executor for this model, tool set and prompt.
+
+    Executors carry no memory; chat history is passed in on every invoke, so one
+    executor can serve repeated calls such as extraction retries.
+    """
+    key = (model, tuple(id(tool) for tool in tools), system_prompt, max_tokens, timeout)
+    with _clients_lock:
+        executor = _agent_executors.get(key)
+        if executor is not None:
+            _agent_executors.move_to_end(key)
+            return executor
+
+    from langchain.agents import create_openai_tools_agent
+    from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
+
+    llm = cast(BaseLanguageModel[Any], get_chat_model(model, max_tokens, timeout))
+
+    # Create prompt template; the system prompt is not a template itself
+    prompt = ChatPromptTemplate.from_messages(  # type: ignore[attr-defined]
+        [
+            SystemMessage(content=system_prompt),
+            MessagesPlaceholder(variable_name="chat_history"),
+            ("human", "{input}"),
+            MessagesPlaceholder(variable_name="agent_scratchpad"),
+        ]
+    )
+
+    # Create agent
+    runnable = create_openai_tools_agent(llm, tools, prompt)  # type: ignore[return-value,assignment] # langchain type stubs don't fully resolve generic types
+
+    # Create agent executor
+    executor = _concurrent_agent_executor_class()(
+        agent=runnable,
+        tools=tools,
+        handle_parsing_errors=True,
+        max_iterations=AGENT_MAX_ITERATIONS,  # Prevent infinite loops
+        max_execution_time=AGENT_MAX_EXECUTION_TIME,
+        return_intermediate_steps=True,  # Return steps for error analysis
+    )
+
+    with _clients_lock:
+        _agent_executors[key] = executor
+        while len(_agent_executors) > AGENT_CACHE_SIZE:
+            _agent_executors.popitem(last=False)
+    return executor
+
+
+def set_max_concurrency(limit: int) -> None:
+    """Set how many ai_async() requests may run at the same time."""
+    global _max_concurrency
+    if limit < 1:
+        raise ValueError("Concurrency limit must be at least 1")
+    _max_concurrency = limit
+    _semaphores.clear()
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(_max_concurrency)
+        _semaphores[loop] = semaphore
+    return semaphore
+
+
+def _resolve_call_site(
+    model: Optional[str],
+    call_site: Optional[str],
+    response_schema: Optional[Dict[str, Any]] = None,
+) -> Tuple[str, Dict[str, Any]]:
+    """Pick the model and request limits for a call.
+
+    An explicit model wins over the one configured for the call site in
+    project.yml, which wins over DEFAULT_MODEL. The call site's fallback
+    models only apply when the model was not given explicitly.
+    """
+    site = CallSiteSettings()
+    if call_site is not None:
+        try:
+            site = settings().call_sites.get(call_site, site)
+        except (FileNotFoundError, ValueError):
+            # No (valid) project: nothing configured for any call site
+            pass
+
+    options: Dict[str, Any] = {}
+    if site.max_tokens is not None:
+        options["max_tokens"] = site.max_tokens
+    if site.timeout is not None:
+        options["timeout"] = site.timeout
+    if response_schema is not None:
+        options["response_schema"] = response_schema
+    if model is None and site.fallbacks:
+        options["fallbacks"] = site.fallbacks
+    return model or site.model or DEFAULT_MODEL, options
+
+
+def _model_chain(model: str, options: Dict[str, Any]) -> List[str]:
+    """The model followed by the call site's fallbacks, in the order to try them."""
+    fallbacks = cast(List[str], options.get("fallbacks", []))
+    return [model] + [m for m in fallbacks if m != model]
+
+
+def _request_timeout(options: Dict[str, Any]) -> Any:
+    """The call site's timeout, capped at the time left before the deadline."""
+    timeout = bounded_timeout(options.get("timeout"))
+    return NOT_GIVEN if timeout is None else timeout
+
+
+def _ai_cache_key(
+    model: str, system_prompt: str, user_prompt: str, options: Dict[str, Any]
+) -> str:
+    # Options that change the answer are part of the key
+    parts = [
+        options[name] for name in ("max_tokens", "response_schema") if name in options
+    ]
+    return cache_key("ai", model, system_prompt, user_prompt, *parts)
+
+
+def _message_content(model: str, prompt: str) -> Any:
+    """Plain text, or text blocks with a cache-control marker after the stable prefix."""
+    if not isinstance(prompt, CacheablePrompt) or not model.startswith(
+        CACHE_CONTROL_MODEL_PREFIXES
+    ):
+        return str(prompt)
+    if prompt.static_length < MIN_CACHEABLE_PREFIX_CHARS:
+        return str(prompt)
+
+    blocks: List[Dict[str, Any]] = [
+        {
+            "type": "text",
+            "text": prompt.static_prefix,
+            "cache_control": {"type": "ephemeral"},
+        }
+    ]
+    if prompt.volatile_suffix:
+        blocks.append({"type": "text", "text": prompt.volatile_suffix})
+    return blocks
+
+
+def _chat_messages(
+    model: str, system_prompt: str, user_prompt: str, options: Dict[str, Any]
+) -> Any:
+    schema = options.get("response_schema")
+    if schema is not None and _response_format(model, options) is NOT_GIVEN:
+        # No structured outputs: ask for the schema and validate locally
+        user_prompt += SCHEMA_INSTRUCTION + json.dumps(schema)
+    return [
+        {"role": "system", "content": _message_content(model, system_prompt)},
+        {"role": "user", "content": _message_content(model, user_prompt)},
+    ]
+
+
+def _response_format(model: str, options: Dict[str, Any]) -> Any:
+    """The provider's json_schema response format, where the model supports it."""
+    schema = options.get("response_schema")
+    if schema is None or not model.startswith(STRUCTURED_OUTPUT_MODEL_PREFIXES):
+        return NOT_GIVEN
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": "response", "strict": True, "schema": schema},
+    }
+
+
+def _plain_reply_value(result: str, schema: Dict[str, Any]) -> Optional[Any]:
+    """A plain-text reply as the object of a single-string schema, if it matches.
+
+    Models without structured outputs often answer in the format of the
+    prompt's examples (a bare "YES") rather than as JSON; such a reply is
+    accepted when it satisfies the only property's own pattern.
+    """
+    properties = cast(Dict[str, Any], schema.get("properties", {}))
+    if schema.get("type") != "object" or len(properties) != 1:
+        return None
+    name, prop = next(iter(properties.items()))
+    if prop.get("type") != "string" or "pattern" not in prop:
+        return None
+    value = {name: result.strip()}
+    return value if not schema_errors(value, schema) else None
+
+
+def _conform_to_schema(result: Optional[str], options: Dict[str, Any]) -> Optional[str]:
+    """Return the reply as compact JSON if it matches the requested schema, else None."""
+    schema = options.get("response_schema")
+    if schema is None or result is None:
+        return result
+    value = parse_json_reply(result)
+    if value is None:
+        value = _plain_reply_value(result, schema)
+    errors = ["not valid JSON"] if value is None else schema_errors(value, schema)
+    if errors:
+        log_info(f"Reply does not match the response schema: {'; '.join(errors)}")
+        return None
+    return json.dumps(value, ensure_ascii=False)
+
+
+def chat_request_body(
+    system_prompt: str,
+    user_prompt: str,
+    model: Optional[str] = None,
+    call_site: Optional[str] = None,
+    response_schema: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """The chat completion request ai() would send, for use in batch files."""
+    model, options = _resolve_call_site(model, call_site, response_schema)
+    body: Dict[str, Any] = {
+        "model": model,
+        "messages": _chat_messages(model, system_prompt, user_prompt, options),
+    }
+    response_format = _response_format(model, options)
+    if response_format is not NOT_GIVEN:
+        body["response_format"] = response_format
+    if "max_tokens" in options:
+        body["max_tokens"] = options["max_tokens"]
+    return body
 
 
 @memoise_for_tests
 def ai(
-    system_prompt: str, user_prompt: str, model: Optional[str] = None
+    system_prompt: str,
+    user_prompt: str,
+    model: Optional[str] = None,
+    call_site: Optional[str] = None,
+    response_schema: Optional[Dict[str, Any]] = None,
 ) -> Optional[str]:
     log_enter("ai")
-    if model is None:
-        model = DEFAULT_MODEL
+    model, options = _resolve_call_site(model, call_site, response_schema)
     log_trace("Model", model)
-    client = get_client()
     log_llm_system(system_prompt)
     log_llm_operator(user_prompt)
-    response = client.chat.completions.create(
-        model=model,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
-    )
-    result = response.choices[0].message.content
+
+    cache = get_response_cache()
+    key = _ai_cache_key(model, system_prompt, user_prompt, options)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            log_llm_ai(cached)
+            log_exit("ai")
+            return cached
+
+    def request(chosen: str) -> Optional[str]:
+        response = get_client().chat.completions.create(
+            model=chosen,
+            messages=_chat_messages(chosen, system_prompt, user_prompt, options),
+            response_format=_response_format(chosen, options),
+            max_tokens=options.get("max_tokens", NOT_GIVEN),
+            timeout=_request_timeout(options),
+        )
+        return response.choices[0].message.content
+
+    def attempt(chosen: str) -> Optional[str]:
+        hedging = get_hedging_policy(call_site)
+        if hedging is None:
+            return request(chosen)
+        return hedging.call(chosen, lambda: request(chosen))
+
+    def complete() -> Optional[str]:
+        # Answers from a fallback model are cached under the requested one
+        result = get_model_router().call(_model_chain(model, options), attempt)
+        result = _conform_to_schema(result, options)
+        if result and cache is not None:
+            cache.put(key, result)
+        return result
+
+    # Concurrent identical requests share one call
+    with raise_on_deadline():
+        result = _in_flight.do(key, complete)
     if result:
         log_llm_ai(result)
     log_exit("ai")
     return result
 
 
+@memoise_for_tests
+def ai_stream(
+    system_prompt: str,
+    user_prompt: str,
+    model: Optional[str] = None,
+    call_site: Optional[str] = None,
+    response_schema: Optional[Dict[str, Any]] = None,
+    use_cache: bool = True,
+) -> Iterator[str]:
+    """Streaming counterpart of ai(): yield the response text as it arrives.
+
+    Only replies that match response_schema are cached, since a stream is
+    yielded before it can be checked. use_cache=False skips the cache
+    lookup, so a retry after a broken reply gets a fresh one.
+    """
+    log_enter("ai_stream")
+    model, options = _resolve_call_site(model, call_site, response_schema)
+    log_trace("Model", model)
+    log_llm_system(system_prompt)
+    log_llm_operator(user_prompt)
+
+    try:
+        cache = get_response_cache()
+        key = _ai_cache_key(model, system_prompt, user_prompt, options)
+        if cache is not None and use_cache:
+            cached = cache.get(key)
+            if cached is not None:
+                log_llm_ai(cached)
+                yield cached
+                return
+
+        def open_stream(chosen: str) -> Any:
+            return get_client().chat.completions.create(
+                model=chosen,
+                messages=_chat_messages(chosen, system_prompt, user_prompt, options),
+                response_format=_response_format(chosen, options),
+                max_tokens=options.get("max_tokens", NOT_GIVEN),
+                timeout=_request_timeout(options),
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+
+        parts: List[str] = []
+        with raise_on_deadline():
+            # Falls back only while opening the stream, never halfway through it
+            stream = get_model_router().call(_model_chain(model, options), open_stream)
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield delta
+
+        result = "".join(parts)
+        if result:
+            log_llm_ai(result)
+            # A truncated or malformed reply would be replayed on every retry
+            if cache is not None and _conform_to_schema(result, options):
+                cache.put(key, result)
+    finally:
+        log_exit("ai_stream")
+
+
+@memoise_for_tests
+async def ai_async(
+    system_prompt: str,
+    user_prompt: str,
+    model: Optional[str] = None,
+    call_site: Optional[str] = None,
+    response_schema: Optional[Dict[str, Any]] = None,
+) -> Optional[str]:
+    """Async counterpart of ai(), limited to AI_MAX_CONCURRENCY requests in flight."""
+    model, options = _resolve_call_site(model, call_site, response_schema)
+
+    cache = get_response_cache()
+    key = _ai_cache_key(model, system_prompt, user_prompt, options)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    async def request(chosen: str) -> Optional[str]:
+        response = await get_async_client().chat.completions.create(
+            model=chosen,
+            messages=_chat_messages(chosen, system_prompt, user_prompt, options),
+            response_format=_response_format(chosen, options),
+            max_tokens=options.get("max_tokens", NOT_GIVEN),
+            timeout=_request_timeout(options),
+        )
+        return response.choices[0].message.content
+
+    async def attempt(chosen: str) -> Optional[str]:
+        hedging = get_hedging_policy(call_site)
+        if hedging is None:
+            return await request(chosen)
+        return await hedging.call_async(chosen, lambda: request(chosen))
+
+    async def complete() -> Optional[str]:
+        # A hedge shares its original's concurrency slot
+        async with _get_semaphore():
+            log_enter("ai_async")
+            log_trace("Model", model)
+            log_llm_system(system_prompt)
+            log_llm_operator(user_prompt)
+            try:
+                result = await get_model_router().call_async(
+                    _model_chain(model, options), attempt
+                )
+            finally:
+                log_exit("ai_async")
+        result = _conform_to_schema(result, options)
+        if result:
+            log_llm_ai(result)
+            if cache is not None:
+                cache.put(key, result)
+        return result
+
+    # Duplicates wait on the first request without taking a concurrency slot
+    with raise_on_deadline():
+        return await _in_flight_async.do(key, complete)
+
+
 @memoise_for_tests
 def agent(
     system_prompt: str,
     user_query: str,
     tools: List[BaseTool],
     previous_chat_history: Optional[List[BaseMessage]] = None,
-    model: str = DEFAULT_MODEL,
+    model: Optional[str] = None,
+    call_site: Optional[str] = None,
+    engine: Optional[str] = None,
+    use_cache: bool = True,
 ) -> Tuple[str, List[BaseMessage]]:
+    """Run an agent with tools and return its output and the updated chat history.
+
+    use_cache=False skips the response cache lookup, so a retry of the same
+    request gets a fresh run; the new result still replaces the cached one.
+    """
     log_enter("agent")
     previous_chat_history = previous_chat_history or []
+    model, options = _resolve_call_site(model, call_site)
+    engine = _resolve_agent_engine(engine)
 
     log_llm_system(system_prompt)
     log_llm_operator(user_query)
     log_trace("Model", model)
+    log_trace("Engine", engine)
 
-    # Create LLM
-    # Set environment variables for OpenAI configuration
-    os.environ["OPENAI_API_KEY"] = os.getenv("OPENROUTER_API_KEY", "")
-    os.environ["OPENAI_API_BASE"] = "https://openrouter.ai/api/v1"
-
-    llm = cast(
-        BaseLanguageModel[Any],
-        ChatOpenAI(
-            model=model,
-            temperature=0,
-        ),
+    cache = get_response_cache()
+    key = _agent_cache_key(
+        model, system_prompt, user_query, tools, previous_chat_history, options, engine
     )
+    if cache is not None and use_cache:
+        cached = cache.get(key)
+        if cached is not None:
+            output, chat_history = _replay_cached_agent_run(cached, tools)
+            log_llm_ai(output)
+            log_exit("agent")
+            return output, chat_history
 
-    # Create prompt template
-    prompt = ChatPromptTemplate.from_messages(  # type: ignore[attr-defined]
-        [
-            ("system", system_prompt),
-            MessagesPlaceholder(variable_name="chat_history"),
-            ("human", "{input}"),
-            MessagesPlaceholder(variable_name="agent_scratchpad"),
-        ]
-    )
+    # Run the agent with error handling
+    try:
+        if engine == "native":
+            output, tool_calls = _run_native_agent(
+                model, system_prompt, user_query, tools, previous_chat_history, options
+            )
+        else:
 
-    # Create memory
-    memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
-    for msg in previous_chat_history:
-        memory.chat_memory.add_message(msg)
+            def run_executor(chosen: str) -> Dict[str, Any]:
+                agent_executor = _get_agent_executor(
+                    chosen,
+                    tools,
+                    system_prompt,
+                    options.get("max_tokens"),
+                    options.get("timeout"),
+                )
+                # Enable LangChain verbose logging at trace level
+                agent_executor.verbose = get_log_level() == LogLevel.TRACE
+                return _bounded_executor(agent_executor).invoke(
+                    {"input": user_query, "chat_history": previous_chat_history}
+                )
 
-    # Create agent
-    agent = create_openai_tools_agent(llm, tools, prompt)  # type: ignore[return-value,assignment] # langchain type stubs don't fully resolve generic types
+            # A failed run is repeated on the next model of the chain
+            response = get_model_router().call(
+                _model_chain(model, options), run_executor, timed=False
+            )
+            output, tool_calls = _executor_result(response)
+        output, chat_history = _finish_agent_run(
+            cache, key, user_query, previous_chat_history, output, tool_calls
+        )
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        output, chat_history = _agent_failure(e, previous_chat_history)
 
-    # Create agent executor
-    agent_executor = AgentExecutor(
-        agent=agent,
-        tools=tools,
-        memory=memory,
-        verbose=get_log_level()
-        == LogLevel.TRACE,  # Enable LangChain verbose logging at trace level
-        handle_parsing_errors=True,
-        max_iterations=10,  # Limit iterations to prevent infinite loops
-        max_execution_time=300,  # 5 minutes max execution time
-        return_intermediate_steps=True,  # Return steps for error analysis
+    log_exit("agent")
+    return output, chat_history
+
+
+@memoise_for_tests
+async def agent_async(
+    system_prompt: str,
+    user_query: str,
+    tools: List[BaseTool],
+    previous_chat_history: Optional[List[BaseMessage]] = None,
+    model: Optional[str] = None,
+    call_site: Optional[str] = None,
+    engine: Optional[str] = None,
+    use_cache: bool = True,
+) -> Tuple[str, List[BaseMessage]]:
+    """Async variant of agent(); tools run through their async interface.
+
+    See agent() for use_cache.
+    """
+    log_enter("agent_async")
+    previous_chat_history = previous_chat_history or []
+    model, options = _resolve_call_site(model, call_site)
+    engine = _resolve_agent_engine(engine)
+
+    log_llm_system(system_prompt)
+    log_llm_operator(user_query)
+    log_trace("Model", model)
+    log_trace("Engine", engine)
+
+    cache = get_response_cache()
+    key = _agent_cache_key(
+        model, system_prompt, user_query, tools, previous_chat_history, options, engine
     )
+    if cache is not None and use_cache:
+        cached = cache.get(key)
+        if cached is not None:
+            output, chat_history = _replay_cached_agent_run(cached, tools)
+            log_llm_ai(output)
+            log_exit("agent_async")
+            return output, chat_history
 
-    # Run the agent with error handling
     try:
-        response = agent_executor.invoke({"input": user_query})
+        if engine == "native":
+            output, tool_calls = await _arun_native_agent(
+                model, system_prompt, user_query, tools, previous_chat_history, options
+            )
+        else:
 
-        # Get the output
-        output = response["output"]
-        log_llm_ai(output)
-
-        # Get updated chat history
-        chat_history = memory.chat_memory.messages
+            async def run_executor(chosen: str) -> Dict[str, Any]:
+                agent_executor = _get_agent_executor(
+                    chosen,
+                    tools,
+                    system_prompt,
+                    options.get("max_tokens"),
+                    options.get("timeout"),
+                )
+                agent_executor.verbose = get_log_level() == LogLevel.TRACE
+                return await _bounded_executor(agent_executor).ainvoke(
+                    {"input": user_query, "chat_history": previous_chat_history}
+                )
 
+            response = await get_model_router().call_async(
+                _model_chain(model, options), run_executor, timed=False
+            )
+            output, tool_calls = _executor_result(response)
+        output, chat_history = _finish_agent_run(
+            cache, key, user_query, previous_chat_history, output, tool_calls
+        )
+    except DeadlineExceeded:
+        raise
     except Exception as e:
-        error_msg = f"Agent execution failed: {str(e)}"
-        log_error(error_msg)
-        # Return error message to user instead of crashing
-        output = f"I encountered an error while processing your request: {str(e)}. Please try rephrasing your request or check if all required information is provided."
-        chat_history = memory.chat_memory.messages
+        output, chat_history = _agent_failure(e, previous_chat_history)
 
-    log_exit("agent")
+    log_exit("agent_async")
+    return output, chat_history
+
+
+def _resolve_agent_engine(engine: Optional[str]) -> str:
+    engine = engine or DEFAULT_AGENT_ENGINE
+    if engine not in AGENT_ENGINES:
+        raise ValueError(
+            f"Unknown agent engine '{engine}', expected one of {list(AGENT_ENGINES)}"
+        )
+    return engine
+
+
+def _agent_cache_key(
+    model: str,
+    system_prompt: str,
+    user_query: str,
+    tools: List[BaseTool],
+    previous_chat_history: List[BaseMessage],
+    options: Dict[str, Any],
+    engine: str,
+) -> str:
+    # LangChain runs keep their original keys; other engines are cached apart
+    return cache_key(
+        "agent",
+        model,
+        system_prompt,
+        user_query,
+        [(tool.name, tool.description) for tool in tools],
+        messages_to_dict(previous_chat_history),
+        *([options["max_tokens"]] if "max_tokens" in options else []),
+        *([engine] if engine != "langchain" else []),
+    )
+
+
+def _bounded_executor(executor: "AgentExecutor") -> "AgentExecutor":
+    """The executor with its time limit cut to what is left of the deadline."""
+    limit = bounded_timeout(AGENT_MAX_EXECUTION_TIME)
+    if limit == executor.max_execution_time:
+        return executor
+    return executor.model_copy(update={"max_execution_time": limit})
+
+
+def _executor_result(response: Dict[str, Any]) -> Tuple[str, List[List[Any]]]:
+    """Output and [tool, input] pairs of an AgentExecutor run."""
+    steps = cast(List[Tuple[AgentAction, Any]], response["intermediate_steps"])
+    tool_calls: List[List[Any]] = [
+        [action.tool, action.tool_input]  # type: ignore[reportUnknownMemberType] # LangChain type stubs are incomplete
+        for action, _ in steps
+    ]
+    return response["output"], tool_calls
+
+
+def _finish_agent_run(
+    cache: Optional[Any],
+    key: str,
+    user_query: str,
+    previous_chat_history: List[BaseMessage],
+    output: str,
+    tool_calls: List[List[Any]],
+) -> Tuple[str, List[BaseMessage]]:
+    log_llm_ai(output)
+
+    # Get updated chat history
+    chat_history = previous_chat_history + [
+        HumanMessage(content=user_query),
+        AIMessage(content=output),
+    ]
+
+    # A stopped run is worth repeating rather than replaying
+    if cache is not None and output != AGENT_STOPPED_OUTPUT:
+        cache.put(
+            key,
+            {
+                "output": output,
+                "chat_history": messages_to_dict(chat_history),
+                "tool_calls": tool_calls,
+            },
+        )
     return output, chat_history
 
 
+def _agent_failure(
+    error: Exception, previous_chat_history: List[BaseMessage]
+) -> Tuple[str, List[BaseMessage]]:
+    # Out of time: stop the whole command instead of letting it retry
+    check_deadline()
+
+    error_msg = f"Agent execution failed: {str(error)}"
+    log_error(error_msg)
+    # Return error message to user instead of crashing
+    output = f"I encountered an error while processing your request: {str(error)}. Please try rephrasing your request or check if all required information is provided."
+    return output, list(previous_chat_history)
+
+
+def _native_agent_messages(
+    model: str,
+    system_prompt: str,
+    user_query: str,
+    previous_chat_history: List[BaseMessage],
+) -> List[Dict[str, Any]]:
+    """The conversation in the OpenAI format, laid out like the LangChain prompt."""
+    roles = {"human": "user", "ai": "assistant", "system": "system"}
+    messages: List[Dict[str, Any]] = [
+        {"role": "system", "content": _message_content(model, system_prompt)}
+    ]
+    for message in previous_chat_history:
+        messages.append(
+            {
+                "role": roles.get(message.type, "user"),
+                "content": message.content,  # type: ignore[reportUnknownMemberType] # LangChain type stubs are incomplete
+            }
+        )
+    messages.append({"role": "user", "content": _message_content(model, user_query)})
+    return messages
+
+
+def _native_tool_specs(tools: List[BaseTool]) -> List[Dict[str, Any]]:
+    return [convert_to_openai_tool(tool) for tool in tools]
+
+
+def _assistant_tool_message(message: Any) -> Dict[str, Any]:
+    return {
+        "role": "assistant",
+        "content": message.content,
+        "tool_calls": [
+            {
+                "id": call.id,
+                "type": "function",
+                "function": {
+                    "name": call.function.name,
+                    "arguments": call.function.arguments,
+                },
+            }
+            for call in message.tool_calls
+        ],
+    }
+
+
+def _parse_tool_call(
+    tools_by_name: Dict[str, BaseTool], name: str, arguments: str
+) -> Tuple[Any, Optional[str]]:
+    """The tool input of a call, and the observation to use instead of running it."""
+    if name not in tools_by_name:
+        available = ", ".join(tools_by_name)
+        return arguments, f"{name} is not a valid tool, try one of [{available}]."
+    try:
+        tool_input = json.loads(arguments or "{}")
+    except ValueError as e:
+        return arguments, f"Could not parse arguments of {name} as JSON: {e}"
+    if not isinstance(tool_input, dict):
+        # LangChain passes non-object arguments as a single positional input
+        tool_input = {"__arg1": tool_input}
+    return tool_input, None
+
+
+def _run_native_tool(
+    tools_by_name: Dict[str, BaseTool], name: str, arguments: str
+) -> Tuple[Any, str]:
+    tool_input, observation = _parse_tool_call(tools_by_name, name, arguments)
+    if observation is None:
+        observation = str(tools_by_name[name].run(tool_input))
+    return tool_input, observation
+
+
+async def _arun_native_tool(
+    tools_by_name: Dict[str, BaseTool], name: str, arguments: str
+) -> Tuple[Any, str]:
+    tool_input, observation = _parse_tool_call(tools_by_name, name, arguments)
+    if observation is None:
+        tool = tools_by_name[name]
+        observation = str(await tool.arun(tool_input))  # type: ignore[reportUnknownMemberType] # LangChain type stubs are incomplete
+    return tool_input, observation
+
+
+def _run_native_agent(
+    model: str,
+    system_prompt: str,
+    user_query: str,
+    tools: List[BaseTool],
+    previous_chat_history: List[BaseMessage],
+    options: Dict[str, Any],
+) -> Tuple[str, List[List[Any]]]:
+    """Tool-calling loop on the OpenAI client, with the AgentExecutor limits.
+
+    Each step goes to the first healthy model of the call site's fallback
+    chain. Returns the final answer and the [tool, input] pairs that were run.
+    """
+    client = get_client()
+    router = get_model_router()
+    chain = _model_chain(model, options)
+    tools_by_name = {tool.name: tool for tool in tools}
+    specs = _native_tool_specs(tools)
+    messages = _native_agent_messages(
+        model, system_prompt, user_query, previous_chat_history
+    )
+    tool_calls: List[List[Any]] = []
+    limit = cast(float, bounded_timeout(AGENT_MAX_EXECUTION_TIME))
+    deadline = time.monotonic() + limit
+
+    for _ in range(AGENT_MAX_ITERATIONS):
+        if time.monotonic() > deadline:
+            break
+        response = router.call(
+            chain,
+            lambda chosen: client.chat.completions.create(
+                model=chosen,
+                messages=cast(Any, messages),
+                tools=cast(Any, specs),
+                temperature=0,
+                max_tokens=options.get("max_tokens", NOT_GIVEN),
+                timeout=_request_timeout(options),
+            ),
+        )
+        message = response.choices[0].message
+        if not message.tool_calls:
+            return message.content or "", tool_calls
+
+        messages.append(_assistant_tool_message(message))
+        calls = [
+            (c.id, c.function.name, c.function.arguments)
+            for c in cast(Any, message.tool_calls)
+        ]
+        # Tool calls of one step run concurrently, like ConcurrentAgentExecutor
+        futures = [
+            _tool_executor.submit(
+                contextvars.copy_context().run,
+                _run_native_tool,
+                tools_by_name,
+                name,
+                arguments,
+            )
+            for _, name, arguments in calls
+        ]
+        for (call_id, name, _), future in zip(calls, futures):
+            tool_input, observation = future.result()
+            tool_calls.append([name, tool_input])
+            messages.append(
+                {"role": "tool", "tool_call_id": call_id, "content": observation}
+            )
+
+    return AGENT_STOPPED_OUTPUT, tool_calls
+
+
+async def _arun_native_agent(
+    model: str,
+    system_prompt: str,
+    user_query: str,
+    tools: List[BaseTool],
+    previous_chat_history: List[BaseMessage],
+    options: Dict[str, Any],
+) -> Tuple[str, List[List[Any]]]:
+    """Async variant of _run_native_agent()."""
+    client = get_async_client()
+    router = get_model_router()
+    chain = _model_chain(model, options)
+    tools_by_name = {tool.name: tool for tool in tools}
+    specs = _native_tool_specs(tools)
+    messages = _native_agent_messages(
+        model, system_prompt, user_query, previous_chat_history
+    )
+    tool_calls: List[List[Any]] = []
+    limit = cast(float, bounded_timeout(AGENT_MAX_EXECUTION_TIME))
+    deadline = time.monotonic() + limit
+
+    for _ in range(AGENT_MAX_ITERATIONS):
+        if time.monotonic() > deadline:
+            break
+        async with _get_semaphore():
+            response = await router.call_async(
+                chain,
+                lambda chosen: client.chat.completions.create(
+                    model=chosen,
+                    messages=cast(Any, messages),
+                    tools=cast(Any, specs),
+                    temperature=0,
+                    max_tokens=options.get("max_tokens", NOT_GIVEN),
+                    timeout=_request_timeout(options),
+                ),
+            )
+        message = response.choices[0].message
+        if not message.tool_calls:
+            return message.content or "", tool_calls
+
+        messages.append(_assistant_tool_message(message))
+        calls = [
+            (c.id, c.function.name, c.function.arguments)
+            for c in cast(Any, message.tool_calls)
+        ]
+        results = await asyncio.gather(
+            *(_arun_native_tool(tools_by_name, name, args) for _, name, args in calls)
+        )
+        for (call_id, name, _), (tool_input, observation) in zip(calls, results):
+            tool_calls.append([name, tool_input])
+            messages.append(
+                {"role": "tool", "tool_call_id": call_id, "content": observation}
+            )
+
+    return AGENT_STOPPED_OUTPUT, tool_calls
+
+
+def _replay_cached_agent_run(
+    cached: Dict[str, Any], tools: List[BaseTool]
+) -> Tuple[str, List[BaseMessage]]:
+    """Re-run the tool calls of a cached agent run so their side effects happen again."""
+    tools_by_name = {tool.name: tool for tool in tools}
+    for tool_name, tool_input in cached["tool_calls"]:
+        tool = tools_by_name.get(tool_name)
+        if tool is None:
+            continue
+        try:
+            tool.run(tool_input)
+        except Exception as e:
+            log_error(f"Replaying cached tool call {tool_name} failed: {e}")
+    return cached["output"], messages_from_dict(cached["chat_history"])
+
+
+def _yesno_answer(response: str) -> str:
+    """The answer line of a yesno reply, structured or plain text."""
+    parsed = parse_json_reply(response)
+    if isinstance(parsed, dict) and "answer" in parsed:
+        return str(cast(Dict[str, Any], parsed)["answer"]).strip()
+    return response.strip()
+
+
 def yesno(
     user_prompt: str,
     model: Optional[str] = None,
     max_retries: int = 3,
     system_context: Optional[Context] = None,
+    call_site: Optional[str] = None,
 ) -> Tuple[bool, str]:
     log_enter("yesno")
 
@@ -174,10 +1227,11 @@ def yesno(
     # Always add YES/NO instructions
     context = context.add(
         "Instructions",
-        "You are a judge that answers YES or NO questions. Your response must be exactly one of these formats:\n"
+        "You are a judge that answers YES or NO questions. Your answer must be exactly one of these formats:\n"
         "- YES (if the answer is yes)\n"
         "- NO, <brief reason> (if the answer is no)\n\n"
-        "Do not add any prefixes, explanations, or additional text. Respond with a single line only.",
+        "Do not add any prefixes, explanations, or additional text. Respond with a single line only. "
+        "When a JSON response is required, put that line in its answer field.",
     )
 
     # Check if context already has examples
@@ -208,12 +1262,18 @@ def yesno(
 
     for attempt in range(max_retries):
         log_trace("Attempt", str(attempt + 1))
-        response = ai(system_prompt, user_prompt, model)
+        response = ai(
+            system_prompt,
+            user_prompt,
+            model,
+            call_site=call_site,
+            response_schema=YESNO_SCHEMA,
+        )
 
         if response is None:
             continue
 
-        response = response.strip()
+        response = _yesno_answer(response)
 
         if response == "YES":
             log_exit("yesno")
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+from helpers.settings import settings
+from tracing import log_trace
+
+# Directory (relative to the project) holding local state such as the cache
+PROJECT_STATE_DIR = ".fantranslate"
+CACHE_FILENAME = "cache.sqlite3"
+
+# Monotonic use counter for LRU ordering (timestamps can tie)
+_NEXT_USE = "(SELECT COALESCE(MAX(last_used), 0) + 1 FROM responses)"
+
+_cache: Optional["ResponseCache"] = None
+_disabled = False
+
+
+class ResponseCache:
+    """SQLite-backed cache of LLM responses with TTL, LRU and size limits."""
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = 10000,
+        max_bytes: int = 100 * 1024 * 1024,
+        ttl_seconds: float = 30 * 24 * 60 * 60,
+    ) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_used INTEGER NOT NULL
+            )""")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for key, or None if missing or expired."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            value, created_at = row
+            if now - created_at >= self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+
+            self._conn.execute(
+                f"UPDATE responses SET last_used = {_NEXT_USE} WHERE key = ?", (key,)
+            )
+            self._conn.commit()
+        log_trace("Response cache hit", key)
+        return json.loads(value)
+
+    def put(self, key: str, value: Any) -> None:
+        """Store a JSON-serializable value and evict entries over the limits."""
+        encoded = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, {_NEXT_USE})",
+                (key, encoded, len(encoded.encode()), now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def _evict(self) -> None:
+        # Expired entries first, then least recently used beyond the entry limit
+        self._conn.execute(
+            "DELETE FROM responses WHERE created_at <= ?",
+            (time.time() - self.ttl_seconds,),
+        )
+        self._conn.execute(
+            """DELETE FROM responses WHERE key IN (
+                SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?
+            )""",
+            (self.max_entries,),
+        )
+        # Then least recently used until the total size fits
+        self._conn.execute(
+            """DELETE FROM responses WHERE key IN (
+                SELECT key FROM (
+                    SELECT key, SUM(size) OVER (
+                        ORDER BY last_used DESC
+                    ) AS running_size FROM responses
+                ) WHERE running_size > ?
+            )""",
+            (self.max_bytes,),
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def cache_key(*parts: Any) -> str:
+    """Hash the model, prompts and other request inputs into a cache key."""
+    encoded = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def disable_response_cache() -> None:
+    """Bypass the response cache for this process (the --no-cache flag)."""
+    global _disabled
+    _disabled = True
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Return the project's response cache if it is enabled in project.yml."""
+    global _cache
+    if _disabled:
+        return None
+
+    try:
+        cache_settings = settings().cache
+    except (FileNotFoundError, ValueError):
+        # No (valid) project: nothing to opt in with
+        return None
+    if not cache_settings.enabled:
+        return None
+
+    path = os.path.join(os.getcwd(), PROJECT_STATE_DIR, CACHE_FILENAME)
+    if _cache is None or _cache.path != path:
+        _cache = ResponseCache(
+            path,
+            max_entries=cache_settings.max_entries,
+            max_bytes=int(cache_settings.max_size_mb * 1024 * 1024),
+            ttl_seconds=cache_settings.ttl_days * 24 * 60 * 60,
+        )
+    return _cache
@@ -1,9 +1,11 @@
 import functools
 import hashlib
-import json
+import inspect
 import os
 import sys
-from typing import Any, Callable, Dict
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterator, List, Tuple, cast
 
 from langchain.schema import AIMessage  # type: ignore[reportUnusedImport]
 from langchain.schema import HumanMessage  # type: ignore[reportUnusedImport]
@@ -11,6 +13,19 @@ from langchain.schema import SystemMessage  # type: ignore[reportUnusedImport]
 from langchain.schema import BaseMessage
 from langchain.tools import BaseTool
 
+from recording_store import RecordingStore, get_recording_store
+
+# Stands in for "no recording", since None is a valid recorded result
+_MISSING = object()
+
+# Strings at least this long (chapter text, mostly) are hashed once and
+# their digest reused for every recording key they are part of
+LARGE_INPUT_CHARS = 4096
+LARGE_DIGEST_CACHE_SIZE = 128
+
+_large_digests: "OrderedDict[str, bytes]" = OrderedDict()
+_large_digests_lock = threading.Lock()
+
 
 def is_test_mode() -> bool:
     return os.getenv("PYTEST_CURRENT_TEST") is not None or "pytest" in sys.argv[0]
@@ -46,7 +61,13 @@ def _json_encoder(obj: Any) -> Any:
 
 
 def _deserialize(obj: Any) -> Any:
-    """Convert from JSON-serializable form back to objects."""
+    """Convert from JSON-serializable form back to objects.
+
+    Replayed chat histories are built eagerly, as plain lists: LangChain
+    and pydantic read list storage directly, so a list that builds its
+    messages on access looks empty to them. Building costs a few
+    microseconds per message, small next to reading the recording.
+    """
     if (
         isinstance(obj, dict)
         and "type" in obj
@@ -85,48 +106,150 @@ def _stable_repr(obj: Any) -> str:
         return str(obj)
 
 
+def _legacy_recording_key(args: Any, kwargs: Dict[str, Any]) -> str:
+    # Compute key: join all args and kwargs with :
+    key_parts = [_stable_repr(arg) for arg in args]
+    for k in sorted(kwargs.keys()):
+        key_parts.append(f"{k}={_stable_repr(kwargs[k])}")
+    key_str = ":".join(key_parts)
+    return hashlib.sha1(key_str.encode()).hexdigest()
+
+
+def _large_input_digest(text: str) -> bytes:
+    """Digest of a large string, computed once per distinct string."""
+    with _large_digests_lock:
+        digest = _large_digests.get(text)
+        if digest is not None:
+            _large_digests.move_to_end(text)
+            return digest
+    # Hash outside the lock, other keys can be computed meanwhile
+    digest = hashlib.sha1(text.encode("utf-8", "surrogatepass")).digest()
+    with _large_digests_lock:
+        _large_digests[text] = digest
+        if len(_large_digests) > LARGE_DIGEST_CACHE_SIZE:
+            _large_digests.popitem(last=False)
+    return digest
+
+
+def _feed_key(digest: Any, obj: Any) -> None:
+    """Stream obj into digest, tagged and length-prefixed so framing is unambiguous."""
+    if isinstance(obj, str):
+        if len(obj) >= LARGE_INPUT_CHARS:
+            digest.update(b"H")
+            digest.update(_large_input_digest(obj))
+        else:
+            data = obj.encode("utf-8", "surrogatepass")
+            digest.update(b"s%d:" % len(data))
+            digest.update(data)
+    elif isinstance(obj, BaseTool):
+        # The tool spec, not the object's address
+        digest.update(b"T")
+        _feed_key(digest, obj.name)
+        _feed_key(digest, obj.description)
+        _feed_key(digest, obj.args)  # type: ignore[reportUnknownMemberType]
+    elif isinstance(obj, BaseMessage):
+        digest.update(b"M")
+        _feed_key(digest, obj.__class__.__name__)
+        _feed_key(digest, obj.content)  # type: ignore[reportUnknownMemberType]
+        _feed_key(digest, obj.additional_kwargs)  # type: ignore[reportUnknownMemberType]
+    elif isinstance(obj, (list, tuple)):
+        items = cast(List[Any], obj)
+        digest.update(b"l%d:" % len(items))
+        for item in items:
+            _feed_key(digest, item)
+    elif isinstance(obj, dict):
+        mapping = cast(Dict[Any, Any], obj)
+        digest.update(b"d%d:" % len(mapping))
+        for k in sorted(mapping, key=str):
+            _feed_key(digest, str(k))
+            _feed_key(digest, mapping[k])
+    else:
+        _feed_key(digest, f"{type(obj).__name__}:{obj!r}")
+
+
+def _recording_key(args: Any, kwargs: Dict[str, Any]) -> str:
+    """Hash args and kwargs structurally, without joining them into one string."""
+    digest = hashlib.sha1(b"v2")
+    _feed_key(digest, list(args))
+    _feed_key(digest, kwargs)
+    return digest.hexdigest()
+
+
+def _lookup(
+    store: RecordingStore, args: Any, kwargs: Dict[str, Any]
+) -> Tuple[str, Any]:
+    """The recording key of a call and its recorded result, or _MISSING."""
+    key = stored_key = _recording_key(args, kwargs)
+    recorded = store.get(key, _MISSING)
+    if recorded is _MISSING and store.has_legacy:
+        # Recordings made before keys were hashed structurally
+        stored_key = _legacy_recording_key(args, kwargs)
+        recorded = store.get(stored_key, _MISSING)
+    if recorded is not _MISSING:
+        store.record_hit(key, stored_key)
+    return key, recorded
+
+
 def memoise_for_tests(func: Callable[..., Any]) -> Callable[..., Any]:
+    name = func.__name__
+
+    def store() -> RecordingStore:
+        # Resolved per call, recordings live relative to the working directory
+        return get_recording_store(name, encoder=_json_encoder)
+
+    if inspect.iscoroutinefunction(func):
+
+        @functools.wraps(func)
+        async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+            key, recorded = _lookup(store(), args, kwargs)
+            if recorded is not _MISSING:
+                return _deserialize(recorded)
+
+            if not is_test_mode():
+                return await func(*args, **kwargs)
+
+            result = await func(*args, **kwargs)
+            store().put(key, result)
+            return result
+
+        return async_wrapper
+
+    if inspect.isgeneratorfunction(func):
+
+        @functools.wraps(func)
+        def generator_wrapper(*args: Any, **kwargs: Any) -> Iterator[Any]:
+            key, recorded = _lookup(store(), args, kwargs)
+            if recorded is not _MISSING:
+                # Recorded generators are replayed item by item
+                yield from _deserialize(recorded)
+                return
+
+            if not is_test_mode():
+                yield from func(*args, **kwargs)
+                return
+
+            items: List[Any] = []
+            for item in func(*args, **kwargs):
+                items.append(item)
+                yield item
+            store().put(key, items)
+
+        return generator_wrapper
+
     @functools.wraps(func)
     def wrapper(*args: Any, **kwargs: Any) -> Any:
         # Always try to use recordings if they exist, regardless of test mode
-        # Compute key: join all args and kwargs with :
-        key_parts = [_stable_repr(arg) for arg in args]
-        for k in sorted(kwargs.keys()):
-            key_parts.append(f"{k}={_stable_repr(kwargs[k])}")
-        key_str = ":".join(key_parts)
-        key = hashlib.sha1(key_str.encode()).hexdigest()
-
-        filename = f".ai_recordings/{func.__name__}.json"
-        os.makedirs(os.path.dirname(filename), exist_ok=True)
-
-        data: Dict[str, Any] = {}
-        if os.path.exists(filename):
-            try:
-                with open(filename, "r") as f:
-                    data = json.load(f)
-            except (json.JSONDecodeError, ValueError):
-                # If file is corrupted, fall back to normal execution
-                pass
-
-        if key in data:
-            stored_result = data[key]
+        key, recorded = _lookup(store(), args, kwargs)
+        if recorded is not _MISSING:
             # Convert back from serializable form if needed
-            return _deserialize(stored_result)
+            return _deserialize(recorded)
 
         # If no recording found, check if we're in test mode
         if not is_test_mode():
             return func(*args, **kwargs)
 
         result = func(*args, **kwargs)
-
-        try:
-            data[key] = result
-            with open(filename, "w") as f:
-                json.dump(data, f, indent=2, default=_json_encoder)
-        except (TypeError, ValueError):
-            # If result is not JSON serializable, skip caching
-            pass
-
+        store().put(key, result)
         return result
 
     return wrapper
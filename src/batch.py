@@ -0,0 +1,276 @@
+import json
+import os
+import shutil
+import time
+import uuid
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Protocol, cast
+
+from openai import OpenAI
+
+from ai_cache import PROJECT_STATE_DIR
+from deadline import bounded_timeout
+from tracing import log_error, log_info
+from usage import record_usage
+
+if TYPE_CHECKING:
+    from checkpoint import Checkpoint
+
+# Where batch input and output files are kept, relative to the project
+BATCH_DIR = os.path.join(PROJECT_STATE_DIR, "batches")
+
+# Endpoint every request line of a batch file is addressed to
+BATCH_ENDPOINT = "/v1/chat/completions"
+
+# Batch states after which polling stops
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+# Batches are finished within hours, so there is no point in polling often
+DEFAULT_POLL_INTERVAL = 60.0
+
+
+@dataclass
+class BatchRequest:
+    custom_id: str
+    body: Dict[str, Any]
+
+    def to_line(self) -> Dict[str, Any]:
+        """The request as one line of a batch input file."""
+        return {
+            "custom_id": self.custom_id,
+            "method": "POST",
+            "url": BATCH_ENDPOINT,
+            "body": self.body,
+        }
+
+
+class BatchTransport(Protocol):
+    """Submits batch input files and fetches their results."""
+
+    def submit(self, input_path: str) -> str:
+        """Submit a JSONL input file and return the batch id."""
+        ...
+
+    def status(self, batch_id: str) -> str:
+        """Return the batch status, one of TERMINAL_STATUSES once it is done."""
+        ...
+
+    def results(self, batch_id: str) -> List[Dict[str, Any]]:
+        """Return the output lines (and error lines) of a finished batch."""
+        ...
+
+
+class OpenAIBatchTransport:
+    """The OpenAI Batch API, billed at about half the interactive price."""
+
+    def __init__(self, client: OpenAI) -> None:
+        self.client = client
+
+    def submit(self, input_path: str) -> str:
+        # The Batch API takes OpenAI model names without the router prefix
+        lines = _read_jsonl(input_path)
+        for line in lines:
+            model = str(line["body"].get("model", ""))
+            if not model.startswith("openai/"):
+                # Checked before uploading anything, so no batch is billed
+                raise ValueError(
+                    f"The OpenAI Batch API only serves openai/ models, but request "
+                    f"'{line['custom_id']}' uses '{model}'; configure an openai/ "
+                    "model for field translation or use the local batch transport"
+                )
+            line["body"]["model"] = model[len("openai/") :]
+        upload_path = input_path + ".upload"
+        _write_jsonl(upload_path, lines)
+
+        with open(upload_path, "rb") as f:
+            uploaded = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window="24h",
+        )
+        return batch.id
+
+    def status(self, batch_id: str) -> str:
+        return self.client.batches.retrieve(batch_id).status
+
+    def results(self, batch_id: str) -> List[Dict[str, Any]]:
+        batch = self.client.batches.retrieve(batch_id)
+        lines: List[Dict[str, Any]] = []
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                content = self.client.files.content(file_id).text
+                lines += [json.loads(line) for line in content.splitlines() if line]
+        return lines
+
+
+class LocalBatchTransport:
+    """File-based stand-in for a batch API.
+
+    Submitting copies the input file into ``directory``. The first poll
+    answers every request with ``complete``, which takes a request body and
+    returns a chat completion, and writes the output file in the provider's
+    format.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        complete: Callable[[Dict[str, Any]], Dict[str, Any]],
+    ) -> None:
+        self.directory = directory
+        self.complete = complete
+
+    def _path(self, batch_id: str, kind: str) -> str:
+        return os.path.join(self.directory, f"{batch_id}.{kind}.jsonl")
+
+    def submit(self, input_path: str) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        batch_id = f"batch_{uuid.uuid4().hex}"
+        shutil.copyfile(input_path, self._path(batch_id, "input"))
+        return batch_id
+
+    def status(self, batch_id: str) -> str:
+        output_path = self._path(batch_id, "output")
+        if not os.path.exists(output_path):
+            output = [
+                self._answer(line)
+                for line in _read_jsonl(self._path(batch_id, "input"))
+            ]
+            _write_jsonl(output_path, output)
+        return "completed"
+
+    def results(self, batch_id: str) -> List[Dict[str, Any]]:
+        return _read_jsonl(self._path(batch_id, "output"))
+
+    def _answer(self, line: Dict[str, Any]) -> Dict[str, Any]:
+        result: Dict[str, Any] = {
+            "id": f"batch_req_{uuid.uuid4().hex}",
+            "custom_id": line["custom_id"],
+            "response": None,
+            "error": None,
+        }
+        try:
+            body = self.complete(line["body"])
+            result["response"] = {"status_code": 200, "body": body}
+        except Exception as e:
+            result["error"] = {"code": type(e).__name__, "message": str(e)}
+        return result
+
+
+def _read_jsonl(path: str) -> List[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _write_jsonl(path: str, lines: List[Dict[str, Any]]) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        for line in lines:
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+
+def write_batch_file(path: str, requests: List[BatchRequest]) -> None:
+    """Write requests as a JSONL batch input file."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    _write_jsonl(path, [request.to_line() for request in requests])
+
+
+def parse_batch_results(lines: List[Dict[str, Any]]) -> Dict[str, str]:
+    """Map custom_id to reply text for every successful line, recording usage."""
+    replies: Dict[str, str] = {}
+    for line in lines:
+        custom_id = str(line.get("custom_id"))
+        response = cast(Optional[Dict[str, Any]], line.get("response"))
+        if line.get("error") or not response or response.get("status_code") != 200:
+            log_error(f"Batch request {custom_id} failed: {line.get('error')}")
+            continue
+
+        body = cast(Dict[str, Any], response.get("body") or {})
+        usage = cast(Dict[str, Any], body.get("usage") or {})
+        if usage:
+            record_usage(
+                str(body.get("model", "")),
+                int(usage.get("prompt_tokens") or 0),
+                int(usage.get("completion_tokens") or 0),
+                0.0,
+            )
+        choices = cast(List[Dict[str, Any]], body.get("choices") or [])
+        content = choices[0].get("message", {}).get("content") if choices else None
+        if content:
+            replies[custom_id] = str(content)
+    return replies
+
+
+def run_batch(
+    transport: BatchTransport,
+    requests: List[BatchRequest],
+    directory: Optional[str] = None,
+    poll_interval: Optional[float] = None,
+    checkpoint: Optional["Checkpoint"] = None,
+) -> Dict[str, str]:
+    """Submit requests as one batch, wait for it and return custom_id -> reply.
+
+    Requests that failed are left out of the result. Polling stops at the
+    command's deadline, if there is one. With a checkpoint, the batch id is
+    journaled on submission and a resumed run waits for that batch instead
+    of paying for a new one; requests are then only needed for a new batch.
+    """
+    resuming = checkpoint is not None and checkpoint.done("batch")
+    if not requests and not resuming:
+        return {}
+    directory = directory or BATCH_DIR
+    poll_interval = DEFAULT_POLL_INTERVAL if poll_interval is None else poll_interval
+
+    if checkpoint is not None and resuming:
+        batch_id = str(checkpoint.result("batch"))
+        log_info(f"Resuming batch {batch_id}")
+    else:
+        input_path = os.path.join(
+            directory, f"input_{time.strftime('%Y%m%d_%H%M%S')}.jsonl"
+        )
+        write_batch_file(input_path, requests)
+        batch_id = transport.submit(input_path)
+        log_info(f"Submitted batch {batch_id} with {len(requests)} request(s)")
+        if checkpoint is not None:
+            checkpoint.record("batch", batch_id)
+
+    status = transport.status(batch_id)
+    while status not in TERMINAL_STATUSES:
+        log_info(f"Batch {batch_id} is {status}, checking again in {poll_interval:g}s")
+        time.sleep(cast(float, bounded_timeout(poll_interval)))
+        status = transport.status(batch_id)
+
+    if status != "completed":
+        raise RuntimeError(f"Batch {batch_id} ended with status '{status}'")
+    replies = parse_batch_results(transport.results(batch_id))
+    log_info(f"Batch {batch_id} answered {len(replies)} request(s)")
+    return replies
+
+
+def _complete_with_chat_api(body: Dict[str, Any]) -> Dict[str, Any]:
+    from ai import get_client
+
+    response = get_client().chat.completions.create(**body)
+    completion = cast(Dict[str, Any], cast(Any, response).model_dump())
+    # Already recorded by the scheduling transport, don't count it twice
+    completion.pop("usage", None)
+    return completion
+
+
+def get_batch_transport(kind: str, directory: str = BATCH_DIR) -> BatchTransport:
+    """Return the "openai" Batch API transport or the "local" file-based one.
+
+    The local transport answers requests through the regular chat endpoint,
+    which makes it usable against the mock LLM server.
+    """
+    if kind == "openai":
+        client = OpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=os.getenv("OPENAI_BATCH_BASE_URL", "https://api.openai.com/v1"),
+        )
+        return OpenAIBatchTransport(client)
+    if kind == "local":
+        return LocalBatchTransport(directory, _complete_with_chat_api)
+    raise ValueError(f"Unknown batch transport '{kind}', expected 'openai' or 'local'")
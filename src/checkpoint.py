@@ -0,0 +1,90 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, Iterator, Tuple, cast
+
+from ai_cache import PROJECT_STATE_DIR
+from tracing import log_info
+
+# Journals of interrupted runs, relative to the project
+CHECKPOINT_DIR = os.path.join(PROJECT_STATE_DIR, "checkpoints")
+
+
+class Checkpoint:
+    """Append-only journal of the units of work a long run has finished.
+
+    Every finished unit is written as one JSON line and synced to disk
+    straight away, so a crash or Ctrl-C loses at most the unit in progress.
+    A torn last line from a crash mid-write is cut off on load, so the
+    resumed run appends after the last complete line.
+    """
+
+    def __init__(self, path: str, resume: bool = False) -> None:
+        self.path = path
+        self._done: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+        if not resume:
+            self.clear()
+        elif os.path.exists(path):
+            self._load()
+            log_info(f"Resuming with {len(self._done)} finished unit(s) from {path}")
+
+    def _load(self) -> None:
+        with open(self.path, "r+b") as f:
+            complete = 0
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # Torn by a crash; the next record must not join it
+                    f.truncate(complete)
+                    break
+                complete += len(line)
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(entry, dict) and "unit" in entry:
+                    entry = cast(Dict[str, Any], entry)
+                    self._done[str(entry["unit"])] = entry.get("result")
+
+    def done(self, unit: str) -> bool:
+        with self._lock:
+            return unit in self._done
+
+    def result(self, unit: str) -> Any:
+        with self._lock:
+            return self._done.get(unit)
+
+    def results(self, prefix: str) -> Iterator[Tuple[str, Any]]:
+        """Finished units whose name starts with prefix, in the order they finished."""
+        with self._lock:
+            items = [(u, r) for u, r in self._done.items() if u.startswith(prefix)]
+        return iter(items)
+
+    def record(self, unit: str, result: Any = None) -> None:
+        """Journal unit as finished, with a JSON-serializable result."""
+        line = json.dumps({"unit": unit, "result": result}, ensure_ascii=False)
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._done[unit] = result
+
+    def clear(self) -> None:
+        """Forget all units, for a fresh run or once a run has completed."""
+        with self._lock:
+            self._done.clear()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+def checkpoint_for(command: str, input_path: str, resume: bool = False) -> Checkpoint:
+    """The journal of command run on input_path; a fresh one unless resuming."""
+    digest = hashlib.sha1(os.path.abspath(input_path).encode("utf-8")).hexdigest()
+    path = os.path.join(CHECKPOINT_DIR, f"{command}-{digest[:12]}.jsonl")
+    return Checkpoint(path, resume=resume)
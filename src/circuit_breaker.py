@@ -0,0 +1,247 @@
+import asyncio
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional, TypeVar
+
+import httpx
+import openai
+
+from deadline import DeadlineExceeded, check_deadline
+from helpers.settings import CircuitBreakerSettings, settings
+from tracing import log_info
+
+T = TypeVar("T")
+
+_router: Optional["ModelRouter"] = None
+_router_lock = threading.Lock()
+
+
+class CircuitBreaker:
+    """Stop sending requests to a model that keeps failing.
+
+    The breaker trips (opens) after ``failure_threshold`` consecutive calls
+    that failed on the provider's side (see is_provider_failure) or took
+    longer than ``slow_call_seconds``. While it is open
+    the model is skipped. After ``reset_seconds`` a single probe call is let
+    through: its success closes the breaker, its failure keeps it open for
+    another ``reset_seconds``.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        failure_threshold: int = 5,
+        slow_call_seconds: Optional[float] = None,
+        reset_seconds: float = 30,
+    ) -> None:
+        self.model = model
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.is_open = False
+        self._opened_at = 0.0
+        self._probe_started: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may go to the model now; claims the probe when open."""
+        with self._lock:
+            if not self.is_open:
+                return True
+            now = time.monotonic()
+            if now - self._opened_at < self.reset_seconds:
+                return False
+            # A probe that never reported back (e.g. cut by the deadline)
+            # must not keep the model shut forever
+            if (
+                self._probe_started is not None
+                and now - self._probe_started < self.reset_seconds
+            ):
+                return False
+            self._probe_started = now
+        log_info(f"Probing {self.model} to see if it has recovered")
+        return True
+
+    def record_success(self, seconds: Optional[float] = None) -> None:
+        """Note a successful call; seconds is its duration, if it was timed."""
+        if (
+            seconds is not None
+            and self.slow_call_seconds is not None
+            and seconds > self.slow_call_seconds
+        ):
+            self.record_failure(f"a slow call ({seconds:.1f}s)")
+            return
+        with self._lock:
+            recovered = self.is_open
+            self.failures = 0
+            self.is_open = False
+            self._probe_started = None
+        if recovered:
+            log_info(f"{self.model} has recovered, sending requests to it again")
+
+    def record_failure(self, reason: str) -> None:
+        with self._lock:
+            self.failures += 1
+            probe_failed = self._probe_started is not None
+            self._probe_started = None
+            if not (probe_failed or self.failures >= self.failure_threshold):
+                return
+            tripped = not self.is_open
+            self.is_open = True
+            self._opened_at = time.monotonic()
+        if tripped:
+            log_info(
+                f"Tripped the circuit breaker of {self.model} after "
+                f"{self.failures} failed call(s), the last one {reason}"
+            )
+
+
+def is_provider_failure(error: BaseException) -> bool:
+    """Whether error says the model is unhealthy rather than the request bad.
+
+    Transport errors, timeouts, rate limits (429) and server errors (5xx)
+    are; client errors such as 400, 401 or 404 and invalid replies are not.
+    """
+    if isinstance(
+        error,
+        (
+            httpx.TransportError,
+            openai.APIConnectionError,  # Includes APITimeoutError
+            ConnectionError,
+            TimeoutError,
+            asyncio.TimeoutError,
+        ),
+    ):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        status = error.status_code
+    elif isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+    else:
+        return False
+    return status == 429 or status >= 500
+
+
+class ModelRouter:
+    """Send each call to the first model of its fallback chain that is healthy.
+
+    Every model has its own CircuitBreaker, shared by all call sites that
+    use it. A call that fails moves on to the next model of the chain; with
+    every model tripped, the first one is still tried rather than failing
+    the call outright. Only provider failures count towards tripping.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        slow_call_seconds: Optional[float] = None,
+        reset_seconds: float = 30,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_seconds = reset_seconds
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(model)
+            if breaker is None:
+                breaker = CircuitBreaker(
+                    model,
+                    failure_threshold=self.failure_threshold,
+                    slow_call_seconds=self.slow_call_seconds,
+                    reset_seconds=self.reset_seconds,
+                )
+                self._breakers[model] = breaker
+            return breaker
+
+    def _candidates(self, models: List[str]) -> Iterator[str]:
+        tried = False
+        for model in models:
+            if self.breaker(model).allow():
+                tried = True
+                yield model
+        if not tried:
+            yield models[0]
+
+    def _failed(self, model: str, error: Exception, models: List[str]) -> None:
+        # Errors caused by a spent time budget say nothing about the model
+        check_deadline()
+        if is_provider_failure(error):
+            self.breaker(model).record_failure(f"raising {type(error).__name__}")
+        if model != models[-1]:
+            log_info(f"Request to {model} failed ({error}), trying the next model")
+
+    def call(self, models: List[str], fn: Callable[[str], T], timed: bool = True) -> T:
+        """Run fn with the first healthy model, falling back on errors.
+
+        Pass timed=False when fn makes more than one completion (a whole
+        agent run): its duration says nothing about the model being slow.
+        """
+        if len(models) == 1:
+            return fn(models[0])
+
+        error: Optional[Exception] = None
+        for model in self._candidates(models):
+            started = time.monotonic()
+            try:
+                result = fn(model)
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                self._failed(model, e, models)
+                error = e
+                continue
+            self.breaker(model).record_success(
+                time.monotonic() - started if timed else None
+            )
+            return result
+        assert error is not None
+        raise error
+
+    async def call_async(
+        self,
+        models: List[str],
+        fn: Callable[[str], Awaitable[T]],
+        timed: bool = True,
+    ) -> T:
+        """Async variant of call()."""
+        if len(models) == 1:
+            return await fn(models[0])
+
+        error: Optional[Exception] = None
+        for model in self._candidates(models):
+            started = time.monotonic()
+            try:
+                result = await fn(model)
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                self._failed(model, e, models)
+                error = e
+                continue
+            self.breaker(model).record_success(
+                time.monotonic() - started if timed else None
+            )
+            return result
+        assert error is not None
+        raise error
+
+
+def get_model_router() -> ModelRouter:
+    """Return the process-wide router, configured from project.yml's circuit_breaker."""
+    global _router
+    with _router_lock:
+        if _router is None:
+            try:
+                breaker = settings().circuit_breaker
+            except (FileNotFoundError, ValueError):
+                breaker = CircuitBreakerSettings()
+            _router = ModelRouter(
+                failure_threshold=breaker.failure_threshold,
+                slow_call_seconds=breaker.slow_call_seconds,
+                reset_seconds=breaker.reset_seconds,
+            )
+        return _router
@@ -441,7 +441,7 @@ def handle_translate(args: argparse.Namespace) -> None:
 
         try:
             # Translate the character
-            character.translate(chapter_contents)
+            character.translate(chapter_contents, bulk=args.bulk)
             print(
                 f"Character '{character.name.original_text}' translated to {args.to} successfully."
             )
@@ -516,6 +516,7 @@ def setup_character_parser(subparsers):  # type: ignore
     translate_parser.add_argument("search_query", help="Character name or short name to translate")  # type: ignore
     translate_parser.add_argument("chapter_path", help="Path to chapter file for context")  # type: ignore
     translate_parser.add_argument("--to", required=True, help="Target language code")  # type: ignore
+    translate_parser.add_argument("--bulk", action="store_true", help="Translate all fields with one structured request")  # type: ignore
 
 
 def handle_character_command(args: argparse.Namespace) -> None:
@@ -0,0 +1,89 @@
+import argparse
+
+from recording_store import (
+    RECORDINGS_DIR,
+    TRACK_HITS_ENV,
+    RecordingStore,
+    recording_names,
+)
+from tracing import log_enter, log_exit
+
+
+def format_recording_stats(directory: str = RECORDINGS_DIR) -> str:
+    """Render entries, disk size and tracked hits of every recorded function."""
+    names = recording_names(directory)
+    if not names:
+        return f"No recordings in {directory}."
+
+    lines = [
+        f"{'Function':<16} {'Entries':>8} {'Size':>10} {'Live':>6} {'Dead':>6} "
+        f"{'Hits':>6}",
+        "-" * 57,
+    ]
+    for name in names:
+        stats = RecordingStore(directory, name).stats()
+        size = f"{stats['bytes'] / 1024:.1f} KB"
+        if stats["tracked"]:
+            live = str(stats["live"])
+            dead = str(stats["entries"] - stats["live"])
+            hits = str(stats["hits"])
+        else:
+            live = dead = hits = "-"
+        lines.append(
+            f"{name[:16]:<16} {stats['entries']:>8} {size:>10} {live:>6} "
+            f"{dead:>6} {hits:>6}"
+        )
+    return "\n".join(lines)
+
+
+def handle_stats(args: argparse.Namespace) -> None:
+    """Handle the 'recordings stats' command."""
+    print(format_recording_stats(args.dir))
+    print(
+        f"\nLive and dead entries come from runs with {TRACK_HITS_ENV}=1, "
+        "'-' means no hits were tracked."
+    )
+
+
+def handle_compact(args: argparse.Namespace) -> None:
+    """Handle the 'recordings compact' command."""
+    log_enter("handle_compact")
+
+    names = recording_names(args.dir)
+    if not names:
+        print(f"No recordings in {args.dir}.")
+    for name in names:
+        store = RecordingStore(args.dir, name)
+        if not store.stats()["tracked"]:
+            print(f"{name}: no hits tracked, left as is")
+            continue
+        kept, dropped = store.compact()
+        print(f"{name}: kept {kept}, dropped {dropped} dead recording(s)")
+
+    log_exit("handle_compact")
+
+
+def setup_recordings_parser(subparsers):  # type: ignore
+    """Set up the recordings subcommand parser."""
+    recordings_parser = subparsers.add_parser("recordings", help="Maintain the recordings replayed by the tests")  # type: ignore
+    recordings_subparsers = recordings_parser.add_subparsers(dest="recordings_command", help="Recordings commands")  # type: ignore
+
+    # recordings stats
+    stats_parser = recordings_subparsers.add_parser("stats", help="Show size and hit statistics per function")  # type: ignore
+    stats_parser.add_argument("--dir", default=RECORDINGS_DIR, help=f"Recordings directory (default: {RECORDINGS_DIR})")  # type: ignore
+
+    # recordings compact
+    compact_parser = recordings_subparsers.add_parser("compact", help=f"Drop recordings that runs with {TRACK_HITS_ENV}=1 did not replay")  # type: ignore
+    compact_parser.add_argument("--dir", default=RECORDINGS_DIR, help=f"Recordings directory (default: {RECORDINGS_DIR})")  # type: ignore
+
+
+def handle_recordings_command(args: argparse.Namespace) -> None:
+    """Handle recordings subcommands."""
+    if args.recordings_command == "stats":
+        handle_stats(args)
+    elif args.recordings_command == "compact":
+        handle_compact(args)
+    else:
+        print(
+            "Unknown recordings command. Use 'fantranslate recordings --help' for help."
+        )
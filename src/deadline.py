@@ -0,0 +1,94 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Generator, Optional
+
+_current_deadline: ContextVar[Optional["Deadline"]] = ContextVar(
+    "deadline", default=None
+)
+
+
+class DeadlineExceeded(TimeoutError):
+    """The time budget of the running command has been spent."""
+
+
+class Deadline:
+    """A point in time by which all LLM work of a command must be done."""
+
+    def __init__(self, seconds: float) -> None:
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def check(self) -> None:
+        if self.expired():
+            raise DeadlineExceeded(f"Time budget of {self.seconds:g}s is spent")
+
+
+@contextmanager
+def deadline(seconds: Optional[float]) -> Generator[Optional[Deadline], None, None]:
+    """Bound the LLM calls made inside this block to seconds in total.
+
+    Nested deadlines can only shorten the budget. With seconds=None the
+    enclosing deadline, if any, stays in effect.
+    """
+    current = _current_deadline.get()
+    if seconds is None:
+        yield current
+        return
+
+    new = Deadline(seconds)
+    if current is not None and current.expires_at < new.expires_at:
+        new = current
+    token = _current_deadline.set(new)
+    try:
+        yield new
+    finally:
+        _current_deadline.reset(token)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+
+def check_deadline() -> None:
+    """Raise DeadlineExceeded if the current deadline has passed."""
+    current = _current_deadline.get()
+    if current is not None:
+        current.check()
+
+
+def bounded_timeout(timeout: Optional[float]) -> Optional[float]:
+    """Cap timeout at the time left before the current deadline.
+
+    Returns timeout unchanged when there is no deadline, and raises
+    DeadlineExceeded once the deadline has passed.
+    """
+    current = _current_deadline.get()
+    if current is None:
+        return timeout
+    current.check()
+    remaining = current.remaining()
+    return remaining if timeout is None else min(timeout, remaining)
+
+
+@contextmanager
+def raise_on_deadline() -> Generator[None, None, None]:
+    """Report errors caused by a spent budget as DeadlineExceeded.
+
+    The OpenAI client wraps transport errors in its own exception types, so
+    a request cancelled by the deadline would otherwise surface as a
+    connection error.
+    """
+    try:
+        yield
+    except DeadlineExceeded:
+        raise
+    except Exception:
+        check_deadline()
+        raise
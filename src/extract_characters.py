@@ -1,8 +1,15 @@
+import contextvars
 import json
-from typing import List, Tuple
+import queue
+import threading
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
-from ai import agent, ai, yesno
+from ai import agent, ai_stream, yesno
+from checkpoint import Checkpoint, checkpoint_for
+from deadline import DeadlineExceeded
 from helpers.context import Context
+from helpers.json_stream import JsonArrayStreamParser
+from models.character import Character
 from models.character_collection import CharacterCollection
 from tools.character import (
     add_short_name_tool,
@@ -11,11 +18,14 @@ from tools.character import (
     get_all_characters_tool,
     search_character_tool,
     set_gender_tool,
+    upsert_characters_tool,
 )
 from tracing import log_enter, log_error, log_exit, log_info, log_trace
+from usage import stage
 
 # Tools needed for character extraction
 extraction_tools = [
+    upsert_characters_tool,
     search_character_tool,
     create_character_tool,
     add_short_name_tool,
@@ -23,22 +33,25 @@ extraction_tools = [
     get_all_characters_tool,
 ]
 
-
-def detection_judge(
-    chapter_text: str, existing_characters: CharacterCollection, max_retries: int = 3
-) -> List[str]:
-    """Detect missing characters in a chapter using AI.
-
-    Args:
-        chapter_text: The full text of the book chapter
-        existing_characters: The current character collection
-        max_retries: Maximum number of AI calls to attempt
-
-    Returns:
-        List of character names that are missing from the collection
-    """
-    log_enter("detection_judge")
-
+# Names the streamed detection must have found before an extraction run is
+# started while it is still going; every run sends the whole chapter again,
+# so smaller chapters are extracted in one pass once detection has finished
+EXTRACTION_BATCH_SIZE = 8
+
+# Structured reply of the detection judge; streamed replies are parsed from
+# the first "[" so the names still arrive one by one
+DETECTION_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {"characters": {"type": "array", "items": {"type": "string"}}},
+    "required": ["characters"],
+    "additionalProperties": False,
+}
+
+
+def _detection_prompts(
+    chapter_text: str, existing_characters: CharacterCollection
+) -> Tuple[str, str]:
+    """Build the system and user prompts for the detection judge."""
     # Build existing characters display with grouped names
     existing_chars_display = []
     for char in existing_characters.characters:
@@ -62,39 +75,40 @@ def detection_judge(
             "Existing Characters",
             "The following characters are already in the collection:\n"
             + "\n".join(existing_chars_display),  # type: ignore
+            volatile=True,
         )
         .add("Chapter Text", chapter_text)
         .add(
             "Output Requirements",
-            "You must return ONLY a valid JSON array of strings, where each string is a character name found in the chapter that is missing from the collection. Do not include any other text, explanations, or formatting.\n\n"
+            'You must return ONLY a valid JSON object with a single "characters" key holding an array of strings, where each string is a character name found in the chapter that is missing from the collection. Do not include any other text, explanations, or formatting.\n\n'
             "Example output:\n"
-            '["John Smith", "Mary Johnson", "Dr. Roberts"]\n\n'
+            '{"characters": ["John Smith", "Mary Johnson", "Dr. Roberts"]}\n\n'
             "CRITICAL REQUIREMENTS:\n"
             "- Response must be valid JSON that can be parsed by json.loads()\n"
-            "- Response must be a JSON array (starts with [ and ends with ])\n"
+            '- Response must be a JSON object whose "characters" value is an array\n'
             "- Each element must be a string (enclosed in quotes)\n"
             "- No trailing commas, comments, or extra text\n"
-            "- If no characters are found, return an empty array: []",
+            '- If no characters are found, return an empty array: {"characters": []}',
         )
         .example(
             in_='Existing characters: - Frodo Baggins (a.k.a Frodo), Chapter text: "Gandalf arrived at the Shire and spoke with Bilbo Baggins about the ring."',
-            out='["Gandalf", "Bilbo Baggins"]',
+            out='{"characters": ["Gandalf", "Bilbo Baggins"]}',
         )
         .example(
             in_='Existing characters: - Harry Potter, Chapter text: "Hermione Granger and Ron Weasley helped Harry Potter in the library."',
-            out='["Hermione Granger", "Ron Weasley"]',
+            out='{"characters": ["Hermione Granger", "Ron Weasley"]}',
         )
         .example(
             in_='Existing characters: - John Smith (a.k.a Johnny), Chapter text: "Mary Johnson introduced herself to Johnny at the party."',
-            out='["Mary Johnson"]',
+            out='{"characters": ["Mary Johnson"]}',
         )
         .example(
             in_='Existing characters: - Frodo Baggins, - Gandalf, Chapter text: "The fellowship consisted of Aragorn, Legolas, and Gimli."',
-            out='["Aragorn", "Legolas", "Gimli"]',
+            out='{"characters": ["Aragorn", "Legolas", "Gimli"]}',
         )
         .failure_example(
             in_='Existing characters: - Harry Potter, Chapter text: "Hermione helped Harry in class."',
-            err='["Hermione"]\n\nHermione Granger is a new character mentioned in the chapter.',
+            err='{"characters": ["Hermione"]}\n\nHermione Granger is a new character mentioned in the chapter.',
         )
         .failure_example(
             in_='Existing characters: - Frodo, Chapter text: "Samwise Gamgee carried the ring."',
@@ -102,62 +116,150 @@ def detection_judge(
         )
         .failure_example(
             in_='Existing characters: - John Smith, Chapter text: "The meeting happened in Conference Room A."',
-            err='["Conference Room A"]',
+            err='{"characters": ["Conference Room A"]}',
         )
     )
 
-    user_prompt = user_context.build()
+    user_prompt = user_context.build(cache_friendly=True)
+    return system_prompt, user_prompt
 
-    for attempt in range(max_retries):
-        log_trace("Attempt", str(attempt + 1))
 
-        # Call AI
-        response = ai(system_prompt, user_prompt)
+def detection_judge_stream(
+    chapter_text: str, existing_characters: CharacterCollection, max_retries: int = 3
+) -> Iterator[str]:
+    """Detect missing characters, yielding each name as soon as the AI has written it.
 
-        if response is None:
-            log_info("AI returned None, continuing to next attempt")
-            continue
+    Args:
+        chapter_text: The full text of the book chapter
+        existing_characters: The current character collection
+        max_retries: Maximum number of AI calls to attempt
 
-        try:
-            # Parse JSON response
-            missing_characters = json.loads(response.strip())
-            if not isinstance(missing_characters, list):
-                log_info(f"AI response is not a list: {response}")
+    Yields:
+        Character names that are missing from the collection, without duplicates
+    """
+    log_enter("detection_judge_stream")
+
+    try:
+        system_prompt, user_prompt = _detection_prompts(
+            chapter_text, existing_characters
+        )
+        detected: List[str] = []
+
+        for attempt in range(max_retries):
+            log_trace("Attempt", str(attempt + 1))
+            parser = JsonArrayStreamParser()
+
+            try:
+                with stage("detection_judge"):
+                    for chunk in ai_stream(
+                        system_prompt,
+                        user_prompt,
+                        call_site="detection",
+                        response_schema=DETECTION_SCHEMA,
+                        # A cached reply is a complete one, retries need a new reply
+                        use_cache=attempt == 0,
+                    ):
+                        for name in parser.feed(chunk):
+                            # Names yielded by an earlier, broken attempt are not repeated
+                            if isinstance(name, (str, int, float)) and (
+                                str(name) not in detected
+                            ):
+                                detected.append(str(name))
+                                yield str(name)
+            except json.JSONDecodeError as e:
+                log_info(f"Failed to parse streamed AI response as JSON: {e}")
                 continue
 
-            # Filter to ensure they are strings
-            missing_characters = [
-                str(name)
-                for name in missing_characters
-                if isinstance(name, (str, int, float))
-            ]
-
-            log_info(
-                f"Detected {len(missing_characters)} missing characters: {missing_characters}"
-            )
-            log_exit("detection_judge")
-            return missing_characters
-
-        except json.JSONDecodeError as e:
-            log_info(f"Failed to parse AI response as JSON: {response}, error: {e}")
-            continue
-
-    # All retries failed
-    log_error(f"Failed to get valid JSON response after {max_retries} attempts")
-    log_exit("detection_judge")
-    raise ValueError(
-        f"AI failed to provide a valid JSON response after {max_retries} attempts"
-    )
+            if parser.finished:
+                log_info(f"Detected {len(detected)} missing characters: {detected}")
+                return
+
+            log_info("Streamed AI response did not contain a complete JSON array")
+
+        # All retries failed
+        log_error(f"Failed to get valid JSON response after {max_retries} attempts")
+        raise ValueError(
+            f"AI failed to provide a valid JSON response after {max_retries} attempts"
+        )
+    finally:
+        log_exit("detection_judge_stream")
+
+
+class _StreamingExtraction:
+    """Run extraction_agent on a background thread while names are still arriving.
+
+    Once EXTRACTION_BATCH_SIZE names have queued up they are extracted
+    together, overlapping with the rest of detection; whatever is left when
+    detection finishes goes into one final run.
+    """
+
+    def __init__(
+        self,
+        chapter_text: str,
+        on_extracted: Optional[Callable[[List[str]], None]] = None,
+    ) -> None:
+        self._chapter_text = chapter_text
+        self._on_extracted = on_extracted
+        self._batch_size = EXTRACTION_BATCH_SIZE
+        self._names: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._error: Optional[BaseException] = None
+        # Run in a copy of the caller's context so the deadline and usage stage apply
+        self._thread = threading.Thread(
+            target=contextvars.copy_context().run, args=(self._run,), daemon=True
+        )
+        self._thread.start()
+
+    def add(self, name: str) -> None:
+        self._names.put(name)
+
+    def finish(self) -> None:
+        """Wait for all queued names to be extracted."""
+        self._names.put(None)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def _run(self) -> None:
+        pending: List[str] = []
+        done = False
+        while not done:
+            name = self._names.get()
+            # Take everything that queued up during the previous run
+            while True:
+                if name is None:
+                    done = True
+                    break
+                pending.append(name)
+                try:
+                    name = self._names.get_nowait()
+                except queue.Empty:
+                    break
+            if not pending or not (done or len(pending) >= self._batch_size):
+                continue
+
+            batch, pending = pending, []
+            try:
+                extraction_agent(batch, self._chapter_text)
+                if self._on_extracted is not None:
+                    self._on_extracted(batch)
+            except DeadlineExceeded as e:
+                # Nothing else can finish in time either
+                self._error = self._error or e
+                return
+            except Exception as e:
+                log_error(f"Extraction of {batch} failed: {e}")
+                self._error = self._error or e
 
 
 def extraction_agent(
-    missing_characters: List[str], chapter_text: str
+    missing_characters: List[str], chapter_text: str, use_cache: bool = True
 ) -> Tuple[str, List[str]]:
     """Extract missing characters from a chapter using AI agent with character tools.
 
     Args:
         missing_characters: List of character names to extract
         chapter_text: The full text of the book chapter
+        use_cache: Replay a cached agent run; retries pass False to get a fresh one
 
     Returns:
         The agent's response/output
@@ -171,16 +273,24 @@ def extraction_agent(
             "Missing Characters",
             "The following characters need to be extracted from the chapter:\n"
             + "\n".join(f"- {name}" for name in missing_characters),
+            volatile=True,
         )
         .add("Chapter Text", chapter_text)
         .pipe("extraction_agent")
     )
 
-    system_prompt = context.build()
+    system_prompt = context.build(cache_friendly=True)
     user_query = f"Extract the following characters from this chapter: {missing_characters}\n\nChapter text:\n{chapter_text}"
 
     # Call agent with extraction tools
-    response, _ = agent(system_prompt, user_query, extraction_tools)
+    with stage("extraction_agent"):
+        response, _ = agent(
+            system_prompt,
+            user_query,
+            extraction_tools,
+            call_site="extraction",
+            use_cache=use_cache,
+        )
 
     # Get all characters after extraction
     all_characters = [
@@ -247,7 +357,10 @@ def completeness_judge(
 
     user_prompt = f"Have all the characters listed in <missing_characters> been successfully added to the collection shown in <all_characters>?"
 
-    is_complete, reason = yesno(user_prompt, system_context=context)
+    with stage("completeness_judge"):
+        is_complete, reason = yesno(
+            user_prompt, system_context=context, call_site="completeness"
+        )
 
     if is_complete:
         log_info("Completeness check passed: all missing characters extracted")
@@ -258,16 +371,46 @@ def completeness_judge(
     return is_complete
 
 
-def extract_characters_from_chapter(chapter_path: str) -> bool:
+def _journal_extracted(checkpoint: Checkpoint, names: List[str]) -> None:
+    """Record the characters extracted for names so a resumed run can restore them."""
+    for name in names:
+        character = character_collection.search(name)
+        if character is not None:
+            checkpoint.record(f"extracted:{name}", character.to_dict())
+
+
+def _restore_extracted(checkpoint: Checkpoint) -> None:
+    """Put characters journaled by an interrupted run back into the collection."""
+    with character_collection.lock:
+        for _, data in checkpoint.results("extracted:"):
+            restored = Character.from_dict(data)
+            name = restored.name.original_text
+            for i, existing in enumerate(character_collection.characters):
+                if existing.name.original_text == name:
+                    character_collection.characters[i] = restored
+                    break
+            else:
+                character_collection.characters.append(restored)
+        character_collection.rebuild_index()
+
+
+def extract_characters_from_chapter(chapter_path: str, resume: bool = False) -> bool:
     """Main function to extract characters from a chapter.
 
+    Detected names and extracted characters are journaled as they finish,
+    so an interrupted run can be continued with ``resume``.
+
     Args:
         chapter_path: Path to the chapter text file
+        resume: Continue from the journal of an interrupted run on this chapter
 
     Returns:
         True if extraction was successful and complete, False otherwise
     """
     log_enter("extract_characters_from_chapter")
+    from helpers.settings import DEFAULT_CHARACTERS_STORAGE
+
+    checkpoint = checkpoint_for("extract_characters", chapter_path, resume=resume)
 
     try:
         # Load chapter text
@@ -276,26 +419,55 @@ def extract_characters_from_chapter(chapter_path: str) -> bool:
 
         # Use the singleton character collection
         log_info(f"Loaded {len(character_collection.characters)} existing characters")
+        _restore_extracted(checkpoint)
 
-        # Step 1: Detection judge - find missing characters
-        missing_characters = detection_judge(chapter_text, character_collection)
+        # Step 1-2: Detection judge streams missing characters straight into
+        # extraction, so extraction starts before detection has finished
+        missing_characters: List[str] = []
+        extraction = _StreamingExtraction(
+            chapter_text, lambda names: _journal_extracted(checkpoint, names)
+        )
+        try:
+            if checkpoint.done("detection"):
+                # Only extract what the interrupted run did not get to
+                missing_characters = list(checkpoint.result("detection"))
+                for name in missing_characters:
+                    if not checkpoint.done(f"extracted:{name}"):
+                        extraction.add(name)
+            else:
+                for name in detection_judge_stream(chapter_text, character_collection):
+                    missing_characters.append(name)
+                    extraction.add(name)
+                checkpoint.record("detection", missing_characters)
+        finally:
+            extraction.finish()
         log_info(
             f"Found {len(missing_characters)} missing characters: {missing_characters}"
         )
 
         if not missing_characters:
             log_info("No missing characters found, extraction complete")
+            checkpoint.clear()
             log_exit("extract_characters_from_chapter")
             return True
 
-        # Step 2-3: Extraction with retry loop (up to 3 attempts)
+        # Step 3: Completeness check, re-running extraction on failure (up to 3 attempts)
         max_attempts = 3
         is_complete = False
         for attempt in range(max_attempts):
             log_info(f"Extraction attempt {attempt + 1}/{max_attempts}")
 
-            # Extract characters
-            _, all_characters = extraction_agent(missing_characters, chapter_text)
+            if attempt == 0:
+                # The streamed extraction above was the first attempt
+                all_characters = [
+                    char.name.original_text for char in character_collection.characters
+                ]
+            else:
+                # The cached run is the one that just came up incomplete
+                _, all_characters = extraction_agent(
+                    missing_characters, chapter_text, use_cache=False
+                )
+                _journal_extracted(checkpoint, missing_characters)
             log_info("Character extraction completed")
 
             # Check completeness
@@ -311,14 +483,21 @@ def extract_characters_from_chapter(chapter_path: str) -> bool:
                 else:
                     log_info("Maximum attempts reached, extraction incomplete")
 
-        # Save the updated collection
-        from helpers.settings import DEFAULT_CHARACTERS_STORAGE
-
+        # Save the updated collection; the journal is only needed to resume
         character_collection.save(DEFAULT_CHARACTERS_STORAGE)
+        if is_complete:
+            checkpoint.clear()
 
         log_exit("extract_characters_from_chapter")
         return is_complete
 
+    except DeadlineExceeded as e:
+        # Keep the characters extracted so far
+        log_error(f"Character extraction stopped: {e}")
+        character_collection.save(DEFAULT_CHARACTERS_STORAGE)
+        log_exit("extract_characters_from_chapter")
+        return False
+
     except Exception as e:
         log_error(f"Error during character extraction: {e}")
         log_exit("extract_characters_from_chapter")
@@ -0,0 +1,184 @@
+import asyncio
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Awaitable, Callable, Deque, Dict, Optional, Set, TypeVar
+
+from helpers.settings import settings
+from tracing import log_info
+
+T = TypeVar("T")
+
+# Recent latencies kept per model to learn the hedging threshold from
+LATENCY_WINDOW = 200
+# Losing sync requests still running before hedging pauses; each one holds a
+# hedge thread and a pooled connection until the provider answers
+MAX_ABANDONED = 8
+
+_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="hedge")
+_policy: Optional["HedgingPolicy"] = None
+
+
+class HedgingPolicy:
+    """Re-send slow requests once they exceed a learned latency percentile.
+
+    Latencies are tracked per model. Once a model has ``min_samples`` of
+    them, a call still running after the ``percentile``-th latency gets a
+    duplicate request and the first successful answer wins. Hedges are
+    capped at ``max_extra_ratio`` of the calls made through the policy.
+
+    A blocking HTTP call cannot be interrupted from another thread, so the
+    losing request of call() runs to completion and is billed. Every hedge
+    is therefore counted as a full extra request against the cap, and no
+    new hedge starts while ``MAX_ABANDONED`` losers are still running.
+    call_async() cancels its loser.
+    """
+
+    def __init__(
+        self,
+        percentile: float = 95,
+        min_samples: int = 20,
+        max_extra_ratio: float = 0.1,
+    ) -> None:
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.max_extra_ratio = max_extra_ratio
+        self.calls = 0
+        self.hedges = 0
+        self.abandoned = 0
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record_latency(self, model: str, seconds: float) -> None:
+        with self._lock:
+            window = self._latencies.setdefault(model, deque(maxlen=LATENCY_WINDOW))
+            window.append(seconds)
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        """Seconds to wait before hedging, or None while there is too little data."""
+        with self._lock:
+            window = self._latencies.get(model)
+            if window is None or len(window) < self.min_samples:
+                return None
+            ordered = sorted(window)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+        return ordered[index]
+
+    def _start_call(self) -> None:
+        with self._lock:
+            self.calls += 1
+
+    def _claim_hedge(self) -> bool:
+        with self._lock:
+            if self.hedges + 1 > self.calls * self.max_extra_ratio:
+                return False
+            if self.abandoned >= MAX_ABANDONED:
+                return False
+            self.hedges += 1
+            return True
+
+    def _abandon(self, future: "Future[T]") -> None:
+        # A queued request is dropped; a running one cannot be stopped
+        if future.cancel():
+            return
+        with self._lock:
+            self.abandoned += 1
+        future.add_done_callback(lambda _: self._release_abandoned())
+
+    def _release_abandoned(self) -> None:
+        with self._lock:
+            self.abandoned -= 1
+
+    def call(self, model: str, fn: Callable[[], T]) -> T:
+        """Run fn, hedging it on a second thread if it is slow.
+
+        The losing request is not cancelled: it finishes in the background
+        and its answer is ignored.
+        """
+        self._start_call()
+        started = time.monotonic()
+        delay = self.hedge_delay(model)
+        primary = _submit(fn)
+
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._claim_hedge():
+            result = primary.result()
+            self.record_latency(model, time.monotonic() - started)
+            return result
+
+        log_info(f"Hedging request to {model} after {delay:.2f}s")
+        pending: Set["Future[T]"] = {primary, _submit(fn)}
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                e = future.exception()
+                if e is None:
+                    for other in pending:
+                        self._abandon(other)
+                    self.record_latency(model, time.monotonic() - started)
+                    return future.result()
+                error = error or e
+        assert error is not None
+        raise error
+
+    async def call_async(self, model: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """Async variant of call(); the losing request is cancelled."""
+        self._start_call()
+        started = time.monotonic()
+        delay = self.hedge_delay(model)
+        primary = asyncio.ensure_future(fn())
+
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done or not self._claim_hedge():
+            result = await primary
+            self.record_latency(model, time.monotonic() - started)
+            return result
+
+        log_info(f"Hedging request to {model} after {delay:.2f}s")
+        pending: Set["asyncio.Future[T]"] = {primary, asyncio.ensure_future(fn())}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    e = task.exception()
+                    if e is None:
+                        self.record_latency(model, time.monotonic() - started)
+                        return task.result()
+                    error = error or e
+        finally:
+            for task in pending:
+                task.cancel()
+        assert error is not None
+        raise error
+
+
+def _submit(fn: Callable[[], T]) -> "Future[T]":
+    # Carry context variables such as the usage stage into the worker
+    return _executor.submit(contextvars.copy_context().run, fn)
+
+
+def get_hedging_policy(call_site: Optional[str]) -> Optional[HedgingPolicy]:
+    """Return the hedging policy for call_site if hedging is enabled in project.yml."""
+    global _policy
+    try:
+        hedging = settings().hedging
+    except (FileNotFoundError, ValueError):
+        return None
+    if not hedging.enabled:
+        return None
+    if hedging.call_sites and call_site not in hedging.call_sites:
+        return None
+
+    if _policy is None:
+        _policy = HedgingPolicy(
+            percentile=hedging.percentile,
+            min_samples=hedging.min_samples,
+            max_extra_ratio=hedging.max_extra_ratio,
+        )
+    return _policy
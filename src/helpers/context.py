@@ -4,17 +4,41 @@ from typing import Dict, List, Optional
 from helpers.settings import RESOURCE_DIR
 
 
+class CacheablePrompt(str):
+    """A built prompt that knows how long its stable, cacheable prefix is.
+
+    It behaves like any other string; ``ai()`` uses ``static_length`` to put a
+    provider cache-control marker after the prefix.
+    """
+
+    static_length: int
+
+    def __new__(cls, text: str, static_length: int) -> "CacheablePrompt":
+        prompt = super().__new__(cls, text)
+        prompt.static_length = static_length
+        return prompt
+
+    @property
+    def static_prefix(self) -> str:
+        return str(self[: self.static_length])
+
+    @property
+    def volatile_suffix(self) -> str:
+        return str(self[self.static_length :])
+
+
 class Context:
     def __init__(self, parts: Optional[List[Dict[str, str]]] = None) -> None:
         self.parts: List[Dict[str, str]] = parts or []
 
-    def add(self, title: str, text: str) -> "Context":
-        new_parts = self.parts + [{"type": "section", "title": title, "text": text}]
-        return Context(new_parts)
+    def add(self, title: str, text: str, volatile: bool = False) -> "Context":
+        """Add a titled section; volatile sections change between otherwise equal calls."""
+        part = {"type": "section", "title": title, "text": text}
+        return Context(self.parts + [_mark_volatile(part, volatile)])
 
-    def wrap(self, tag: str, content: str) -> "Context":
-        new_parts = self.parts + [{"type": "wrap", "tag": tag, "content": content}]
-        return Context(new_parts)
+    def wrap(self, tag: str, content: str, volatile: bool = False) -> "Context":
+        part = {"type": "wrap", "tag": tag, "content": content}
+        return Context(self.parts + [_mark_volatile(part, volatile)])
 
     def example(self, in_: str, out: str) -> "Context":
         new_parts = self.parts + [{"type": "good_example", "in": in_, "out": out}]
@@ -38,34 +62,64 @@ class Context:
             part["type"] in ["good_example", "bad_example"] for part in self.parts
         )
 
-    def build(self) -> str:
+    def build(self, cache_friendly: bool = False) -> str:
+        """Render the context as a prompt.
+
+        By default parts keep their insertion order with examples last. With
+        ``cache_friendly`` the stable parts and examples come first and the
+        volatile parts last, so repeated calls share the longest possible
+        prefix for provider-side prompt caching; the result is then a
+        ``CacheablePrompt`` marking where that prefix ends.
+        """
         main_parts: List[Dict[str, str]] = []
+        volatile_parts: List[Dict[str, str]] = []
         examples: List[Dict[str, str]] = []
         for part in self.parts:
             if part["type"] in ["good_example", "bad_example"]:
                 examples.append(part)
+            elif cache_friendly and part.get("volatile"):
+                volatile_parts.append(part)
             else:
                 main_parts.append(part)
-        result = ""
-        for part in main_parts:
-            if part["type"] == "section":
-                result += f"** {part['title'].upper()} **\n{part['text']}\n\n"
-            elif part["type"] == "wrap":
-                result += f"<{part['tag']}>\n{part['content']}\n</{part['tag']}>\n\n"
-            elif part["type"] == "pipe":
-                result += f"\n{part['content']}\n\n"
-        if examples:
-            result += "<examples>\n"
-            for ex in examples:
-                if ex["type"] == "good_example":
-                    result += "<good_example>\n"
-                    result += f'  <in>{ex["in"]}</in>\n'
-                    result += f'  <out>{ex["out"]}</out>\n'
-                    result += "</good_example>\n"
-                elif ex["type"] == "bad_example":
-                    result += "<bad_example DON'T DO THIS>\n"
-                    result += f'  <in>{ex["in"]}</in>\n'
-                    result += f'  <err>{ex["err"]}</err>\n'
-                    result += "</bad_example>\n"
-            result += "</examples>\n"
-        return result
+
+        result = _render_parts(main_parts) + _render_examples(examples)
+        if not cache_friendly:
+            return result
+        return CacheablePrompt(result + _render_parts(volatile_parts), len(result))
+
+
+def _mark_volatile(part: Dict[str, str], volatile: bool) -> Dict[str, str]:
+    if volatile:
+        part["volatile"] = "true"
+    return part
+
+
+def _render_parts(parts: List[Dict[str, str]]) -> str:
+    result = ""
+    for part in parts:
+        if part["type"] == "section":
+            result += f"** {part['title'].upper()} **\n{part['text']}\n\n"
+        elif part["type"] == "wrap":
+            result += f"<{part['tag']}>\n{part['content']}\n</{part['tag']}>\n\n"
+        elif part["type"] == "pipe":
+            result += f"\n{part['content']}\n\n"
+    return result
+
+
+def _render_examples(examples: List[Dict[str, str]]) -> str:
+    if not examples:
+        return ""
+    result = "<examples>\n"
+    for ex in examples:
+        if ex["type"] == "good_example":
+            result += "<good_example>\n"
+            result += f'  <in>{ex["in"]}</in>\n'
+            result += f'  <out>{ex["out"]}</out>\n'
+            result += "</good_example>\n"
+        elif ex["type"] == "bad_example":
+            result += "<bad_example DON'T DO THIS>\n"
+            result += f'  <in>{ex["in"]}</in>\n'
+            result += f'  <err>{ex["err"]}</err>\n'
+            result += "</bad_example>\n"
+    result += "</examples>\n"
+    return result
@@ -0,0 +1,86 @@
+import json
+import re
+from typing import Any, Dict, List, Optional, cast
+
+_JSON_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "boolean": bool,
+    "null": type(None),
+}
+
+
+def schema_errors(value: Any, schema: Dict[str, Any], path: str = "$") -> List[str]:
+    """Check value against the JSON Schema subset used for structured outputs.
+
+    Supports type, enum, pattern, properties, required, additionalProperties,
+    items, minItems and maxItems, which is what the provider's strict mode
+    accepts. Returns a list of problems, empty when value conforms.
+    """
+    expected = schema.get("type")
+    if expected is not None and not _has_type(value, expected):
+        return [f"{path}: expected {expected}, got {type(value).__name__}"]
+
+    errors: List[str] = []
+    if "enum" in schema and value not in schema["enum"]:
+        errors.append(f"{path}: {value!r} is not one of {schema['enum']}")
+    if "pattern" in schema and isinstance(value, str):
+        if re.search(schema["pattern"], value) is None:
+            errors.append(f"{path}: {value!r} does not match {schema['pattern']}")
+
+    if isinstance(value, dict):
+        obj = cast(Dict[str, Any], value)
+        properties = cast(Dict[str, Any], schema.get("properties", {}))
+        for name in schema.get("required", []):
+            if name not in obj:
+                errors.append(f"{path}: missing required property '{name}'")
+        for name, item in obj.items():
+            if name in properties:
+                errors += schema_errors(item, properties[name], f"{path}.{name}")
+            elif schema.get("additionalProperties") is False:
+                errors.append(f"{path}: unexpected property '{name}'")
+
+    if isinstance(value, list):
+        items = cast(List[Any], value)
+        if "minItems" in schema and len(items) < schema["minItems"]:
+            errors.append(f"{path}: fewer than {schema['minItems']} items")
+        if "maxItems" in schema and len(items) > schema["maxItems"]:
+            errors.append(f"{path}: more than {schema['maxItems']} items")
+        if "items" in schema:
+            for i, item in enumerate(items):
+                errors += schema_errors(item, schema["items"], f"{path}[{i}]")
+
+    return errors
+
+
+def _has_type(value: Any, expected: Any) -> bool:
+    if isinstance(expected, list):
+        return any(_has_type(value, t) for t in cast(List[Any], expected))
+    if expected == "integer":
+        return isinstance(value, int) and not isinstance(value, bool)
+    if expected == "number":
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    return isinstance(value, _JSON_TYPES.get(str(expected), object))
+
+
+def parse_json_reply(text: str) -> Optional[Any]:
+    """Parse the JSON value in an LLM reply, ignoring code fences and chatter."""
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[-1].rsplit("```", 1)[0].strip()
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+
+    # Fall back to the outermost object or array in the reply
+    starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    if not starts:
+        return None
+    start = min(starts)
+    end = text.rfind("}" if text[start] == "{" else "]")
+    try:
+        return json.loads(text[start : end + 1])
+    except ValueError:
+        return None
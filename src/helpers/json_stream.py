@@ -0,0 +1,67 @@
+import json
+from typing import Any, List
+
+
+class JsonArrayStreamParser:
+    """Incrementally parse a JSON array, returning elements as soon as they complete.
+
+    Text before the opening bracket (such as a code fence) is ignored, so the
+    parser can be fed raw LLM output chunk by chunk.
+    """
+
+    def __init__(self) -> None:
+        self.started = False
+        self.finished = False
+        self._element = ""
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, chunk: str) -> List[Any]:
+        """Consume a chunk of text and return the elements completed by it.
+
+        Raises json.JSONDecodeError if a completed element is not valid JSON.
+        """
+        elements: List[Any] = []
+        for ch in chunk:
+            if self.finished:
+                break
+
+            if not self.started:
+                if ch == "[":
+                    self.started = True
+                continue
+
+            if self._in_string:
+                self._element += ch
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._element += ch
+            elif ch in "[{":
+                self._depth += 1
+                self._element += ch
+            elif ch in "]}" and self._depth > 0:
+                self._depth -= 1
+                self._element += ch
+            elif ch == "," and self._depth == 0:
+                elements.append(self._complete_element())
+            elif ch == "]" and self._depth == 0:
+                if self._element.strip():
+                    elements.append(self._complete_element())
+                self.finished = True
+            else:
+                self._element += ch
+        return elements
+
+    def _complete_element(self) -> Any:
+        text = self._element.strip()
+        self._element = ""
+        return json.loads(text)
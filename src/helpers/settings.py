@@ -1,6 +1,6 @@
 import os
-from dataclasses import dataclass
-from typing import Any, Dict, List, cast
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, cast
 
 import yaml
 
@@ -9,12 +9,222 @@ DEFAULT_CHARACTERS_STORAGE = "characters.yml"
 # Directory containing application resource files (prompts, etc.)
 RESOURCE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
 
+# LLM call sites whose model and limits can be configured under 'call_sites'
+CALL_SITES = ("detection", "extraction", "completeness", "summary", "field_translation")
+
+
+@dataclass
+class CacheSettings:
+    enabled: bool = False
+    max_entries: int = 10000
+    max_size_mb: float = 100
+    ttl_days: float = 30
+
+
+@dataclass
+class HedgingSettings:
+    enabled: bool = False
+    # Hedge once a call is slower than this percentile of recent calls
+    percentile: float = 95
+    min_samples: int = 20
+    # Extra requests allowed, as a share of all hedgeable requests
+    max_extra_ratio: float = 0.1
+    # Call sites to hedge; empty means every ai() call
+    call_sites: List[str] = field(default_factory=lambda: cast(List[str], []))
+
+
+@dataclass
+class CircuitBreakerSettings:
+    # Consecutive failed or slow calls after which a model is skipped
+    failure_threshold: int = 5
+    # Calls slower than this count as failures; None only counts errors
+    slow_call_seconds: Optional[float] = None
+    # How long a tripped model is skipped before a probe call is let through
+    reset_seconds: float = 30
+
+
+@dataclass
+class CallSiteSettings:
+    model: Optional[str] = None
+    max_tokens: Optional[int] = None
+    timeout: Optional[float] = None
+    # Models tried in order when the ones before them fail or are tripped
+    fallbacks: List[str] = field(default_factory=lambda: cast(List[str], []))
+
 
 @dataclass
 class Settings:
     languages: List[str]
     translate_from: str
     translate_to: str
+    cache: CacheSettings = field(default_factory=CacheSettings)
+    call_sites: Dict[str, CallSiteSettings] = field(
+        default_factory=lambda: cast(Dict[str, CallSiteSettings], {})
+    )
+    hedging: HedgingSettings = field(default_factory=HedgingSettings)
+    circuit_breaker: CircuitBreakerSettings = field(
+        default_factory=CircuitBreakerSettings
+    )
+
+
+def _parse_cache_settings(data: Any) -> CacheSettings:
+    if data is None:
+        return CacheSettings()
+    if not isinstance(data, dict):
+        raise ValueError("'cache' must be a mapping")
+    data = cast(Dict[str, Any], data)
+
+    defaults = CacheSettings()
+    enabled = data.get("enabled", defaults.enabled)
+    max_entries = data.get("max_entries", defaults.max_entries)
+    max_size_mb = data.get("max_size_mb", defaults.max_size_mb)
+    ttl_days = data.get("ttl_days", defaults.ttl_days)
+
+    if not isinstance(enabled, bool):
+        raise ValueError("'cache.enabled' must be a boolean")
+    if not isinstance(max_entries, int) or max_entries < 1:
+        raise ValueError("'cache.max_entries' must be a positive integer")
+    if not isinstance(max_size_mb, (int, float)) or max_size_mb <= 0:
+        raise ValueError("'cache.max_size_mb' must be a positive number")
+    if not isinstance(ttl_days, (int, float)) or ttl_days <= 0:
+        raise ValueError("'cache.ttl_days' must be a positive number")
+
+    return CacheSettings(
+        enabled=enabled,
+        max_entries=max_entries,
+        max_size_mb=float(max_size_mb),
+        ttl_days=float(ttl_days),
+    )
+
+
+def _parse_call_sites(data: Any) -> Dict[str, CallSiteSettings]:
+    if data is None:
+        return {}
+    if not isinstance(data, dict):
+        raise ValueError("'call_sites' must be a mapping")
+    data = cast(Dict[str, Any], data)
+
+    call_sites: Dict[str, CallSiteSettings] = {}
+    for name, site in data.items():
+        if name not in CALL_SITES:
+            raise ValueError(
+                f"Unknown call site '{name}', expected one of: {', '.join(CALL_SITES)}"
+            )
+        if not isinstance(site, dict):
+            raise ValueError(f"'call_sites.{name}' must be a mapping")
+        site = cast(Dict[str, Any], site)
+
+        model = site.get("model")
+        max_tokens = site.get("max_tokens")
+        timeout = site.get("timeout")
+        fallbacks = site.get("fallbacks", [])
+
+        if model is not None and not isinstance(model, str):
+            raise ValueError(f"'call_sites.{name}.model' must be a string")
+        if max_tokens is not None and (
+            not isinstance(max_tokens, int)
+            or isinstance(max_tokens, bool)
+            or max_tokens < 1
+        ):
+            raise ValueError(
+                f"'call_sites.{name}.max_tokens' must be a positive integer"
+            )
+        if timeout is not None and (
+            not isinstance(timeout, (int, float))
+            or isinstance(timeout, bool)
+            or timeout <= 0
+        ):
+            raise ValueError(f"'call_sites.{name}.timeout' must be a positive number")
+        if not isinstance(fallbacks, list) or not all(
+            isinstance(m, str) for m in cast(List[Any], fallbacks)
+        ):
+            raise ValueError(f"'call_sites.{name}.fallbacks' must be a list of models")
+
+        call_sites[name] = CallSiteSettings(
+            model=model,
+            max_tokens=max_tokens,
+            timeout=float(timeout) if timeout is not None else None,
+            fallbacks=cast(List[str], fallbacks),
+        )
+    return call_sites
+
+
+def _parse_hedging_settings(data: Any) -> HedgingSettings:
+    if data is None:
+        return HedgingSettings()
+    if not isinstance(data, dict):
+        raise ValueError("'hedging' must be a mapping")
+    data = cast(Dict[str, Any], data)
+
+    defaults = HedgingSettings()
+    enabled = data.get("enabled", defaults.enabled)
+    percentile = data.get("percentile", defaults.percentile)
+    min_samples = data.get("min_samples", defaults.min_samples)
+    max_extra_ratio = data.get("max_extra_ratio", defaults.max_extra_ratio)
+    call_sites = data.get("call_sites", defaults.call_sites)
+
+    if not isinstance(enabled, bool):
+        raise ValueError("'hedging.enabled' must be a boolean")
+    if not isinstance(percentile, (int, float)) or not 0 < percentile < 100:
+        raise ValueError("'hedging.percentile' must be between 0 and 100")
+    if not isinstance(min_samples, int) or min_samples < 1:
+        raise ValueError("'hedging.min_samples' must be a positive integer")
+    if not isinstance(max_extra_ratio, (int, float)) or not 0 <= max_extra_ratio <= 1:
+        raise ValueError("'hedging.max_extra_ratio' must be between 0 and 1")
+    if not isinstance(call_sites, list) or not all(
+        site in CALL_SITES for site in cast(List[Any], call_sites)
+    ):
+        raise ValueError(
+            f"'hedging.call_sites' must be a list of: {', '.join(CALL_SITES)}"
+        )
+
+    return HedgingSettings(
+        enabled=enabled,
+        percentile=float(percentile),
+        min_samples=min_samples,
+        max_extra_ratio=float(max_extra_ratio),
+        call_sites=cast(List[str], call_sites),
+    )
+
+
+def _parse_circuit_breaker_settings(data: Any) -> CircuitBreakerSettings:
+    if data is None:
+        return CircuitBreakerSettings()
+    if not isinstance(data, dict):
+        raise ValueError("'circuit_breaker' must be a mapping")
+    data = cast(Dict[str, Any], data)
+
+    defaults = CircuitBreakerSettings()
+    failure_threshold = data.get("failure_threshold", defaults.failure_threshold)
+    slow_call_seconds = data.get("slow_call_seconds", defaults.slow_call_seconds)
+    reset_seconds = data.get("reset_seconds", defaults.reset_seconds)
+
+    if (
+        not isinstance(failure_threshold, int)
+        or isinstance(failure_threshold, bool)
+        or failure_threshold < 1
+    ):
+        raise ValueError(
+            "'circuit_breaker.failure_threshold' must be a positive integer"
+        )
+    if slow_call_seconds is not None and (
+        not isinstance(slow_call_seconds, (int, float))
+        or isinstance(slow_call_seconds, bool)
+        or slow_call_seconds <= 0
+    ):
+        raise ValueError(
+            "'circuit_breaker.slow_call_seconds' must be a positive number"
+        )
+    if not isinstance(reset_seconds, (int, float)) or reset_seconds <= 0:
+        raise ValueError("'circuit_breaker.reset_seconds' must be a positive number")
+
+    return CircuitBreakerSettings(
+        failure_threshold=failure_threshold,
+        slow_call_seconds=(
+            float(slow_call_seconds) if slow_call_seconds is not None else None
+        ),
+        reset_seconds=float(reset_seconds),
+    )
 
 
 __settings = None
@@ -62,5 +272,9 @@ def settings() -> Settings:
         languages=cast(List[str], languages),
         translate_from=translate_from,
         translate_to=translate_to,
+        cache=_parse_cache_settings(data.get("cache")),
+        call_sites=_parse_call_sites(data.get("call_sites")),
+        hedging=_parse_hedging_settings(data.get("hedging")),
+        circuit_breaker=_parse_circuit_breaker_settings(data.get("circuit_breaker")),
     )
     return __settings
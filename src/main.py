@@ -2,11 +2,14 @@
 
 import argparse
 import os
-from typing import List
+from typing import List, Optional
 
 import yaml
 
+from ai_cache import disable_response_cache
 from commands.character import handle_character_command, setup_character_parser
+from commands.recordings import handle_recordings_command, setup_recordings_parser
+from deadline import DeadlineExceeded, deadline
 from tracing import (
     LogLevel,
     log_enter,
@@ -15,6 +18,7 @@ from tracing import (
     log_info,
     set_log_level,
 )
+from usage import format_usage_summary
 
 
 def main():
@@ -26,6 +30,22 @@ def main():
         default=0,
         help="Increase verbosity (use -v for debug, -vv for trace)",
     )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Bypass the response cache even if it is enabled in project.yml",
+    )
+    parser.add_argument(
+        "--usage",
+        action="store_true",
+        help="Print token usage, latency and cost per pipeline stage when done",
+    )
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        metavar="SECONDS",
+        help="Time budget for the command's LLM calls; calls still running when it is spent are cancelled",
+    )
 
     subparsers = parser.add_subparsers(dest="command", help="Available commands")
 
@@ -47,6 +67,9 @@ def main():
     # Character commands
     setup_character_parser(subparsers)
 
+    # Recordings maintenance commands
+    setup_recordings_parser(subparsers)
+
     # Extract characters command
     extract_parser = subparsers.add_parser(
         "extract_characters", help="Extract characters from a chapter"
@@ -55,6 +78,11 @@ def main():
         "chapter_path",
         help="Path to the chapter text file",
     )
+    extract_parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue an interrupted extraction of this chapter instead of starting over",
+    )
 
     # Translate all characters command
     translate_all_parser = subparsers.add_parser(
@@ -65,6 +93,23 @@ def main():
         "chapter_path",
         help="Path to the chapter text file for translation context",
     )
+    # A batch job sends one request per field, so it cannot be combined with --bulk
+    translate_all_mode = translate_all_parser.add_mutually_exclusive_group()
+    translate_all_mode.add_argument(
+        "--bulk",
+        action="store_true",
+        help="Translate each character with one structured request instead of one per field",
+    )
+    translate_all_mode.add_argument(
+        "--batch",
+        choices=["openai", "local"],
+        help="Send all field translations as one batch job (openai: the Batch API, local: a file-based stand-in)",
+    )
+    translate_all_parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip the characters an interrupted run already translated",
+    )
 
     args = parser.parse_args()
 
@@ -76,6 +121,9 @@ def main():
     else:
         set_log_level(LogLevel.NORMAL)
 
+    if args.no_cache:
+        disable_response_cache()
+
     log_enter("main")
     log_info(
         "Log level set to {}".format(
@@ -83,16 +131,29 @@ def main():
         )
     )
 
-    if args.command == "init":
-        handle_init(args.from_lang, args.to_langs)
-    elif args.command == "extract_characters":
-        handle_extract_characters(args.chapter_path)
-    elif args.command == "translate_all_characters":
-        handle_translate_all_characters(args.chapter_path)
-    elif args.command == "character":
-        handle_character_command(args)
-    else:
-        parser.print_help()
+    try:
+        with deadline(args.deadline):
+            if args.command == "init":
+                handle_init(args.from_lang, args.to_langs)
+            elif args.command == "extract_characters":
+                handle_extract_characters(args.chapter_path, args.resume)
+            elif args.command == "translate_all_characters":
+                handle_translate_all_characters(
+                    args.chapter_path, args.bulk, args.batch, args.resume
+                )
+            elif args.command == "character":
+                handle_character_command(args)
+            elif args.command == "recordings":
+                handle_recordings_command(args)
+            else:
+                parser.print_help()
+    except DeadlineExceeded as e:
+        log_error(f"Stopped: {e}")
+        exit(1)
+    finally:
+        # Failed, interrupted and timed out runs spent tokens too
+        if args.usage:
+            print(format_usage_summary())
 
     log_exit("main")
 
@@ -134,7 +195,7 @@ def handle_init(from_lang: str, to_langs_str: str) -> None:
         log_error(f"Failed to create project.yml: {e}")
 
 
-def handle_extract_characters(chapter_path: str) -> None:
+def handle_extract_characters(chapter_path: str, resume: bool = False) -> None:
     log_info(f"Extracting characters from chapter: {chapter_path}")
 
     if not os.path.exists(chapter_path):
@@ -144,7 +205,7 @@ def handle_extract_characters(chapter_path: str) -> None:
     # Import here to avoid circular imports
     from extract_characters import extract_characters_from_chapter
 
-    success = extract_characters_from_chapter(chapter_path)
+    success = extract_characters_from_chapter(chapter_path, resume=resume)
 
     if success:
         print("Character extraction completed successfully")
@@ -153,7 +214,12 @@ def handle_extract_characters(chapter_path: str) -> None:
         exit(1)
 
 
-def handle_translate_all_characters(chapter_path: str) -> None:
+def handle_translate_all_characters(
+    chapter_path: str,
+    bulk: bool = False,
+    batch: Optional[str] = None,
+    resume: bool = False,
+) -> None:
     log_info(
         f"Translating all characters with untranslated parts using chapter: {chapter_path}"
     )
@@ -163,6 +229,8 @@ def handle_translate_all_characters(chapter_path: str) -> None:
         return
 
     # Import here to avoid circular imports
+    from batch import get_batch_transport
+    from checkpoint import checkpoint_for
     from commands.character import load_character_collection, save_character_collection
 
     collection = load_character_collection()
@@ -175,14 +243,31 @@ def handle_translate_all_characters(chapter_path: str) -> None:
     with open(chapter_path, "r", encoding="utf-8") as f:
         chapter_contents = f.read()
 
+    # Finished characters are journaled, so an interrupted run can resume
+    checkpoint = checkpoint_for("translate_all_characters", chapter_path, resume)
+
     # Translate all characters with untranslated parts
-    translated_count = collection.translate_all_characters(chapter_contents)
+    try:
+        translated_count = collection.translate_all_characters(
+            chapter_contents,
+            bulk=bulk,
+            batch=get_batch_transport(batch) if batch else None,
+            checkpoint=checkpoint,
+        )
+    except DeadlineExceeded as e:
+        # Keep the translations finished so far
+        log_error(f"Translation stopped: {e}")
+        save_character_collection(collection)
+        print("Time budget spent, saved the translations finished so far.")
+        exit(1)
 
     if translated_count > 0:
         save_character_collection(collection)
         print(f"Successfully translated {translated_count} character(s).")
     else:
         print("No characters needed translation.")
+    # Everything is saved, nothing left to resume
+    checkpoint.clear()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,540 @@
+"""Local OpenAI-compatible stand-in for the LLM API, for offline benchmarks.
+
+Point ``OPENROUTER_BASE_URL`` at a running server (``script/mock-llm serve``)
+and every ``ai()``/``agent()`` call is answered locally, deterministically and
+with configurable latency, error and rate-limit injection.
+"""
+
+import argparse
+import ast
+import json
+import os
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, cast
+
+# Rough characters-per-token ratio for the usage numbers we report
+CHARS_PER_TOKEN = 4
+
+# Size of the content pieces sent per event when streaming
+STREAM_CHUNK_CHARS = 16
+
+
+@dataclass
+class MockResponse:
+    content: Optional[str] = None
+    # (tool name, arguments) pairs to call instead of answering
+    tool_calls: List[Tuple[str, Dict[str, Any]]] = field(
+        default_factory=lambda: cast(List[Tuple[str, Dict[str, Any]]], [])
+    )
+
+
+Responder = Callable[[Dict[str, Any]], MockResponse]
+
+
+def _message_text(message: Dict[str, Any]) -> str:
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        # Content blocks, e.g. with cache_control markers
+        blocks = cast(List[Dict[str, Any]], content)
+        return "".join(str(block.get("text", "")) for block in blocks)
+    return str(content)
+
+
+def _messages(body: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return cast(List[Dict[str, Any]], body.get("messages") or [])
+
+
+def _last_user_text(body: Dict[str, Any]) -> str:
+    for message in reversed(_messages(body)):
+        if message.get("role") == "user":
+            return _message_text(message)
+    return ""
+
+
+def _system_text(body: Dict[str, Any]) -> str:
+    return "\n".join(
+        _message_text(m) for m in _messages(body) if m.get("role") == "system"
+    )
+
+
+class ScriptedResponder:
+    """Answer with the first rule whose pattern occurs in the latest user message."""
+
+    def __init__(
+        self,
+        rules: List[Tuple[str, MockResponse]],
+        default: Optional[MockResponse] = None,
+    ) -> None:
+        self.rules = rules
+        self.default = default or MockResponse(content="OK")
+
+    def __call__(self, body: Dict[str, Any]) -> MockResponse:
+        text = _last_user_text(body)
+        for pattern, response in self.rules:
+            if pattern in text:
+                return response
+        return self.default
+
+
+def _section(text: str, title: str) -> str:
+    """Return the body of a Context section ("** TITLE **") up to the next one."""
+    match = re.search(
+        rf"\*\* {re.escape(title.upper())} \*\*\n(.*?)(?=\n\*\* [A-Z _]+ \*\*\n|\Z)",
+        text,
+        re.DOTALL,
+    )
+    return match.group(1) if match else ""
+
+
+class PipelineResponder:
+    """Plausible answers to the prompts of the fantranslate pipeline.
+
+    Detection returns the known characters mentioned in the chapter but not
+    yet in the collection, the extraction agent creates them in one bulk tool call,
+    judges answer YES and translations are tagged copies of their input.
+    """
+
+    def __init__(self, characters: List[str]) -> None:
+        self.characters = characters
+
+    def __call__(self, body: Dict[str, Any]) -> MockResponse:
+        system = _system_text(body)
+        user = _last_user_text(body)
+        messages = _messages(body)
+
+        if body.get("tools"):
+            if messages and messages[-1].get("role") == "tool":
+                return MockResponse(content="All requested characters were created.")
+            return MockResponse(tool_calls=self._extraction_calls(user))
+        if "character detection judge" in system:
+            return MockResponse(content=json.dumps({"characters": self._detect(user)}))
+        if "YES or NO" in system:
+            if body.get("response_format") or "JSON schema" in user:
+                return MockResponse(content=json.dumps({"answer": "YES"}))
+            return MockResponse(content="YES")
+        if "Return ONLY a JSON object" in user:
+            return MockResponse(content=json.dumps(self._bulk_translation(user)))
+        if user.startswith("Translate"):
+            return MockResponse(content=f"[translated] {user[:40]}")
+        return MockResponse(content="A short mock summary of the chapter.")
+
+    def _detect(self, user: str) -> List[str]:
+        chapter = _section(user, "Chapter Text")
+        existing = _section(user, "Existing Characters")
+        return [
+            name for name in self.characters if name in chapter and name not in existing
+        ]
+
+    def _extraction_calls(self, user: str) -> List[Tuple[str, Dict[str, Any]]]:
+        match = re.search(r"from this chapter: (\[.*?\])", user)
+        names: List[Any] = []
+        if match:
+            try:
+                names = list(ast.literal_eval(match.group(1)))
+            except (ValueError, SyntaxError):
+                pass
+        if not names:
+            return []
+        characters = [{"name": str(name)} for name in names]
+        return [("UpsertCharacters", {"characters": characters})]
+
+    def _bulk_translation(self, user: str) -> Dict[str, str]:
+        match = re.search(r"to (\w+): ([\w, ]+)\.", user)
+        if not match:
+            return {}
+        language, ids = match.groups()
+        return {
+            field_id.strip(): f"[{language}] {field_id.strip()}"
+            for field_id in ids.split(",")
+        }
+
+
+@dataclass
+class ServerStats:
+    requests: int = 0
+    errors: int = 0
+    rate_limited: int = 0
+    in_flight: int = 0
+    max_in_flight: int = 0
+
+
+class MockLLMServer:
+    """Threaded HTTP server speaking the OpenAI chat completions API.
+
+    Every request waits ``latency`` (plus up to ``jitter``) seconds, then fails
+    with a 500 with probability ``error_rate``, or a 429 carrying Retry-After
+    with probability ``rate_limit_rate``, and otherwise answers via responder.
+    Injected failures come from a seeded generator, so runs are repeatable.
+    """
+
+    def __init__(
+        self,
+        responder: Optional[Responder] = None,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        retry_after: float = 1.0,
+        seed: int = 0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ) -> None:
+        self.responder: Responder = responder or ScriptedResponder([])
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.stats = ServerStats()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._server = ThreadingHTTPServer((host, port), _handler_for(self))
+        self._server.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host!s}:{port}/v1"
+
+    def serve_forever(self) -> None:
+        self._server.serve_forever(poll_interval=0.1)
+
+    def start(self) -> "MockLLMServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "MockLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+    def draw(self) -> Tuple[float, float]:
+        """Return (delay, failure roll) for the next request."""
+        with self._lock:
+            return self._random.uniform(0, self.jitter), self._random.random()
+
+    def begin_request(self) -> None:
+        with self._lock:
+            self.stats.requests += 1
+            self.stats.in_flight += 1
+            self.stats.max_in_flight = max(
+                self.stats.max_in_flight, self.stats.in_flight
+            )
+
+    def end_request(self, status: int) -> None:
+        with self._lock:
+            self.stats.in_flight -= 1
+            if status == 429:
+                self.stats.rate_limited += 1
+            elif status >= 500:
+                self.stats.errors += 1
+
+
+def _usage(body: Dict[str, Any], response: MockResponse) -> Dict[str, int]:
+    prompt_chars = sum(len(_message_text(m)) for m in _messages(body))
+    completion_chars = len(response.content or "") + len(
+        json.dumps(response.tool_calls)
+    )
+    prompt_tokens = prompt_chars // CHARS_PER_TOKEN + 1
+    completion_tokens = completion_chars // CHARS_PER_TOKEN + 1
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+def _tool_call(index: int, name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "index": index,
+        "id": f"call_{index}",
+        "type": "function",
+        "function": {"name": name, "arguments": json.dumps(arguments)},
+    }
+
+
+def _completion(body: Dict[str, Any], response: MockResponse) -> Dict[str, Any]:
+    message: Dict[str, Any] = {"role": "assistant", "content": response.content}
+    if response.tool_calls:
+        message["tool_calls"] = [
+            {k: v for k, v in _tool_call(i, name, args).items() if k != "index"}
+            for i, (name, args) in enumerate(response.tool_calls)
+        ]
+    return {
+        "id": "chatcmpl-mock",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "mock"),
+        "choices": [
+            {
+                "index": 0,
+                "message": message,
+                "finish_reason": "tool_calls" if response.tool_calls else "stop",
+            }
+        ],
+        "usage": _usage(body, response),
+    }
+
+
+def _stream_events(
+    body: Dict[str, Any], response: MockResponse
+) -> Iterator[Dict[str, Any]]:
+    def chunk(delta: Dict[str, Any], finish: Optional[str] = None) -> Dict[str, Any]:
+        return {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+        }
+
+    yield chunk({"role": "assistant", "content": ""})
+    content = response.content or ""
+    for start in range(0, len(content), STREAM_CHUNK_CHARS):
+        yield chunk({"content": content[start : start + STREAM_CHUNK_CHARS]})
+    for i, (name, args) in enumerate(response.tool_calls):
+        yield chunk({"tool_calls": [_tool_call(i, name, args)]})
+    yield chunk({}, "tool_calls" if response.tool_calls else "stop")
+
+    stream_options = cast(Dict[str, Any], body.get("stream_options") or {})
+    if stream_options.get("include_usage"):
+        usage = chunk({})
+        usage["choices"] = []
+        usage["usage"] = _usage(body, response)
+        yield usage
+
+
+def _handler_for(server: MockLLMServer) -> Any:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass  # Keep benchmark output clean
+
+        def do_POST(self) -> None:
+            length = int(self.headers.get("content-length") or 0)
+            try:
+                body = cast(
+                    Dict[str, Any], json.loads(self.rfile.read(length) or b"{}")
+                )
+            except ValueError:
+                self._send_json(400, {"error": {"message": "Invalid JSON"}})
+                return
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_json(404, {"error": {"message": f"No route {self.path}"}})
+                return
+
+            server.begin_request()
+            status = 200
+            try:
+                delay, roll = server.draw()
+                time.sleep(server.latency + delay)
+                if roll < server.error_rate:
+                    status = 500
+                    self._send_json(status, {"error": {"message": "Injected error"}})
+                elif roll < server.error_rate + server.rate_limit_rate:
+                    status = 429
+                    self._send_json(
+                        status,
+                        {"error": {"message": "Injected rate limit"}},
+                        {"retry-after": f"{server.retry_after:g}"},
+                    )
+                else:
+                    response = server.responder(body)
+                    if body.get("stream"):
+                        self._send_stream(body, response)
+                    else:
+                        self._send_json(status, _completion(body, response))
+            finally:
+                server.end_request(status)
+
+        def _send_json(
+            self,
+            status: int,
+            payload: Dict[str, Any],
+            headers: Optional[Dict[str, str]] = None,
+        ) -> None:
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("content-type", "application/json")
+            self.send_header("content-length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _send_stream(self, body: Dict[str, Any], response: MockResponse) -> None:
+            self.send_response(200)
+            self.send_header("content-type", "text/event-stream")
+            self.send_header("connection", "close")
+            self.end_headers()
+            for event in _stream_events(body, response):
+                self.wfile.write(f"data: {json.dumps(event)}\n\n".encode())
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+            self.close_connection = True
+
+    return Handler
+
+
+_SYLLABLES = ["ar", "bel", "cor", "dan", "el", "fi", "gor", "hal", "is", "jor"] + [
+    "ka",
+    "lin",
+    "mor",
+    "nel",
+    "or",
+    "pra",
+    "quin",
+    "ros",
+    "sel",
+    "tor",
+]
+
+_SENTENCES = [
+    "{a} walked into the hall and greeted {b}.",
+    "{a} did not trust {b}, but said nothing.",
+    "Later that evening {a} told {b} about the letter.",
+    "{a} laughed, and even {b} smiled for once.",
+    "The road was long, and {a} and {b} travelled in silence.",
+    "{a} asked {b} where the others had gone.",
+]
+
+
+@dataclass
+class Corpus:
+    directory: str
+    chapters: List[str]
+    characters: List[str]
+
+
+def _character_names(rng: random.Random, count: int) -> List[str]:
+    names: List[str] = []
+    while len(names) < count:
+        first = "".join(rng.choice(_SYLLABLES) for _ in range(2)).capitalize()
+        last = "".join(rng.choice(_SYLLABLES) for _ in range(3)).capitalize()
+        name = f"{first} {last}"
+        if name not in names:
+            names.append(name)
+    return names
+
+
+def generate_corpus(
+    directory: str,
+    chapters: int,
+    characters: int,
+    sentences_per_chapter: int = 40,
+    seed: int = 0,
+) -> Corpus:
+    """Write N synthetic chapters mentioning M characters, plus a project.yml.
+
+    The character names are written to characters.txt so a pipeline mock
+    server can answer detection prompts for this corpus.
+    """
+    rng = random.Random(seed)
+    names = _character_names(rng, characters)
+    os.makedirs(directory, exist_ok=True)
+
+    paths: List[str] = []
+    for number in range(1, chapters + 1):
+        cast_size = min(len(names), rng.randint(2, 8))
+        chapter_cast = rng.sample(names, cast_size) if names else []
+        lines = [f"Chapter {number}", ""]
+        for _ in range(sentences_per_chapter):
+            if len(chapter_cast) < 2:
+                lines.append("Nothing happened for a long time.")
+                continue
+            a, b = rng.sample(chapter_cast, 2)
+            lines.append(rng.choice(_SENTENCES).format(a=a, b=b))
+        path = os.path.join(directory, f"chapter_{number:03d}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        paths.append(path)
+
+    with open(os.path.join(directory, "characters.txt"), "w", encoding="utf-8") as f:
+        f.write("\n".join(names) + "\n")
+    project_file = os.path.join(directory, "project.yml")
+    if not os.path.exists(project_file):
+        with open(project_file, "w", encoding="utf-8") as f:
+            f.write("languages: [ru]\ntranslate_from: en\ntranslate_to: ru\n")
+
+    return Corpus(directory=directory, chapters=paths, characters=names)
+
+
+def load_corpus_characters(directory: str) -> List[str]:
+    with open(os.path.join(directory, "characters.txt"), "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Mock LLM server for benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve = subparsers.add_parser("serve", help="Run the mock server")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--latency", type=float, default=0.0, help="Seconds")
+    serve.add_argument("--jitter", type=float, default=0.0, help="Seconds")
+    serve.add_argument("--error-rate", type=float, default=0.0)
+    serve.add_argument("--rate-limit-rate", type=float, default=0.0)
+    serve.add_argument("--retry-after", type=float, default=1.0, help="Seconds")
+    serve.add_argument("--seed", type=int, default=0)
+    serve.add_argument(
+        "--corpus", help="Corpus directory whose characters the pipeline answers use"
+    )
+
+    corpus = subparsers.add_parser("corpus", help="Generate a synthetic corpus")
+    corpus.add_argument("directory")
+    corpus.add_argument("--chapters", type=int, default=10)
+    corpus.add_argument("--characters", type=int, default=20)
+    corpus.add_argument("--sentences", type=int, default=40)
+    corpus.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args()
+    if args.command == "corpus":
+        result = generate_corpus(
+            args.directory, args.chapters, args.characters, args.sentences, args.seed
+        )
+        print(
+            f"Wrote {len(result.chapters)} chapters with "
+            f"{len(result.characters)} characters to {result.directory}"
+        )
+        return
+
+    characters = load_corpus_characters(args.corpus) if args.corpus else []
+    server = MockLLMServer(
+        PipelineResponder(characters),
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        seed=args.seed,
+        host=args.host,
+        port=args.port,
+    )
+    print(f"Mock LLM listening on {server.base_url}")
+    print(f"export OPENROUTER_BASE_URL={server.base_url}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"Served: {server.stats}")
+
+
+if __name__ == "__main__":
+    main()
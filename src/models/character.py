@@ -1,10 +1,17 @@
+import asyncio
+import contextvars
+import functools
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional, Union, cast
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar, Union, cast
 
+from helpers.json_schema import parse_json_reply
 from helpers.settings import settings
+from usage import stage
 
 from .translation_string import TranslationString
 
+T = TypeVar("T")
+
 
 def _ensure_ts(value: Union[str, TranslationString]) -> TranslationString:
     if isinstance(value, str):
@@ -15,6 +22,53 @@ def _ensure_ts(value: Union[str, TranslationString]) -> TranslationString:
     return value
 
 
+async def _translate_fields(
+    system_prompt: str,
+    fields: List[Tuple[str, TranslationString, str]],
+    language: str,
+) -> None:
+    """Translate all fields concurrently and store results on their strings."""
+    from ai import ai_async
+
+    results = await asyncio.gather(
+        *(
+            ai_async(system_prompt, prompt, call_site="field_translation")
+            for _, _, prompt in fields
+        ),
+        return_exceptions=True,
+    )
+
+    error: Optional[BaseException] = None
+    for (_, ts, _), result in zip(fields, results):
+        if isinstance(result, BaseException):
+            error = error or result
+        elif result:
+            setattr(ts, language, result.strip())
+
+    # Keep whatever succeeded, then surface the first failure like before
+    if error is not None:
+        raise error
+
+
+async def _in_thread(fn: Callable[..., T], *args: Any) -> T:
+    """Run a blocking call on the loop's default executor, in the caller's context."""
+    loop = asyncio.get_running_loop()
+    call = functools.partial(contextvars.copy_context().run, fn, *args)
+    return await loop.run_in_executor(None, call)
+
+
+def _bulk_translation_schema(field_ids: List[str]) -> Dict[str, Any]:
+    """Response schema of a bulk translation: each field id maps to its text, or null."""
+    return {
+        "type": "object",
+        "properties": {
+            field_id: {"type": ["string", "null"]} for field_id in field_ids
+        },
+        "required": field_ids,
+        "additionalProperties": False,
+    }
+
+
 @dataclass
 class TranslatedCharacter:
     name: str
@@ -128,16 +182,63 @@ class Character:
             ],
         )
 
-    def translate(self, chapter_contents: str) -> None:
-        """Translate character properties using AI based on chapter context."""
-        from ai import ai
-        from helpers.context import Context
-        from helpers.settings import settings
-        from tracing import log_enter, log_exit, log_info
+    def translatable_fields(
+        self, language: str
+    ) -> List[Tuple[str, TranslationString, str]]:
+        """List (field id, translation string, prompt) for every translatable property."""
+        fields: List[Tuple[str, TranslationString, str]] = []
 
-        log_enter("translate_character")
+        if self.name.original_text:
+            fields.append(
+                (
+                    "name",
+                    self.name,
+                    f"Translate the character's name '{self.name.original_text}' to {language}.",
+                )
+            )
 
-        s = settings()
+        for i, short_name in enumerate(self.short_names):
+            if short_name.original_text:
+                fields.append(
+                    (
+                        f"short_name_{i}",
+                        short_name,
+                        f"Translate the character's short name '{short_name.original_text}' to {language}.",
+                    )
+                )
+
+        if self.gender and self.gender.original_text:
+            fields.append(
+                (
+                    "gender",
+                    self.gender,
+                    f"Translate the character's gender '{self.gender.original_text}' to {language}.",
+                )
+            )
+
+        for i, char in enumerate(self.characteristics):
+            if char.text.original_text:
+                fields.append(
+                    (
+                        f"characteristic_{i}",
+                        char.text,
+                        f"Translate this character description: '{char.text.original_text}' to {language}.",
+                    )
+                )
+
+        return fields
+
+    def translation_prompt(
+        self, chapter_contents: str, with_ids: bool = False
+    ) -> Optional[str]:
+        """System prompt for translating this character's fields.
+
+        It holds a summary of the chapter focused on the character, or None
+        when the summary could not be made.
+        """
+        from ai import ai
+        from helpers.context import Context
+        from tracing import log_info
 
         # Step 1: Get chapter summary focusing on this character
         summary_prompt = f"""Summarize the chapter focusing on the character "{self.name.original_text}".
@@ -145,11 +246,11 @@ Include key events, interactions, and descriptions related to this character.
 Keep the summary concise but informative."""
 
         log_info("Getting chapter summary for character")
-        chapter_summary = ai(summary_prompt, chapter_contents)
+        with stage("character_summary"):
+            chapter_summary = ai(summary_prompt, chapter_contents, call_site="summary")
         if not chapter_summary:
             log_info("Failed to get chapter summary")
-            log_exit("translate_character")
-            return
+            return None
 
         # Step 2: Build context
         context = Context()
@@ -157,64 +258,149 @@ Keep the summary concise but informative."""
             "PROBLEM",
             "We need to translate character information from a book chapter to make it available in multiple languages.",
         )
-        context = context.add("CHAPTER SUMMARY", chapter_summary)
-        context = context.wrap("CHARACTER_DATA", self.to_xml())
+        context = context.add("CHAPTER SUMMARY", chapter_summary, volatile=True)
+        context = context.wrap(
+            "CHARACTER_DATA", self.to_xml(with_ids=with_ids), volatile=True
+        )
+        # The translator instructions are the prefix shared by every character
+        context = context.pipe("character_translator")
+        return context.build(cache_friendly=True)
+
+    def translate(self, chapter_contents: str, bulk: bool = False) -> None:
+        """Blocking wrapper around translate_async(), for code without an event loop.
+
+        Raises RuntimeError when called from a running event loop, whose
+        coroutines should await translate_async() instead.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            asyncio.run(self.translate_async(chapter_contents, bulk=bulk))
+            return
+        raise RuntimeError(
+            "Character.translate() cannot run inside an event loop, "
+            "await Character.translate_async() instead"
+        )
 
-        # Step 3: Translate each property independently
-        system_prompt = context.pipe("character_translator").build()
+    async def translate_async(self, chapter_contents: str, bulk: bool = False) -> None:
+        """Translate character properties using AI based on chapter context.
 
-        # Translate name
-        if self.name.original_text:
-            name_prompt = f"Translate the character's name '{self.name.original_text}' to {s.translate_to}."
-            translated_name = ai(system_prompt, name_prompt)
-            if translated_name:
-                setattr(self.name, s.translate_to, translated_name.strip())
+        The summary and bulk requests run on a worker thread, so the event
+        loop stays free while they are in flight.
 
-        # Translate short names
-        for short_name in self.short_names:
-            if short_name.original_text:
-                sn_prompt = f"Translate the character's short name '{short_name.original_text}' to {s.translate_to}."
-                translated_sn = ai(system_prompt, sn_prompt)
-                if translated_sn:
-                    setattr(short_name, s.translate_to, translated_sn.strip())
+        Args:
+            chapter_contents: The chapter text to use as context for translation
+            bulk: Translate every untranslated field with a single JSON request,
+                falling back to per-field requests for fields it leaves out
+        """
+        from helpers.settings import settings
+        from tracing import log_enter, log_exit, log_info
 
-        # Translate gender
-        if self.gender and self.gender.original_text:
-            gender_prompt = f"Translate the character's gender '{self.gender.original_text}' to {s.translate_to}."
-            translated_gender = ai(system_prompt, gender_prompt)
-            if translated_gender:
-                setattr(self.gender, s.translate_to, translated_gender.strip())
+        log_enter("translate_character")
 
-        # Translate characteristics
-        for char in self.characteristics:
-            if char.text.original_text:
-                char_prompt = f"Translate this character description: '{char.text.original_text}' to {s.translate_to}."
-                translated_char = ai(system_prompt, char_prompt)
-                if translated_char:
-                    setattr(char.text, s.translate_to, translated_char.strip())
+        s = settings()
+        system_prompt = await _in_thread(
+            self.translation_prompt, chapter_contents, bulk
+        )
+        if system_prompt is None:
+            log_exit("translate_character")
+            return
+
+        fields = self.translatable_fields(s.translate_to)
+        if bulk:
+            # Step 3a: One structured request for everything not yet translated
+            fields = [f for f in fields if getattr(f[1], s.translate_to) is None]
+            with stage("field_translation"):
+                fields = await _in_thread(
+                    self._translate_bulk, system_prompt, fields, s.translate_to
+                )
+            if fields:
+                log_info(
+                    f"Bulk translation missed {len(fields)} field(s), translating them one by one"
+                )
+
+        # Step 3: Translate every remaining property independently, all at once
+        if fields:
+            with stage("field_translation"):
+                await _translate_fields(system_prompt, fields, s.translate_to)
 
         log_exit("translate_character")
 
-    def to_xml(self) -> str:
-        """Serialize character to XML format for AI consumption."""
+    def _translate_bulk(
+        self,
+        system_prompt: str,
+        fields: List[Tuple[str, TranslationString, str]],
+        language: str,
+    ) -> List[Tuple[str, TranslationString, str]]:
+        """Translate fields with one JSON request and return the ones it missed."""
+        from ai import ai
+        from tracing import log_info
+
+        if not fields:
+            return []
+
+        field_ids = [field_id for field_id, _, _ in fields]
+        bulk_prompt = (
+            f"Translate the following fields of <CHARACTER_DATA> to {language}: "
+            f"{', '.join(field_ids)}.\n\n"
+            "Field ids are given by the id attribute of each element. "
+            "Return ONLY a JSON object that maps every field id to its translated text, "
+            'for example {"name": "...", "short_name_0": "..."}, '
+            "with null for a field you cannot translate. "
+            "Do not include any other text, explanations, or formatting."
+        )
+
+        response = ai(
+            system_prompt,
+            bulk_prompt,
+            call_site="field_translation",
+            response_schema=_bulk_translation_schema(field_ids),
+        )
+        data = parse_json_reply(response) if response else None
+        translations = cast(Dict[str, Any], data) if isinstance(data, dict) else {}
+        log_info(f"Bulk translation returned {len(translations)} field(s)")
+
+        missing: List[Tuple[str, TranslationString, str]] = []
+        for field in fields:
+            translated = translations.get(field[0])
+            if isinstance(translated, str) and translated.strip():
+                setattr(field[1], language, translated.strip())
+            else:
+                missing.append(field)
+        return missing
+
+    def to_xml(self, with_ids: bool = False) -> str:
+        """Serialize character to XML format for AI consumption.
+
+        With ``with_ids`` every element carries the field id used by
+        ``translatable_fields`` so the AI can answer per field.
+        """
+
+        def id_attr(field_id: str) -> str:
+            return f" id='{field_id}'" if with_ids else ""
+
         xml_parts = ["<character>"]
 
-        xml_parts.append(f"<name>{self.name.original_text}</name>")
+        xml_parts.append(f"<name{id_attr('name')}>{self.name.original_text}</name>")
 
         if self.short_names:
             xml_parts.append("<short_names>")
-            for sn in self.short_names:
-                xml_parts.append(f"<name>{sn.original_text}</name>")
+            for i, sn in enumerate(self.short_names):
+                xml_parts.append(
+                    f"<name{id_attr(f'short_name_{i}')}>{sn.original_text}</name>"
+                )
             xml_parts.append("</short_names>")
 
         if self.gender:
-            xml_parts.append(f"<gender>{self.gender.original_text}</gender>")
+            xml_parts.append(
+                f"<gender{id_attr('gender')}>{self.gender.original_text}</gender>"
+            )
 
         if self.characteristics:
             xml_parts.append("<characteristics>")
-            for char in self.characteristics:
+            for i, char in enumerate(self.characteristics):
                 xml_parts.append(
-                    f"<characteristic confidence='{char.confidence}'>{char.text.original_text}</characteristic>"
+                    f"<characteristic{id_attr(f'characteristic_{i}')} confidence='{char.confidence}'>{char.text.original_text}</characteristic>"
                 )
             xml_parts.append("</characteristics>")
 
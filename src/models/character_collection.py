@@ -1,17 +1,27 @@
-from typing import Any, Dict, List, Optional
+import os
+import threading
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Set
 
 import yaml
 
 from helpers.fuzzy import FuzzyIndex
 from helpers.settings import settings  # type: ignore
+from usage import stage
 
 from .character import Character, TranslatedCharacter
+from .translation_string import TranslationString
+
+if TYPE_CHECKING:
+    from batch import BatchTransport
+    from checkpoint import Checkpoint
 
 
 class CharacterCollection:
     def __init__(self):
         self.characters: List[Character] = []
         self._name_index: FuzzyIndex = FuzzyIndex()
+        # Agent tools run concurrently; hold this around read-modify-write sequences
+        self.lock = threading.RLock()
 
     def _add_to_index(self, character: Character):
         # Add full name
@@ -21,9 +31,10 @@ class CharacterCollection:
             self._name_index.add(short_name.original_text, character)
 
     def _rebuild_index(self):
-        self._name_index = FuzzyIndex()
-        for character in self.characters:
-            self._add_to_index(character)
+        with self.lock:
+            self._name_index = FuzzyIndex()
+            for character in self.characters:
+                self._add_to_index(character)
 
     def rebuild_index(self):
         """Public method to rebuild the search index."""
@@ -35,18 +46,33 @@ class CharacterCollection:
             return None
 
         max_distance = 1 if len(query) <= 4 else 2
-        _, character = self._name_index.search(query, max_distance)
+        with self.lock:
+            _, character = self._name_index.search(query, max_distance)
         return character
 
+    def get(self, name: str) -> Optional[Character]:
+        """The character whose name or a short name is name, ignoring case."""
+        name = name.strip().lower()
+        with self.lock:
+            for character in self.characters:
+                names = [character.name] + character.short_names
+                if any(n.original_text.strip().lower() == name for n in names):
+                    return character
+        return None
+
     def add_character(self, character: Character):
         """Add a character to the collection."""
-        self.characters.append(character)
-        self._add_to_index(character)
+        with self.lock:
+            self.characters.append(character)
+            self._add_to_index(character)
 
     def remove_character(self, name: str):
         """Remove a character from the collection."""
-        self.characters = [c for c in self.characters if c.name.original_text != name]
-        self._rebuild_index()
+        with self.lock:
+            self.characters = [
+                c for c in self.characters if c.name.original_text != name
+            ]
+            self._rebuild_index()
 
     def get_character_translation(
         self, name: str, language: str
@@ -59,13 +85,25 @@ class CharacterCollection:
 
     def get_all_characters(self, language: str) -> List[TranslatedCharacter]:
         """Get all characters translated to the specified language."""
-        return [char.get_translated(language) for char in self.characters]
-
-    def translate_all_characters(self, chapter_contents: str) -> int:
+        with self.lock:
+            return [char.get_translated(language) for char in self.characters]
+
+    def translate_all_characters(
+        self,
+        chapter_contents: str,
+        bulk: bool = False,
+        batch: Optional["BatchTransport"] = None,
+        checkpoint: Optional["Checkpoint"] = None,
+    ) -> int:
         """Translate all characters that have untranslated parts using AI.
 
         Args:
             chapter_contents: The chapter text to use as context for translation
+            bulk: Translate each character with a single structured request
+            batch: Send every pending field translation as one batch through
+                this transport instead of making interactive requests
+            checkpoint: Journal each translated character here, and restore
+                the characters it already holds instead of translating them
 
         Returns:
             The number of characters that were translated
@@ -76,18 +114,89 @@ class CharacterCollection:
         log_enter("translate_all_characters")
 
         s = settings()
+        if batch is not None:
+            translated_count = self._translate_in_batch(
+                chapter_contents, batch, s.translate_to, checkpoint
+            )
+            log_info(f"Translated {translated_count} characters")
+            log_exit("translate_all_characters")
+            return translated_count
+
         translated_count = 0
 
-        for character in self.characters:
+        for i, character in enumerate(self.characters):
+            unit = f"translated:{character.name.original_text}"
+            if checkpoint is not None and checkpoint.done(unit):
+                # Translated before the previous run was interrupted
+                self.characters[i] = Character.from_dict(checkpoint.result(unit))
+                translated_count += 1
+                continue
             if character.has_untranslated_parts(s.translate_to):
                 log_info(f"Translating character: {character.name.original_text}")
-                character.translate(chapter_contents)
+                character.translate(chapter_contents, bulk=bulk)
                 translated_count += 1
+                if checkpoint is not None:
+                    checkpoint.record(unit, character.to_dict())
+        self._rebuild_index()
 
         log_info(f"Translated {translated_count} characters")
         log_exit("translate_all_characters")
         return translated_count
 
+    def _translate_in_batch(
+        self,
+        chapter_contents: str,
+        transport: "BatchTransport",
+        language: str,
+        checkpoint: Optional["Checkpoint"] = None,
+    ) -> int:
+        """Translate every untranslated field with one batch and apply the results.
+
+        Character summaries are still made interactively, since the field
+        prompts are built from them. Fields the batch leaves out stay
+        untranslated and are picked up by the next run.
+        """
+        from ai import chat_request_body
+        from batch import BatchRequest, run_batch
+        from tracing import log_info
+
+        # A resumed run waits for the batch it already paid for; only the
+        # field each reply belongs to is needed then, not a new request
+        resuming = checkpoint is not None and checkpoint.done("batch")
+        requests: List[BatchRequest] = []
+        targets: Dict[str, TranslationString] = {}
+        for index, character in enumerate(self.characters):
+            if not character.has_untranslated_parts(language):
+                continue
+            system_prompt: Optional[str] = None
+            if not resuming:
+                log_info(
+                    f"Preparing batch for character: {character.name.original_text}"
+                )
+                system_prompt = character.translation_prompt(chapter_contents)
+                if system_prompt is None:
+                    continue
+            for field_id, ts, prompt in character.translatable_fields(language):
+                if getattr(ts, language) is not None:
+                    continue
+                custom_id = f"{index}:{field_id}"
+                targets[custom_id] = ts
+                if system_prompt is not None:
+                    body = chat_request_body(
+                        system_prompt, prompt, call_site="field_translation"
+                    )
+                    requests.append(BatchRequest(custom_id, body))
+
+        with stage("field_translation"):
+            replies = run_batch(transport, requests, checkpoint=checkpoint)
+
+        translated_characters: Set[str] = set()
+        for custom_id, reply in replies.items():
+            if custom_id in targets:
+                setattr(targets[custom_id], language, reply.strip())
+                translated_characters.add(custom_id.split(":")[0])
+        return len(translated_characters)
+
     def to_dict(self) -> List[Dict[str, Any]]:
         return [char.to_dict() for char in self.characters]
 
@@ -110,5 +219,8 @@ class CharacterCollection:
     def save(self, file_path: str):
         """Save the character collection to a YAML file."""
         data = self.to_dict()
-        with open(file_path, "w", encoding="utf-8") as f:
+        # Write a temporary file and swap it in, so a crash never leaves half a file
+        temp_path = f"{file_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
             yaml.dump(data, f, allow_unicode=True, sort_keys=False)
+        os.replace(temp_path, file_path)
@@ -0,0 +1,401 @@
+import gzip
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Generator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: locked with a lock file instead, see _file_lock()
+    fcntl = None
+
+# Default directory of the recordings made by memoise_for_tests
+RECORDINGS_DIR = ".ai_recordings"
+
+# Records of at least this many bytes of JSON are stored gzip-compressed, as
+# a "<key>\t@gzip:<size>" line followed by the payload and a newline; JSON
+# text never starts with "@", so both kinds of record share one log
+COMPRESS_MIN_BYTES = 1024
+COMPRESSED_PREFIX = b"@gzip:"
+
+# Set to record which recordings a run replays, for `recordings compact`
+TRACK_HITS_ENV = "AI_RECORDINGS_TRACK_HITS"
+
+# Without fcntl, a lock file this old was left behind by a crashed process
+LOCK_STALE_SECONDS = 60
+
+_stores: Dict[str, "RecordingStore"] = {}
+_stores_lock = threading.Lock()
+
+
+class RecordingStore:
+    """Recorded results of one function, indexed by recording key.
+
+    New recordings are appended to ``<name>.log``, one ``<key>\\t<json>``
+    line each (large ones gzip-framed, see COMPRESS_MIN_BYTES), instead of
+    rewriting a file. Loading only indexes the keys of the log; a recording
+    is decompressed and parsed the first time it is looked up. Recordings
+    in the older ``<name>.json`` format (one JSON object mapping keys to
+    results) are read as well; entries in the log win over them.
+
+    Several processes can share a store: appends are serialized with a
+    file lock, and lookups that miss pick up what the others appended.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        name: str,
+        encoder: Optional[Callable[[Any], Any]] = None,
+    ) -> None:
+        self.directory = directory
+        self.name = name
+        self.legacy_path = os.path.join(directory, f"{name}.json")
+        self.log_path = os.path.join(directory, f"{name}.log")
+        self.hits_path = os.path.join(directory, f"{name}.hits")
+        self._encoder = encoder
+        # key -> offset of its line in the log, and the values parsed so far
+        self._offsets: Dict[str, int] = {}
+        # How much of the log has been indexed, and which file that was
+        self._scanned = 0
+        self._log_id: Optional[Tuple[int, int]] = None
+        self._values: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self.has_legacy = False
+        self._track_hits = False
+        self._load()
+
+    def _load(self) -> None:
+        if os.path.exists(self.legacy_path):
+            try:
+                with open(self.legacy_path, "r", encoding="utf-8") as f:
+                    self._values.update(json.load(f))
+                self.has_legacy = bool(self._values)
+            except ValueError:
+                # A corrupted file is treated as having no recordings
+                pass
+        self._scan()
+
+    def _scan(self) -> None:
+        """Index the lines appended to the log since it was last scanned.
+
+        Only complete lines are indexed; a line another process is still
+        writing is picked up by a later scan. A log that compaction replaced
+        is indexed from the start.
+        """
+        try:
+            stat = os.stat(self.log_path)
+        except OSError:
+            return
+        if (stat.st_dev, stat.st_ino) != self._log_id:
+            self._log_id = (stat.st_dev, stat.st_ino)
+            self._offsets.clear()
+            self._scanned = 0
+        if stat.st_size == self._scanned:
+            return
+        with open(self.log_path, "rb") as f:
+            f.seek(self._scanned)
+            while True:
+                line = f.readline()
+                if not line.endswith(b"\n"):
+                    break
+                key, sep, data = line.partition(b"\t")
+                end = self._scanned + len(line)
+                if data.startswith(COMPRESSED_PREFIX):
+                    # Skip the payload without decompressing it
+                    size = _payload_size(data)
+                    payload = f.read(size + 1) if size is not None else b""
+                    if size is None or payload[size:] != b"\n":
+                        break
+                    end += size + 1
+                if sep:
+                    # The log wins over the legacy file
+                    self._values.pop(key.decode(), None)
+                    self._offsets[key.decode()] = self._scanned
+                self._scanned = end
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._values or key in self._offsets
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._values.keys() | self._offsets.keys())
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """The recorded (still serialized) result for key, or default.
+
+        On a miss, recordings appended by other processes since the last
+        lookup are indexed before giving up.
+        """
+        with self._lock:
+            return self._get_locked(key, default)
+
+    def _get_locked(self, key: str, default: Any = None) -> Any:
+        if key in self._values:
+            return self._values[key]
+        offset = self._offsets.get(key)
+        if offset is None:
+            self._scan()
+            offset = self._offsets.get(key)
+        if offset is None:
+            return default
+        found, value = self._read_at(offset)
+        if not found:
+            return default
+        self._values[key] = value
+        return value
+
+    def _read_at(self, offset: int) -> Tuple[bool, Any]:
+        try:
+            with open(self.log_path, "rb") as f:
+                f.seek(offset)
+                _, _, data = f.readline().partition(b"\t")
+                if data.startswith(COMPRESSED_PREFIX):
+                    data = gzip.decompress(f.read(_payload_size(data) or 0))
+            return True, json.loads(data)
+        except (ValueError, OSError, EOFError):
+            return False, None
+
+    def put(self, key: str, result: Any) -> bool:
+        """Append a recording; returns False if result is not JSON serializable.
+
+        Appends are serialized across processes with a lock on the log, so
+        parallel test workers and CLI runs never lose each other's entries.
+        With hit tracking on, the new recording counts as a hit of this run.
+        """
+        try:
+            data = json.dumps(result, default=self._encoder, ensure_ascii=False)
+        except (TypeError, ValueError):
+            return False
+        record = _encode_record(key, data)
+
+        with self._lock, self._locked_log() as fd:
+            self._scan()
+            if os.lseek(fd, 0, os.SEEK_END) > self._scanned:
+                # Nobody else is writing, so this is a record torn by a
+                # writer that crashed
+                os.ftruncate(fd, self._scanned)
+            if key not in self._offsets:
+                # Another process may have recorded the same call meanwhile
+                _write_all(fd, record)
+                self._scan()
+            self._values.pop(key, None)
+        self.record_hit(key)
+        return True
+
+    @contextmanager
+    def _locked_log(self) -> Generator[int, None, None]:
+        """The log, opened for appending, with its file lock held.
+
+        compact() replaces the log while holding the lock, so a lock won on
+        the file it replaced is dropped and taken on the new log instead.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        while True:
+            fd = os.open(self.log_path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                with _file_lock(self.log_path, fd):
+                    opened = os.fstat(fd)
+                    try:
+                        current = os.stat(self.log_path)
+                    except FileNotFoundError:
+                        continue
+                    if (opened.st_dev, opened.st_ino) == (
+                        current.st_dev,
+                        current.st_ino,
+                    ):
+                        yield fd
+                        return
+            finally:
+                os.close(fd)
+
+    def track_hits(self) -> None:
+        """Record the hits of this process, see record_hit()."""
+        self._track_hits = True
+        # An empty hits file still tells compaction the function was used
+        _append(self.hits_path, b"")
+
+    def record_hit(self, key: str, stored_key: Optional[str] = None) -> None:
+        """Note that a run replayed key, if hit tracking is on.
+
+        stored_key is the key the recording is actually stored under when
+        it was found by a legacy key; compaction moves it to key.
+        """
+        if self._track_hits:
+            _append(self.hits_path, f"{key}\t{stored_key or key}\n".encode())
+
+    def hits(self) -> Dict[str, Tuple[str, int]]:
+        """Tracked hits: key -> (key it is stored under, number of hits)."""
+        hits: Dict[str, Tuple[str, int]] = {}
+        if not os.path.exists(self.hits_path):
+            return hits
+        with open(self.hits_path, "r", encoding="utf-8") as f:
+            for line in f:
+                key, sep, stored_key = line.rstrip("\n").partition("\t")
+                if sep:
+                    hits[key] = (stored_key, hits.get(key, ("", 0))[1] + 1)
+        return hits
+
+    def stats(self) -> Dict[str, Any]:
+        """Entries, disk size, and what the tracked runs replayed."""
+        with self._lock:
+            self._scan()
+            keys = self._values.keys() | self._offsets.keys()
+        hits = self.hits()
+        live = {stored for stored, _ in hits.values() if stored in keys}
+        return {
+            "entries": len(keys),
+            "bytes": sum(
+                os.path.getsize(path)
+                for path in (self.legacy_path, self.log_path)
+                if os.path.exists(path)
+            ),
+            "tracked": os.path.exists(self.hits_path),
+            "live": len(live),
+            "hits": sum(count for _, count in hits.values()),
+        }
+
+    def compact(self) -> Tuple[int, int]:
+        """Rewrite the store with only the recordings the tracked runs hit.
+
+        Recordings found by a legacy key are stored under their current
+        key, the legacy JSON file is folded in and the hit log is reset.
+        Returns the number of recordings kept and dropped. Does nothing if
+        no hits were tracked for this function.
+        """
+        if not os.path.exists(self.hits_path):
+            return len(self), 0
+
+        with self._lock:
+            # Writers wait until the new log is in place, and what they
+            # appended before the lock was taken is picked up by the scan
+            with self._locked_log():
+                self._scan()
+                hits = self.hits()
+                keys = self._values.keys() | self._offsets.keys()
+                temp_path = f"{self.log_path}.tmp"
+                kept = 0
+                with open(temp_path, "wb") as f:
+                    for key, (stored_key, _) in hits.items():
+                        if stored_key not in keys:
+                            continue
+                        value = self._get_locked(stored_key)
+                        data = json.dumps(value, ensure_ascii=False)
+                        f.write(_encode_record(key, data))
+                        kept += 1
+                os.replace(temp_path, self.log_path)
+                for path in (self.legacy_path, self.hits_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+
+            self._values.clear()
+            self.has_legacy = False
+            self._scan()
+        return kept, len(keys) - kept
+
+
+def _encode_record(key: str, data: str) -> bytes:
+    """One record of the log: a JSON line, or a gzip-framed one if it is large."""
+    raw = data.encode("utf-8")
+    if len(raw) < COMPRESS_MIN_BYTES:
+        return f"{key}\t".encode() + raw + b"\n"
+    payload = gzip.compress(raw, mtime=0)
+    header = f"{key}\t".encode() + COMPRESSED_PREFIX + b"%d\n" % len(payload)
+    return header + payload + b"\n"
+
+
+def _payload_size(data: bytes) -> Optional[int]:
+    try:
+        return int(data[len(COMPRESSED_PREFIX) :])
+    except ValueError:
+        return None
+
+
+def _write_all(fd: int, data: bytes) -> None:
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view) :]
+
+
+def _append(path: str, data: bytes) -> None:
+    """Append data to path under the file lock."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        with _file_lock(path, fd):
+            _write_all(fd, data)
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def _file_lock(path: str, fd: int) -> Generator[None, None, None]:
+    """Hold an exclusive lock on path, open as fd, across processes.
+
+    Uses flock where available. Elsewhere the lock is a ``<path>.lock``
+    file created with O_EXCL, so writers are still serialized; a lock file
+    older than LOCK_STALE_SECONDS is taken over.
+    """
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        return
+
+    lock_path = f"{path}.lock"
+    while True:
+        try:
+            os.close(os.open(lock_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL))
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > LOCK_STALE_SECONDS:
+                    os.remove(lock_path)
+                    continue
+            except OSError:
+                continue
+            time.sleep(0.01)
+    try:
+        yield
+    finally:
+        os.remove(lock_path)
+
+
+def recording_names(directory: str = RECORDINGS_DIR) -> List[str]:
+    """Names of the functions that have recordings in directory."""
+    if not os.path.isdir(directory):
+        return []
+    return sorted(
+        {
+            os.path.splitext(entry)[0]
+            for entry in os.listdir(directory)
+            if entry.endswith((".json", ".log"))
+        }
+    )
+
+
+def get_recording_store(
+    name: str,
+    directory: str = RECORDINGS_DIR,
+    encoder: Optional[Callable[[Any], Any]] = None,
+) -> RecordingStore:
+    """The store of name in directory, loaded once per process.
+
+    Stores are kept per absolute directory, so a test that changes the
+    working directory gets a store of its own. With AI_RECORDINGS_TRACK_HITS
+    set, the store records which recordings the process replays.
+    """
+    path = os.path.abspath(directory)
+    with _stores_lock:
+        store = _stores.get(os.path.join(path, name))
+        if store is None:
+            store = RecordingStore(path, name, encoder)
+            if os.getenv(TRACK_HITS_ENV):
+                store.track_hits()
+            _stores[os.path.join(path, name)] = store
+        return store
@@ -0,0 +1,442 @@
+import asyncio
+import json
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional, Tuple, cast
+
+import httpx
+
+from deadline import DeadlineExceeded, bounded_timeout, check_deadline
+from tracing import log_info, log_trace
+from usage import record_usage
+
+# Rough characters-per-token ratio used to estimate prompt size before sending
+CHARS_PER_TOKEN = 4
+
+# Response statuses that mean "slow down and try again"
+RATE_LIMIT_STATUSES = (429,)
+
+# Transient server errors that are retried with backoff but don't throttle
+RETRY_STATUSES = (500, 502, 503, 504)
+
+
+class TokenBucket:
+    """Token bucket that lets callers reserve capacity ahead of time.
+
+    Reservations may push the balance below zero; the caller then waits until
+    the bucket has refilled to cover it. This keeps concurrent callers fair
+    without holding a lock while sleeping.
+    """
+
+    def __init__(self, per_minute: float, clock: Callable[[], float]) -> None:
+        self.per_minute = per_minute
+        self.capacity = per_minute
+        self._clock = clock
+        self._balance = per_minute
+        self._updated = clock()
+
+    def _refill(self, rate_factor: float) -> None:
+        now = self._clock()
+        rate = self.per_minute * rate_factor / 60
+        self._balance = min(self.capacity, self._balance + (now - self._updated) * rate)
+        self._updated = now
+
+    def reserve(self, amount: float, rate_factor: float = 1.0) -> float:
+        """Take amount from the bucket and return how long to wait before using it."""
+        self._refill(rate_factor)
+        self._balance -= min(amount, self.capacity)
+        if self._balance >= 0:
+            return 0.0
+        return -self._balance / (self.per_minute * rate_factor / 60)
+
+    def adjust(self, amount: float) -> None:
+        """Give back (positive) or take (negative) capacity after the fact."""
+        self._balance = min(self.capacity, self._balance + amount)
+
+
+class _ModelLimiter:
+    def __init__(
+        self,
+        requests_per_minute: float,
+        tokens_per_minute: float,
+        clock: Callable[[], float],
+    ) -> None:
+        self.requests = TokenBucket(requests_per_minute, clock)
+        self.tokens = TokenBucket(tokens_per_minute, clock)
+        self.blocked_until = 0.0
+        # Share of the configured rate currently let through (AIMD)
+        self.rate_factor = 1.0
+
+
+class RequestScheduler:
+    """Per-model request and token rate limiting with adaptive backoff.
+
+    Every LLM request acquires from its model's buckets before it is sent. A 429
+    response blocks the model until Retry-After has passed and halves the
+    rate let through; each success grows it back towards the configured limit.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = 600,
+        tokens_per_minute: float = 2_000_000,
+        max_retries: int = 6,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._clock = clock
+        self._limits: Dict[str, Tuple[float, float]] = {}
+        self._models: Dict[str, _ModelLimiter] = {}
+        self._lock = threading.Lock()
+
+    def set_model_limits(
+        self, model: str, requests_per_minute: float, tokens_per_minute: float
+    ) -> None:
+        """Override the default limits for one model."""
+        with self._lock:
+            self._limits[model] = (requests_per_minute, tokens_per_minute)
+            self._models.pop(model, None)
+
+    def _limiter(self, model: str) -> _ModelLimiter:
+        limiter = self._models.get(model)
+        if limiter is None:
+            rpm, tpm = self._limits.get(
+                model, (self.requests_per_minute, self.tokens_per_minute)
+            )
+            limiter = _ModelLimiter(rpm, tpm, self._clock)
+            self._models[model] = limiter
+        return limiter
+
+    def reserve(self, model: str, estimated_tokens: int) -> float:
+        """Reserve one request and estimated_tokens, returning the wait in seconds."""
+        with self._lock:
+            limiter = self._limiter(model)
+            blocked = max(0.0, limiter.blocked_until - self._clock())
+            delay = max(
+                limiter.requests.reserve(1, limiter.rate_factor),
+                limiter.tokens.reserve(estimated_tokens, limiter.rate_factor),
+            )
+            return max(blocked, delay)
+
+    def acquire(self, model: str, estimated_tokens: int) -> None:
+        delay = self.reserve(model, estimated_tokens)
+        if delay > 0:
+            log_trace("Rate limit wait", model, f"{delay:.2f}s")
+            time.sleep(delay)
+
+    async def acquire_async(self, model: str, estimated_tokens: int) -> None:
+        delay = self.reserve(model, estimated_tokens)
+        if delay > 0:
+            log_trace("Rate limit wait", model, f"{delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    def record_success(
+        self, model: str, estimated_tokens: int, used_tokens: Optional[int] = None
+    ) -> None:
+        with self._lock:
+            limiter = self._limiter(model)
+            if used_tokens is not None:
+                limiter.tokens.adjust(estimated_tokens - used_tokens)
+            limiter.rate_factor = min(1.0, limiter.rate_factor + 0.05)
+
+    def record_rate_limited(self, model: str, retry_after: Optional[float]) -> None:
+        with self._lock:
+            limiter = self._limiter(model)
+            limiter.rate_factor = max(0.05, limiter.rate_factor / 2)
+            if retry_after is not None:
+                limiter.blocked_until = max(
+                    limiter.blocked_until, self._clock() + retry_after
+                )
+        log_info(
+            f"Rate limited on {model}, retry after {retry_after}s, "
+            f"throttling to {limiter.rate_factor:.0%} of its limit"
+        )
+
+    def backoff_delay(self, attempt: int, retry_after: Optional[float]) -> float:
+        """Jittered exponential backoff that never undercuts Retry-After."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+        return max(delay, retry_after or 0.0)
+
+
+def parse_retry_after(headers: httpx.Headers) -> Optional[float]:
+    """Read Retry-After (seconds or HTTP date) or retry-after-ms, if present."""
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _request_info(request: httpx.Request) -> Tuple[str, int, Dict[str, Any]]:
+    """Return (model, estimated tokens, parsed body) for an LLM request."""
+    content = request.read()
+    try:
+        parsed = json.loads(content) if content else {}
+    except ValueError:
+        parsed = {}
+    body = cast(Dict[str, Any], parsed) if isinstance(parsed, dict) else {}
+
+    model = str(body.get("model", "unknown"))
+    estimated = len(content) // CHARS_PER_TOKEN
+    max_tokens = body.get("max_tokens") or body.get("max_completion_tokens")
+    if isinstance(max_tokens, int):
+        estimated += max_tokens
+    return model, estimated, body
+
+
+def _record_response_usage(
+    model: str, response: httpx.Response, latency: float
+) -> Optional[int]:
+    """Record token usage reported in a completion response, returning the total."""
+    try:
+        usage = cast(Dict[str, Any], response.json().get("usage") or {})
+        prompt_tokens = int(usage.get("prompt_tokens") or 0)
+        completion_tokens = int(usage.get("completion_tokens") or 0)
+        cost = usage.get("cost")
+    except (ValueError, TypeError, AttributeError):
+        return None
+    if not usage:
+        return None
+
+    record_usage(
+        model,
+        prompt_tokens,
+        completion_tokens,
+        latency,
+        float(cost) if isinstance(cost, (int, float)) else None,
+    )
+    return int(usage.get("total_tokens") or prompt_tokens + completion_tokens)
+
+
+def _apply_deadline(request: httpx.Request) -> None:
+    """Cap the request's timeouts at the time left before the current deadline."""
+    remaining = bounded_timeout(None)
+    if remaining is None:
+        return
+    timeouts = cast(Dict[str, Optional[float]], request.extensions.get("timeout", {}))
+    request.extensions["timeout"] = {
+        name: (
+            remaining
+            if timeouts.get(name) is None
+            else min(cast(float, timeouts[name]), remaining)
+        )
+        for name in ("connect", "read", "write", "pool")
+    }
+
+
+def _retry_delay(delay: float) -> float:
+    """delay, unless the retry could not start before the current deadline."""
+    remaining = bounded_timeout(None)
+    if remaining is not None and delay >= remaining:
+        raise DeadlineExceeded(f"No time left to retry after {delay:.1f}s")
+    return delay
+
+
+class _SseUsageScanner:
+    """Pick the usage object out of a server-sent events completion stream."""
+
+    def __init__(self, model: str, started: float) -> None:
+        self.model = model
+        self.started = started
+        self.usage: Optional[Dict[str, Any]] = None
+        self._buffer = b""
+        self._recorded = False
+
+    def feed(self, chunk: bytes) -> None:
+        self._buffer += chunk
+        *lines, self._buffer = self._buffer.split(b"\n")
+        for line in lines:
+            if not line.startswith(b"data:") or b'"usage"' not in line:
+                continue
+            try:
+                event = json.loads(line[5:])
+            except ValueError:
+                continue
+            if isinstance(event, dict):
+                usage = cast(Dict[str, Any], event).get("usage")
+                if usage:
+                    self.usage = cast(Dict[str, Any], usage)
+
+    def record(self) -> None:
+        if self._recorded or not self.usage:
+            return
+        self._recorded = True
+        cost = self.usage.get("cost")
+        record_usage(
+            self.model,
+            int(self.usage.get("prompt_tokens") or 0),
+            int(self.usage.get("completion_tokens") or 0),
+            time.monotonic() - self.started,
+            float(cost) if isinstance(cost, (int, float)) else None,
+        )
+
+
+class _UsageStream(httpx.SyncByteStream):
+    def __init__(self, stream: httpx.SyncByteStream, scanner: _SseUsageScanner):
+        self._stream = stream
+        self._scanner = scanner
+
+    def __iter__(self) -> Iterator[bytes]:
+        for chunk in self._stream:
+            self._scanner.feed(chunk)
+            check_deadline()
+            yield chunk
+
+    def close(self) -> None:
+        self._scanner.record()
+        self._stream.close()
+
+
+class _AsyncUsageStream(httpx.AsyncByteStream):
+    def __init__(self, stream: httpx.AsyncByteStream, scanner: _SseUsageScanner):
+        self._stream = stream
+        self._scanner = scanner
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            self._scanner.feed(chunk)
+            check_deadline()
+            yield chunk
+
+    async def aclose(self) -> None:
+        self._scanner.record()
+        await self._stream.aclose()
+
+
+class SchedulingTransport(httpx.BaseTransport):
+    """httpx transport that routes every request through a RequestScheduler.
+
+    Rate-limited and transiently failing requests are retried here, so the
+    clients using this transport should not retry on their own.
+    """
+
+    def __init__(self, scheduler: RequestScheduler, transport: httpx.BaseTransport):
+        self.scheduler = scheduler
+        self._transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        model, estimated, body = _request_info(request)
+        attempt = 0
+        while True:
+            self.scheduler.acquire(model, estimated)
+            _apply_deadline(request)
+            started = time.monotonic()
+            try:
+                response = self._transport.handle_request(request)
+            except httpx.TransportError as e:
+                if attempt >= self.scheduler.max_retries:
+                    raise
+                log_info(f"Request to {model} failed ({e}), retrying")
+                time.sleep(_retry_delay(self.scheduler.backoff_delay(attempt, None)))
+                attempt += 1
+                continue
+
+            status = response.status_code
+            if status not in RATE_LIMIT_STATUSES and status not in RETRY_STATUSES:
+                used: Optional[int] = None
+                if body.get("stream"):
+                    # Usage arrives in the final event, recorded on close
+                    response.stream = _UsageStream(
+                        cast(httpx.SyncByteStream, response.stream),
+                        _SseUsageScanner(model, started),
+                    )
+                else:
+                    response.read()
+                    used = _record_response_usage(
+                        model, response, time.monotonic() - started
+                    )
+                self.scheduler.record_success(model, estimated, used)
+                return response
+
+            retry_after = parse_retry_after(response.headers)
+            if status in RATE_LIMIT_STATUSES:
+                self.scheduler.record_rate_limited(model, retry_after)
+            if attempt >= self.scheduler.max_retries:
+                return response
+            response.close()
+            time.sleep(_retry_delay(self.scheduler.backoff_delay(attempt, retry_after)))
+            attempt += 1
+
+    def close(self) -> None:
+        self._transport.close()
+
+
+class AsyncSchedulingTransport(httpx.AsyncBaseTransport):
+    """Async variant of SchedulingTransport."""
+
+    def __init__(
+        self, scheduler: RequestScheduler, transport: httpx.AsyncBaseTransport
+    ):
+        self.scheduler = scheduler
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        model, estimated, body = _request_info(request)
+        attempt = 0
+        while True:
+            await self.scheduler.acquire_async(model, estimated)
+            _apply_deadline(request)
+            started = time.monotonic()
+            try:
+                response = await self._transport.handle_async_request(request)
+            except httpx.TransportError as e:
+                if attempt >= self.scheduler.max_retries:
+                    raise
+                log_info(f"Request to {model} failed ({e}), retrying")
+                await asyncio.sleep(
+                    _retry_delay(self.scheduler.backoff_delay(attempt, None))
+                )
+                attempt += 1
+                continue
+
+            status = response.status_code
+            if status not in RATE_LIMIT_STATUSES and status not in RETRY_STATUSES:
+                used: Optional[int] = None
+                if body.get("stream"):
+                    # Usage arrives in the final event, recorded on close
+                    response.stream = _AsyncUsageStream(
+                        cast(httpx.AsyncByteStream, response.stream),
+                        _SseUsageScanner(model, started),
+                    )
+                else:
+                    await response.aread()
+                    used = _record_response_usage(
+                        model, response, time.monotonic() - started
+                    )
+                self.scheduler.record_success(model, estimated, used)
+                return response
+
+            retry_after = parse_retry_after(response.headers)
+            if status in RATE_LIMIT_STATUSES:
+                self.scheduler.record_rate_limited(model, retry_after)
+            if attempt >= self.scheduler.max_retries:
+                return response
+            await response.aclose()
+            await asyncio.sleep(
+                _retry_delay(self.scheduler.backoff_delay(attempt, retry_after))
+            )
+            attempt += 1
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
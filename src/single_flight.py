@@ -0,0 +1,82 @@
+import asyncio
+import threading
+import weakref
+from typing import Awaitable, Callable, Dict, Generic, Optional, TypeVar, cast
+
+from tracing import log_trace
+
+T = TypeVar("T")
+
+
+class _Call(Generic[T]):
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Optional[T] = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight(Generic[T]):
+    """Coalesce concurrent calls with the same key into one execution.
+
+    The first caller for a key runs the function; callers arriving while it
+    is still running wait for it and get the same result (or exception).
+    Nothing is kept once the call has finished, so this is not a cache.
+    """
+
+    def __init__(self) -> None:
+        self._calls: Dict[str, _Call[T]] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: Callable[[], T]) -> T:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if call is None:
+                call = _Call[T]()
+                self._calls[key] = call
+
+        if not leader:
+            log_trace("Joined in-flight request", key)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return cast(T, call.result)
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+class AsyncSingleFlight(Generic[T]):
+    """Async variant of SingleFlight; in-flight calls are tracked per event loop."""
+
+    def __init__(self) -> None:
+        self._tasks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Task[T]]]" = (weakref.WeakKeyDictionary())
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        loop = asyncio.get_running_loop()
+        tasks = self._tasks.setdefault(loop, {})
+        task = tasks.get(key)
+        if task is None:
+            task = loop.create_task(_run(fn))
+            tasks[key] = task
+            task.add_done_callback(lambda _: tasks.pop(key, None))
+        else:
+            log_trace("Joined in-flight request", key)
+        # A cancelled caller must not cancel the request the others wait on
+        return await asyncio.shield(task)
+
+
+async def _run(fn: Callable[[], Awaitable[T]]) -> T:
+    return await fn()
@@ -1,6 +1,6 @@
 import json
 import os
-from typing import List
+from typing import List, Optional
 
 from langchain.tools import StructuredTool
 from pydantic import BaseModel, Field
@@ -10,7 +10,8 @@ from models.character import Character, TranslatedCharacter
 from models.character_collection import CharacterCollection
 from tracing import log_llm_tool
 
-# Global character collection
+# Global character collection. Tool calls from one agent step run concurrently,
+# so the tools that check and then modify it hold its lock for the whole call.
 character_collection = CharacterCollection()
 if os.path.exists(DEFAULT_CHARACTERS_STORAGE):
     character_collection = CharacterCollection.from_file(DEFAULT_CHARACTERS_STORAGE)
@@ -49,6 +50,27 @@ class GetAllCharactersArgs(BaseModel):
     pass  # No arguments needed
 
 
+class UpsertCharacterItem(BaseModel):
+    name: str = Field(description="The full name of the character")
+    short_names: List[str] = Field(
+        default_factory=list,
+        description="Short names, nicknames or titles used for the character",
+    )
+    gender: Optional[str] = Field(
+        default=None, description="The gender of the character, if mentioned"
+    )
+    characteristics: List[str] = Field(
+        default_factory=list,
+        description="Sentences describing appearance, personality or relationships",
+    )
+
+
+class UpsertCharactersArgs(BaseModel):
+    characters: List[UpsertCharacterItem] = Field(
+        description="The characters to create, or to update if they already exist"
+    )
+
+
 def _character_to_xml(translated: TranslatedCharacter) -> str:
     """Convert TranslatedCharacter to XML for AI."""
     xml_parts = ["<character>"]
@@ -150,6 +172,72 @@ def set_character_gender(name: str, gender: str) -> str:
         return f"Error setting gender of character '{name}' to '{gender}': {type(e).__name__}: {str(e)}"
 
 
+def upsert_characters(characters: List[UpsertCharacterItem]) -> str:
+    """Create or update several characters at once. Returns one result line per character."""
+    if not characters:
+        return "Error upserting characters: Character list cannot be empty"
+
+    results: List[str] = []
+    for i, item in enumerate(characters, start=1):
+        results.append(f"{i}. {_upsert_character(item)}")
+    character_collection._rebuild_index()  # type: ignore
+    return "\n".join(results)
+
+
+def _upsert_character(item: UpsertCharacterItem) -> str:
+    name = item.name.strip()
+    try:
+        if not name:
+            return "Error upserting character: Character name cannot be empty"
+
+        # Only an exact name or short name is merged into; guessing from a
+        # fuzzy match would fold distinct characters together
+        character = character_collection.get(name)
+        if character is None:
+            similar = character_collection.search(name)
+            if similar is not None:
+                similar_name = similar.name.original_text
+                return f"Error upserting character '{name}': The name is close to the existing character '{similar_name}' but does not match it or its short names. Repeat this item with the name '{similar_name}' to update that character, or use CreateCharacter if it is a different one."
+        created = character is None
+        if character is None:
+            character = Character(
+                name=name, gender=item.gender or "UNKNOWN", characteristics=[]
+            )
+            character_collection.add_character(character)
+        elif item.gender and item.gender.strip():
+            character.update(gender=item.gender.strip())
+
+        full_name = character.name.original_text
+        skipped: List[str] = []
+        for short_name in item.short_names:
+            short_name = short_name.strip()
+            if not short_name:
+                continue
+            if short_name.lower() == full_name.strip().lower():
+                skipped.append(short_name)
+                continue
+            character.add_short_name(short_name)
+
+        known = {c.text.original_text for c in character.characteristics}
+        for text in item.characteristics:
+            text = text.strip()
+            if not text:
+                continue
+            if text in known:
+                character.reinforce_characteristic(text)
+            else:
+                character.add_characteristic(text)
+                known.add(text)
+
+        action = "created" if created else f"updated existing character '{full_name}'"
+        result = f"'{name}': {action}"
+        if skipped:
+            result += f" (skipped short names equal to the full name: {skipped})"
+        return result
+    except Exception as e:
+        return f"Error upserting character '{name}': {type(e).__name__}: {str(e)}"
+
+
 def get_character_translation(input_str: str) -> str:
     """Get character information translated to a language. Input: JSON with name and language."""
     try:
@@ -214,7 +302,8 @@ def _search_character_with_logging(query: str) -> str:
 def _create_character_with_logging(name: str, gender: str = "UNKNOWN") -> str:
     log_llm_tool("CreateCharacter", name=name, gender=gender)
     try:
-        return create_character(name, gender)
+        with character_collection.lock:
+            return create_character(name, gender)
     except Exception as e:
         return f"Error creating character: {str(e)}"
 
@@ -222,7 +311,8 @@ def _create_character_with_logging(name: str, gender: str = "UNKNOWN") -> str:
 def _add_short_name_with_logging(name: str, short_name: str) -> str:
     log_llm_tool("AddCharacterShortName", name=name, short_name=short_name)
     try:
-        return add_character_short_name(name, short_name)
+        with character_collection.lock:
+            return add_character_short_name(name, short_name)
     except Exception as e:
         return f"Error adding short name: {str(e)}"
 
@@ -230,11 +320,21 @@ def _add_short_name_with_logging(name: str, short_name: str) -> str:
 def _set_gender_with_logging(name: str, gender: str) -> str:
     log_llm_tool("SetCharacterGender", name=name, gender=gender)
     try:
-        return set_character_gender(name, gender)
+        with character_collection.lock:
+            return set_character_gender(name, gender)
     except Exception as e:
         return f"Error setting gender: {str(e)}"
 
 
+def _upsert_characters_with_logging(characters: List[UpsertCharacterItem]) -> str:
+    log_llm_tool("UpsertCharacters", names=[c.name for c in characters])
+    try:
+        with character_collection.lock:
+            return upsert_characters(characters)
+    except Exception as e:
+        return f"Error upserting characters: {str(e)}"
+
+
 def _get_translation_with_logging(name: str, language: str) -> str:
     log_llm_tool("GetCharacterTranslation", name=name, language=language)
     try:
@@ -281,6 +381,13 @@ set_gender_tool = StructuredTool.from_function(  # type: ignore[reportUnknownMem
     args_schema=SetGenderArgs,
 )
 
+upsert_characters_tool = StructuredTool.from_function(  # type: ignore[reportUnknownMemberType] # LangChain type stubs are incomplete
+    func=_upsert_characters_with_logging,
+    name="UpsertCharacters",
+    description="Create or update several characters in one call, with their short names, gender and characteristics. Existing characters are matched by exact name or short name and updated instead of duplicated; names only close to an existing character are reported back as errors.",
+    args_schema=UpsertCharactersArgs,
+)
+
 get_character_translation_tool = StructuredTool.from_function(  # type: ignore[reportUnknownMemberType] # LangChain type stubs are incomplete
     func=_get_translation_with_logging,
     name="GetCharacterTranslation",
@@ -300,6 +407,7 @@ character_tools: List[StructuredTool] = [
     create_character_tool,
     add_short_name_tool,
     set_gender_tool,
+    upsert_characters_tool,
     get_character_translation_tool,
     get_all_characters_tool,
 ]
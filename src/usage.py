@@ -0,0 +1,126 @@
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Dict, Generator, List, Optional
+
+DEFAULT_STAGE = "other"
+
+_current_stage: ContextVar[str] = ContextVar("usage_stage", default=DEFAULT_STAGE)
+_records: List["CallUsage"] = []
+_lock = threading.Lock()
+
+
+@dataclass
+class CallUsage:
+    stage: str
+    model: str
+    prompt_tokens: int
+    completion_tokens: int
+    latency: float
+    cost: Optional[float] = None
+
+
+@dataclass
+class StageTotals:
+    calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    latency: float = 0.0
+    cost: Optional[float] = None
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
+@contextmanager
+def stage(name: str) -> Generator[None, None, None]:
+    """Attribute LLM calls made inside this block to the named pipeline stage."""
+    token = _current_stage.set(name)
+    try:
+        yield
+    finally:
+        _current_stage.reset(token)
+
+
+def current_stage() -> str:
+    return _current_stage.get()
+
+
+def record_usage(
+    model: str,
+    prompt_tokens: int,
+    completion_tokens: int,
+    latency: float,
+    cost: Optional[float] = None,
+) -> None:
+    """Record one LLM call against the current stage."""
+    record = CallUsage(
+        stage=current_stage(),
+        model=model,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        latency=latency,
+        cost=cost,
+    )
+    with _lock:
+        _records.append(record)
+
+
+def usage_records() -> List[CallUsage]:
+    with _lock:
+        return list(_records)
+
+
+def reset_usage() -> None:
+    with _lock:
+        _records.clear()
+
+
+def usage_by_stage() -> Dict[str, StageTotals]:
+    """Sum recorded calls per stage, in the order stages were first seen."""
+    totals: Dict[str, StageTotals] = {}
+    for record in usage_records():
+        entry = totals.setdefault(record.stage, StageTotals())
+        entry.calls += 1
+        entry.prompt_tokens += record.prompt_tokens
+        entry.completion_tokens += record.completion_tokens
+        entry.latency += record.latency
+        if record.cost is not None:
+            entry.cost = (entry.cost or 0.0) + record.cost
+    return totals
+
+
+def format_usage_summary() -> str:
+    """Render per-stage totals as a table for printing at the end of a command."""
+    totals = usage_by_stage()
+    if not totals:
+        return "No LLM calls were made."
+
+    overall = StageTotals()
+    lines = [
+        f"{'Stage':<22} {'Calls':>6} {'Prompt':>10} {'Completion':>11} "
+        f"{'Total':>10} {'Latency':>9} {'Cost':>9}",
+        "-" * 83,
+    ]
+    for name, entry in totals.items():
+        overall.calls += entry.calls
+        overall.prompt_tokens += entry.prompt_tokens
+        overall.completion_tokens += entry.completion_tokens
+        overall.latency += entry.latency
+        if entry.cost is not None:
+            overall.cost = (overall.cost or 0.0) + entry.cost
+        lines.append(_format_row(name, entry))
+    lines.append("-" * 83)
+    lines.append(_format_row("TOTAL", overall))
+    return "\n".join(lines)
+
+
+def _format_row(name: str, entry: StageTotals) -> str:
+    cost = f"${entry.cost:.4f}" if entry.cost is not None else "-"
+    return (
+        f"{name[:22]:<22} {entry.calls:>6} {entry.prompt_tokens:>10} "
+        f"{entry.completion_tokens:>11} {entry.total_tokens:>10} "
+        f"{entry.latency:>8.1f}s {cost:>9}"
+    )
@@ -0,0 +1,119 @@
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+import ai_cache
+from ai import ai
+from ai_cache import ResponseCache, cache_key
+
+
+def test_response_cache_roundtrip(tmp_path: Path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"))
+    key = cache_key("ai", "model", "system", "user")
+
+    assert cache.get(key) is None
+    cache.put(key, {"output": "hello", "tool_calls": []})
+    assert cache.get(key) == {"output": "hello", "tool_calls": []}
+
+    # Survives reopening
+    reopened = ResponseCache(str(tmp_path / "cache.sqlite3"))
+    assert reopened.get(key) == {"output": "hello", "tool_calls": []}
+
+
+def test_response_cache_key_depends_on_model_and_prompts():
+    base = cache_key("ai", "model-a", "system", "user")
+    assert base == cache_key("ai", "model-a", "system", "user")
+    assert base != cache_key("ai", "model-b", "system", "user")
+    assert base != cache_key("ai", "model-a", "system", "other user")
+
+
+def test_response_cache_evicts_least_recently_used(tmp_path: Path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"), max_entries=2)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    assert cache.get("a") == "1"  # "b" is now least recently used
+    cache.put("c", "3")
+
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+
+
+def test_response_cache_respects_size_limit(tmp_path: Path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"), max_bytes=20)
+    cache.put("a", "x" * 10)
+    cache.put("b", "y" * 10)
+
+    assert cache.get("a") is None
+    assert cache.get("b") == "y" * 10
+
+
+def test_response_cache_expires_entries(tmp_path: Path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"), ttl_seconds=60)
+    with patch("ai_cache.time.time", return_value=1000.0):
+        cache.put("a", "1")
+    with patch("ai_cache.time.time", return_value=1059.0):
+        assert cache.get("a") == "1"
+    with patch("ai_cache.time.time", return_value=1061.0):
+        assert cache.get("a") is None
+
+
+def test_ai_uses_response_cache(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    # Keep recordings written by memoise_for_tests out of the repository
+    monkeypatch.chdir(tmp_path)
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"))
+    monkeypatch.setattr("ai.get_response_cache", lambda: cache)
+
+    with patch("ai.get_client") as mock_get_client:
+        mock_client = MagicMock()
+        mock_response = MagicMock()
+        mock_response.choices = [MagicMock()]
+        mock_response.choices[0].message.content = "Cached answer"
+        mock_client.chat.completions.create.return_value = mock_response
+        mock_get_client.return_value = mock_client
+
+        assert ai("cache_system", "cache_user", "cache_model") == "Cached answer"
+
+    assert cache.get(cache_key("ai", "cache_model", "cache_system", "cache_user")) == (
+        "Cached answer"
+    )
+
+
+def test_no_cache_disables_response_cache(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(ai_cache, "_disabled", False)
+    ai_cache.disable_response_cache()
+    assert ai_cache.get_response_cache() is None
+    monkeypatch.setattr(ai_cache, "_disabled", False)
+
+
+def test_agent_caches_only_finished_runs(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    from ai import AGENT_STOPPED_OUTPUT, agent
+
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"))
+    monkeypatch.setattr("ai.get_response_cache", lambda: cache)
+    run = MagicMock(return_value=(AGENT_STOPPED_OUTPUT, []))
+    monkeypatch.setattr("ai._run_native_agent", run)
+
+    def call(**kwargs: bool) -> str:
+        output, _ = agent.__wrapped__(
+            "system", "query", [], model="model", engine="native", **kwargs
+        )
+        return output
+
+    # A stopped run is not replayed
+    assert call() == AGENT_STOPPED_OUTPUT
+    assert len(cache) == 0
+    run.return_value = ("Done", [])
+    assert call() == "Done"
+    assert run.call_count == 2
+
+    # A finished one is, unless the caller asks for a fresh run
+    run.return_value = ("Done again", [])
+    assert call() == "Done"
+    assert call(use_cache=False) == "Done again"
+    assert call() == "Done again"
+    assert run.call_count == 3
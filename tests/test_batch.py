@@ -0,0 +1,88 @@
+import json
+from pathlib import Path
+from typing import Any, Dict
+from unittest.mock import MagicMock
+
+import pytest
+
+from batch import (
+    BatchRequest,
+    LocalBatchTransport,
+    OpenAIBatchTransport,
+    get_batch_transport,
+    run_batch,
+)
+
+
+def _completion(content: str) -> Dict[str, Any]:
+    return {
+        "model": "test_model",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12},
+    }
+
+
+def test_local_batch_round_trip(tmp_path: Path):
+    def complete(body: Dict[str, Any]) -> Dict[str, Any]:
+        prompt = body["messages"][-1]["content"]
+        if prompt == "fail":
+            raise RuntimeError("boom")
+        return _completion(prompt.upper())
+
+    transport = LocalBatchTransport(str(tmp_path / "local"), complete)
+    requests = [
+        BatchRequest(
+            str(i), {"model": "m", "messages": [{"role": "user", "content": text}]}
+        )
+        for i, text in enumerate(["hello", "fail", "world"])
+    ]
+
+    replies = run_batch(transport, requests, directory=str(tmp_path), poll_interval=0)
+
+    assert replies == {"0": "HELLO", "2": "WORLD"}
+    input_file = next(tmp_path.glob("input_*.jsonl"))
+    first = json.loads(input_file.read_text().splitlines()[0])
+    assert first == {
+        "custom_id": "0",
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": requests[0].body,
+    }
+
+
+def test_unknown_batch_transport_is_rejected():
+    with pytest.raises(ValueError, match="Unknown batch transport"):
+        get_batch_transport("carrier-pigeon")
+
+
+def test_openai_batch_rejects_other_models_before_uploading(tmp_path: Path):
+    input_path = tmp_path / "input.jsonl"
+    lines = [
+        BatchRequest("0", {"model": "openai/gpt-4o-mini"}).to_line(),
+        BatchRequest("1", {"model": "anthropic/claude-3.5-haiku"}).to_line(),
+    ]
+    input_path.write_text("\n".join(json.dumps(line) for line in lines))
+    client = MagicMock()
+
+    with pytest.raises(ValueError, match="'1' uses 'anthropic/claude-3.5-haiku'"):
+        OpenAIBatchTransport(client).submit(str(input_path))
+    client.files.create.assert_not_called()
+
+
+def test_bulk_and_batch_cannot_be_combined(monkeypatch: pytest.MonkeyPatch):
+    from main import main
+
+    monkeypatch.setattr(
+        "sys.argv",
+        [
+            "fantranslate",
+            "translate_all_characters",
+            "c.txt",
+            "--bulk",
+            "--batch",
+            "local",
+        ],
+    )
+    with pytest.raises(SystemExit) as exited:
+        main()
+    assert exited.value.code == 2
@@ -1,5 +1,6 @@
 import os
 import tempfile
+from pathlib import Path
 
 from src.models.character import Character
 from src.models.character_collection import CharacterCollection
@@ -133,3 +134,203 @@ def test_translate_all_characters_no_characters():
     collection = CharacterCollection()
     count = collection.translate_all_characters("test content")
     assert count == 0
+
+
+def test_translate_runs_field_translations_concurrently():
+    """Per-field translations after the summary are issued concurrently."""
+    import asyncio
+    from unittest.mock import patch
+
+    from helpers.settings import Settings
+
+    char = Character("Alice", short_names=["Al", "Ally"], gender="female")
+    char.add_characteristic("tall and blonde")
+
+    in_flight = 0
+    max_in_flight = 0
+
+    async def fake_ai_async(
+        system_prompt: str, user_prompt: str, call_site: str
+    ) -> str:
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return "ru:" + user_prompt.split("'")[-2]
+
+    settings_obj = Settings(
+        languages=["en", "ru"], translate_from="en", translate_to="ru"
+    )
+    with patch("helpers.settings.settings", return_value=settings_obj), patch(
+        "ai.ai", return_value="Alice goes to the market."
+    ) as mock_ai, patch("ai.ai_async", side_effect=fake_ai_async):
+        char.translate("chapter text")
+
+    assert mock_ai.call_count == 1  # Only the summary is sequential
+    assert max_in_flight == 5
+    assert char.name.ru == "ru:Alice"
+    assert [sn.ru for sn in char.short_names] == ["ru:Al", "ru:Ally"]
+    assert char.gender is not None and char.gender.ru == "ru:female"
+    assert char.characteristics[0].text.ru == "ru:tall and blonde"
+
+
+def test_translate_async_runs_inside_an_event_loop():
+    """Coroutines await translate_async(); the blocking translate() refuses to run."""
+    import asyncio
+    from unittest.mock import patch
+
+    import pytest
+
+    from helpers.settings import Settings
+
+    char = Character("Alice", gender="female")
+
+    async def fake_ai_async(
+        system_prompt: str, user_prompt: str, call_site: str
+    ) -> str:
+        return "ru:" + user_prompt.split("'")[-2]
+
+    async def translate_in_loop() -> None:
+        with pytest.raises(RuntimeError, match="translate_async"):
+            char.translate("chapter text")
+        await char.translate_async("chapter text")
+
+    settings_obj = Settings(
+        languages=["en", "ru"], translate_from="en", translate_to="ru"
+    )
+    with patch("helpers.settings.settings", return_value=settings_obj), patch(
+        "ai.ai", return_value="Alice goes to the market."
+    ), patch("ai.ai_async", side_effect=fake_ai_async):
+        asyncio.run(translate_in_loop())
+
+    assert char.name.ru == "ru:Alice"
+    assert char.gender is not None and char.gender.ru == "ru:female"
+
+
+def test_translate_bulk_falls_back_for_missing_fields():
+    """Bulk mode translates in one request and falls back per field for gaps."""
+    import json
+    from unittest.mock import patch
+
+    from helpers.settings import Settings
+
+    char = Character("Alice", short_names=["Al"], gender="female")
+    char.add_characteristic("tall and blonde")
+    char.name.ru = "Алиса"  # Already translated, must not be requested again
+
+    bulk_reply = (
+        "```json\n"
+        + json.dumps(
+            {"short_name_0": "Ал", "gender": "женский", "characteristic_0": None}
+        )
+        + "\n```"
+    )
+    fallback_prompts: list[str] = []
+
+    async def fake_ai_async(
+        system_prompt: str, user_prompt: str, call_site: str
+    ) -> str:
+        fallback_prompts.append(user_prompt)
+        return "высокая блондинка"
+
+    settings_obj = Settings(
+        languages=["en", "ru"], translate_from="en", translate_to="ru"
+    )
+    with patch("helpers.settings.settings", return_value=settings_obj), patch(
+        "ai.ai", side_effect=["Alice goes to the market.", bulk_reply]
+    ) as mock_ai, patch("ai.ai_async", side_effect=fake_ai_async):
+        char.translate("chapter text", bulk=True)
+
+    system_prompt, bulk_prompt = mock_ai.call_args_list[1].args
+    schema = mock_ai.call_args_list[1].kwargs["response_schema"]
+    assert schema["required"] == ["short_name_0", "gender", "characteristic_0"]
+    assert "id='characteristic_0'" in system_prompt
+    assert "short_name_0, gender, characteristic_0" in bulk_prompt
+    assert "name," not in bulk_prompt
+    assert char.name.ru == "Алиса"
+    assert char.short_names[0].ru == "Ал"
+    assert char.gender is not None and char.gender.ru == "женский"
+    assert len(fallback_prompts) == 1
+    assert char.characteristics[0].text.ru == "высокая блондинка"
+
+
+def test_translate_all_characters_in_batch(tmp_path: Path):
+    """Batch mode sends every untranslated field in one batch and applies the replies."""
+    from typing import Any, Dict
+    from unittest.mock import patch
+
+    from batch import LocalBatchTransport
+    from helpers.settings import Settings
+
+    collection = CharacterCollection()
+    alice = Character("Alice", short_names=["Al"], gender="female")
+    alice.name.ru = "Алиса"  # Already translated, must not be requested again
+    collection.add_character(alice)
+    collection.add_character(Character("Bob"))
+
+    bodies: list[Dict[str, Any]] = []
+
+    def complete(body: Dict[str, Any]) -> Dict[str, Any]:
+        bodies.append(body)
+        original = body["messages"][-1]["content"].split("'")[-2]
+        message = {"role": "assistant", "content": f"ru:{original}"}
+        return {"choices": [{"index": 0, "message": message}]}
+
+    settings_obj = Settings(
+        languages=["en", "ru"], translate_from="en", translate_to="ru"
+    )
+    batch_dir = str(tmp_path / "batches")
+    transport = LocalBatchTransport(batch_dir, complete)
+    with patch("helpers.settings.settings", return_value=settings_obj), patch(
+        "ai.ai", return_value="A chapter summary."
+    ) as mock_ai, patch("batch.BATCH_DIR", batch_dir), patch(
+        "batch.DEFAULT_POLL_INTERVAL", 0
+    ):
+        count = collection.translate_all_characters("chapter text", batch=transport)
+
+    assert count == 2
+    assert mock_ai.call_count == 2  # Summaries only
+    assert len(bodies) == 3  # Alice's short name and gender, Bob's name
+    assert alice.name.ru == "Алиса"
+    assert alice.short_names[0].ru == "ru:Al"
+    assert alice.gender is not None and alice.gender.ru == "ru:female"
+    assert collection.characters[1].name.ru == "ru:Bob"
+
+
+def test_translate_all_characters_resumes_from_checkpoint(tmp_path: Path):
+    """A resumed run restores journaled characters instead of translating them."""
+    from unittest.mock import patch
+
+    from checkpoint import Checkpoint
+    from helpers.settings import Settings
+
+    path = str(tmp_path / "journal.jsonl")
+    done = Character("Alice")
+    done.name.ru = "Алиса"
+    Checkpoint(path).record("translated:Alice", done.to_dict())
+
+    collection = CharacterCollection()
+    collection.add_character(Character("Alice"))
+    collection.add_character(Character("Bob"))
+
+    translated: list[str] = []
+
+    def fake_translate(self: Character, chapter_contents: str, bulk: bool = False):
+        translated.append(self.name.original_text)
+        self.name.ru = "Боб"
+
+    settings_obj = Settings(
+        languages=["en", "ru"], translate_from="en", translate_to="ru"
+    )
+    with patch("helpers.settings.settings", return_value=settings_obj), patch.object(
+        Character, "translate", fake_translate
+    ):
+        count = collection.translate_all_characters(
+            "chapter text", checkpoint=Checkpoint(path, resume=True)
+        )
+
+    assert count == 2
+    assert translated == ["Bob"]
+    assert collection.search("Alice").name.ru == "Алиса"  # type: ignore[union-attr]
+    assert Checkpoint(path, resume=True).done("translated:Bob")
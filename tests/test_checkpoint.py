@@ -0,0 +1,36 @@
+import os
+from pathlib import Path
+
+from checkpoint import Checkpoint
+
+
+def test_resume_restores_recorded_units(tmp_path: Path):
+    path = str(tmp_path / "run.jsonl")
+    checkpoint = Checkpoint(path)
+    checkpoint.record("translated:Alice", {"name": "Alice"})
+    checkpoint.record("detection", ["Alice", "Bob"])
+
+    resumed = Checkpoint(path, resume=True)
+    assert resumed.done("translated:Alice")
+    assert resumed.result("detection") == ["Alice", "Bob"]
+    assert [unit for unit, _ in resumed.results("translated:")] == ["translated:Alice"]
+
+    # Without resume the journal of the previous run is dropped
+    assert not Checkpoint(path).done("detection")
+    assert not os.path.exists(path)
+
+
+def test_torn_last_line_is_cut_off(tmp_path: Path):
+    path = str(tmp_path / "run.jsonl")
+    Checkpoint(path).record("batch", "batch_1")
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('[1, 2]\n"not an entry"\n{"unit": "transl')
+
+    resumed = Checkpoint(path, resume=True)
+    assert resumed.result("batch") == "batch_1"
+    assert not resumed.done("transl")
+
+    # What the resumed run records survives the next interruption
+    resumed.record("translated:B", {"name": "B"})
+    reloaded = Checkpoint(path, resume=True)
+    assert reloaded.done("batch") and reloaded.done("translated:B")
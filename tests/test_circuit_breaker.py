@@ -0,0 +1,102 @@
+import asyncio
+import time
+from typing import List
+
+import httpx
+import openai
+import pytest
+
+from circuit_breaker import CircuitBreaker, ModelRouter, is_provider_failure
+
+
+def test_breaker_trips_after_consecutive_failures_and_probes_to_recover():
+    breaker = CircuitBreaker("m", failure_threshold=2, reset_seconds=0.05)
+    breaker.record_failure("raising APIError")
+    breaker.record_success(0.1)  # A success resets the count
+    breaker.record_failure("raising APIError")
+    assert breaker.allow()
+    breaker.record_failure("raising APIError")
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()  # One probe is let through
+    assert not breaker.allow()
+    breaker.record_success(0.1)
+    assert not breaker.is_open and breaker.allow()
+
+
+def test_slow_calls_count_as_failures():
+    breaker = CircuitBreaker("m", failure_threshold=1, slow_call_seconds=1)
+    breaker.record_success(0.5)
+    assert breaker.allow()
+    breaker.record_success(2)
+    assert not breaker.allow()
+
+
+def test_router_falls_back_and_skips_tripped_model():
+    router = ModelRouter(failure_threshold=2, reset_seconds=60)
+    attempts: List[str] = []
+
+    def request(model: str) -> str:
+        attempts.append(model)
+        if model == "primary":
+            raise ConnectionError("provider is down")
+        return f"answer from {model}"
+
+    for _ in range(3):
+        assert router.call(["primary", "backup"], request) == "answer from backup"
+
+    # The third call no longer waits for the failing model
+    assert attempts == ["primary", "backup", "primary", "backup", "backup"]
+    assert router.breaker("primary").is_open
+
+
+def test_router_raises_last_error_when_every_model_fails():
+    router = ModelRouter(failure_threshold=1)
+
+    async def request(model: str) -> str:
+        raise ConnectionError(model)
+
+    with pytest.raises(ConnectionError, match="backup"):
+        asyncio.run(router.call_async(["primary", "backup"], request))
+    # With every model tripped, the first one is still tried
+    with pytest.raises(ConnectionError, match="primary"):
+        asyncio.run(router.call_async(["primary", "backup"], request))
+
+
+def _status_error(status: int) -> openai.APIStatusError:
+    request = httpx.Request("POST", "https://llm.test/chat")
+    response = httpx.Response(status, request=request)
+    return openai.APIStatusError("error", response=response, body=None)
+
+
+def test_only_provider_failures_trip_the_breaker():
+    assert is_provider_failure(_status_error(429))
+    assert is_provider_failure(_status_error(503))
+    assert is_provider_failure(httpx.ReadTimeout("slow"))
+    assert not is_provider_failure(ValueError("invalid reply"))
+
+    router = ModelRouter(failure_threshold=1, reset_seconds=60)
+    for status in (400, 401, 404):
+
+        def request(model: str) -> str:
+            if model == "primary":
+                raise _status_error(status)
+            return model
+
+        # The next model is still tried, but the first stays in use
+        assert router.call(["primary", "backup"], request) == "backup"
+        assert not router.breaker("primary").is_open
+
+
+def test_untimed_calls_are_never_slow():
+    router = ModelRouter(failure_threshold=1, slow_call_seconds=0.01)
+
+    def agent_run(model: str) -> str:
+        time.sleep(0.02)
+        return model
+
+    router.call(["primary", "backup"], agent_run, timed=False)
+    assert not router.breaker("primary").is_open
+    router.call(["primary", "backup"], agent_run)
+    assert router.breaker("primary").is_open
@@ -0,0 +1,49 @@
+import time
+
+import pytest
+
+from deadline import (
+    DeadlineExceeded,
+    bounded_timeout,
+    check_deadline,
+    current_deadline,
+    deadline,
+)
+from mock_llm import MockLLMServer
+
+
+def test_nested_deadlines_only_shorten_the_budget():
+    assert bounded_timeout(30) == 30
+    with deadline(10):
+        remaining = bounded_timeout(None)
+        assert remaining is not None and 9 < remaining <= 10
+        assert bounded_timeout(30) == pytest.approx(remaining, abs=1)
+        assert bounded_timeout(1) == 1
+        outer = current_deadline()
+        with deadline(100) as inner:
+            assert inner is outer
+        with deadline(None) as inner:
+            assert inner is outer
+    assert current_deadline() is None
+
+    with deadline(0):
+        with pytest.raises(DeadlineExceeded):
+            check_deadline()
+        with pytest.raises(DeadlineExceeded):
+            bounded_timeout(30)
+
+
+def test_ai_call_in_flight_is_cancelled_when_the_budget_is_spent(
+    monkeypatch: pytest.MonkeyPatch,
+):
+    from ai import ai
+
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test-key")
+    with MockLLMServer(latency=5) as server:
+        monkeypatch.setattr("ai.OPENROUTER_BASE_URL", server.base_url)
+        monkeypatch.setattr("ai._client", None)
+        started = time.monotonic()
+        with deadline(0.5):
+            with pytest.raises(DeadlineExceeded):
+                ai("System", "Slow question", "deadline_test_model")
+        assert time.monotonic() - started < 2
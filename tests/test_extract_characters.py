@@ -0,0 +1,183 @@
+import threading
+from pathlib import Path
+from typing import Iterator, List, Tuple
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+import extract_characters
+from checkpoint import checkpoint_for
+from extract_characters import detection_judge_stream
+from models.character import Character
+from models.character_collection import CharacterCollection
+
+
+def test_detection_judge_stream_yields_names_incrementally():
+    def fake_stream(
+        system_prompt: str,
+        user_prompt: str,
+        call_site: str,
+        response_schema: dict,
+        use_cache: bool = True,
+    ) -> Iterator[str]:
+        yield '["Gandalf", "Bil'
+        yield 'bo Baggins"]'
+
+    with patch("extract_characters.ai_stream", side_effect=fake_stream):
+        names = list(detection_judge_stream("chapter", CharacterCollection()))
+
+    assert names == ["Gandalf", "Bilbo Baggins"]
+
+
+def test_detection_judge_stream_retries_without_repeating_names():
+    responses = iter([['["Gandalf", '], ['["Gandalf", "Frodo"]']])
+
+    def fake_stream(
+        system_prompt: str,
+        user_prompt: str,
+        call_site: str,
+        response_schema: dict,
+        use_cache: bool = True,
+    ) -> Iterator[str]:
+        yield from next(responses)
+
+    with patch("extract_characters.ai_stream", side_effect=fake_stream):
+        names = list(detection_judge_stream("chapter", CharacterCollection()))
+
+    assert names == ["Gandalf", "Frodo"]
+
+
+def test_extraction_starts_before_detection_finishes(tmp_path: Path):
+    chapter = tmp_path / "chapter.txt"
+    chapter.write_text("Gandalf met Frodo.")
+    first_batch_extracted = threading.Event()
+    batches: List[List[str]] = []
+
+    def fake_stream(
+        system_prompt: str,
+        user_prompt: str,
+        call_site: str,
+        response_schema: dict,
+        use_cache: bool = True,
+    ) -> Iterator[str]:
+        yield '["Gandalf",'
+        # Extraction of the first name happens while detection is still streaming
+        assert first_batch_extracted.wait(timeout=5)
+        yield ' "Frodo"]'
+
+    def fake_extraction(missing: List[str], chapter_text: str) -> Tuple[str, List[str]]:
+        batches.append(missing)
+        first_batch_extracted.set()
+        return "done", []
+
+    with patch("extract_characters.ai_stream", side_effect=fake_stream), patch(
+        "extract_characters.extraction_agent", side_effect=fake_extraction
+    ), patch("extract_characters.completeness_judge", return_value=True), patch.object(
+        extract_characters.character_collection, "save"
+    ), patch(
+        "checkpoint.CHECKPOINT_DIR", str(tmp_path)
+    ), patch(
+        "extract_characters.EXTRACTION_BATCH_SIZE", 1
+    ):
+        assert extract_characters.extract_characters_from_chapter(str(chapter))
+
+    assert batches == [["Gandalf"], ["Frodo"]]
+
+
+def test_small_detections_are_extracted_in_one_pass(tmp_path: Path):
+    chapter = tmp_path / "chapter.txt"
+    chapter.write_text("Gandalf met Frodo and Sam.")
+    batches: List[List[str]] = []
+
+    def fake_stream(
+        system_prompt: str,
+        user_prompt: str,
+        call_site: str,
+        response_schema: dict,
+        use_cache: bool = True,
+    ) -> Iterator[str]:
+        yield '["Gandalf",'
+        yield ' "Frodo",'
+        yield ' "Sam"]'
+
+    def fake_extraction(missing: List[str], chapter_text: str) -> Tuple[str, List[str]]:
+        batches.append(missing)
+        return "done", []
+
+    with patch("extract_characters.ai_stream", side_effect=fake_stream), patch(
+        "extract_characters.extraction_agent", side_effect=fake_extraction
+    ), patch("extract_characters.completeness_judge", return_value=True), patch.object(
+        extract_characters.character_collection, "save"
+    ), patch(
+        "checkpoint.CHECKPOINT_DIR", str(tmp_path)
+    ), patch(
+        "extract_characters.EXTRACTION_BATCH_SIZE", 4
+    ):
+        assert extract_characters.extract_characters_from_chapter(str(chapter))
+
+    # Fewer names than a batch wait for detection to finish
+    assert batches == [["Gandalf", "Frodo", "Sam"]]
+
+
+def test_resume_only_extracts_names_left_over(tmp_path: Path):
+    chapter = tmp_path / "chapter.txt"
+    chapter.write_text("Gandalf met Frodo.")
+    batches: List[List[str]] = []
+
+    with patch("checkpoint.CHECKPOINT_DIR", str(tmp_path)):
+        journal = checkpoint_for("extract_characters", str(chapter))
+    journal.record("extracted:Gandalf", Character("Gandalf").to_dict())
+    journal.record("detection", ["Gandalf", "Frodo"])
+
+    def fake_extraction(missing: List[str], chapter_text: str) -> Tuple[str, List[str]]:
+        batches.append(missing)
+        return "done", []
+
+    collection = CharacterCollection()
+    with patch("extract_characters.ai_stream") as mock_stream, patch(
+        "extract_characters.extraction_agent", side_effect=fake_extraction
+    ), patch("extract_characters.completeness_judge", return_value=True), patch(
+        "extract_characters.character_collection", collection
+    ), patch.object(
+        collection, "save"
+    ), patch(
+        "checkpoint.CHECKPOINT_DIR", str(tmp_path)
+    ):
+        assert extract_characters.extract_characters_from_chapter(
+            str(chapter), resume=True
+        )
+
+    assert not mock_stream.called  # Detection finished before the interruption
+    assert batches == [["Frodo"]]
+    assert collection.search("Gandalf") is not None
+    assert not Path(journal.path).exists()  # Cleared once complete
+
+
+def test_detection_retry_does_not_replay_a_broken_cached_reply(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    from ai_cache import ResponseCache
+
+    # Keep recordings written by memoise_for_tests out of the repository
+    monkeypatch.chdir(tmp_path)
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"))
+    monkeypatch.setattr("ai.get_response_cache", lambda: cache)
+
+    def stream(*texts: str) -> Iterator[MagicMock]:
+        for text in texts:
+            chunk = MagicMock()
+            chunk.choices[0].delta.content = text
+            yield chunk
+
+    client = MagicMock()
+    client.chat.completions.create.side_effect = [
+        stream('{"characters": ["Al'),
+        stream('{"characters": ["Alice"]}'),
+    ]
+    monkeypatch.setattr("ai.get_client", lambda: client)
+
+    names = list(detection_judge_stream("chapter", CharacterCollection()))
+
+    assert names == ["Alice"]
+    assert client.chat.completions.create.call_count == 2
+    assert len(cache) == 1  # Only the complete reply
@@ -0,0 +1,114 @@
+import asyncio
+import threading
+import time
+from typing import List
+
+import hedging
+from hedging import HedgingPolicy
+
+
+def primed_policy(max_extra_ratio: float = 1.0) -> HedgingPolicy:
+    policy = HedgingPolicy(
+        percentile=90, min_samples=5, max_extra_ratio=max_extra_ratio
+    )
+    for _ in range(10):
+        policy.record_latency("m", 0.05)
+    return policy
+
+
+def test_no_hedging_until_enough_latency_samples():
+    policy = HedgingPolicy(min_samples=5)
+    assert policy.hedge_delay("m") is None
+    for latency in [0.1, 0.2, 0.3, 0.4, 1.0]:
+        policy.record_latency("m", latency)
+    assert policy.hedge_delay("m") == 1.0
+    assert policy.hedge_delay("other") is None
+
+
+def test_slow_call_is_hedged_and_first_answer_wins():
+    policy = primed_policy()
+    release = threading.Event()
+    attempts: List[int] = []
+
+    def request() -> str:
+        attempts.append(len(attempts))
+        if len(attempts) == 1:
+            release.wait(5)  # The original request hangs in the tail
+            return "slow"
+        return "fast"
+
+    started = time.monotonic()
+    assert policy.call("m", request) == "fast"
+    assert time.monotonic() - started < 1
+    assert policy.hedges == 1
+    release.set()
+
+
+def test_hedges_stay_within_the_extra_spend_cap():
+    policy = primed_policy(max_extra_ratio=0.0)
+    calls: List[int] = []
+
+    def request() -> str:
+        calls.append(1)
+        time.sleep(0.1)
+        return "done"
+
+    assert policy.call("m", request) == "done"
+    assert len(calls) == 1
+    assert policy.hedges == 0
+
+
+def test_async_hedge_cancels_the_losing_request():
+    policy = primed_policy()
+    cancelled: List[bool] = []
+    attempts: List[int] = []
+
+    async def request() -> str:
+        attempts.append(1)
+        if len(attempts) == 1:
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+            return "slow"
+        return "fast"
+
+    async def run() -> str:
+        result = await policy.call_async("m", request)
+        await asyncio.sleep(0)  # Let the cancellation be delivered
+        return result
+
+    assert asyncio.run(run()) == "fast"
+    assert cancelled == [True]
+
+
+def test_sync_loser_keeps_running_and_pauses_hedging_at_the_limit(monkeypatch):
+    monkeypatch.setattr(hedging, "MAX_ABANDONED", 1)
+    policy = primed_policy()
+    release = threading.Event()
+    attempts: List[int] = []
+
+    def request() -> str:
+        attempts.append(1)
+        if len(attempts) == 1:
+            release.wait(5)
+            return "slow"
+        return "fast"
+
+    assert policy.call("m", request) == "fast"
+    assert policy.abandoned == 1
+
+    # With the loser still holding its thread, the next slow call is not hedged
+    def slow() -> str:
+        time.sleep(0.1)
+        return "unhedged"
+
+    assert policy.call("m", slow) == "unhedged"
+    assert policy.hedges == 1
+
+    release.set()
+    deadline = time.monotonic() + 2
+    while policy.abandoned and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert policy.abandoned == 0
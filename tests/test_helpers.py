@@ -119,3 +119,73 @@ def test_context_only_examples():
 </examples>
 """
     assert result == expected
+
+
+def test_context_cache_friendly_build_puts_volatile_parts_last():
+    """Stable parts and examples form the prefix, volatile parts follow."""
+    c = Context()
+    c = c.add("Summary", "changes every call", volatile=True)
+    c = c.add("Rules", "always the same")
+    c = c.example(in_="in", out="out")
+
+    # The default layout is unchanged
+    assert c.build().startswith("** SUMMARY **")
+
+    result = c.build(cache_friendly=True)
+    assert result.startswith("** RULES **\nalways the same\n\n<examples>")
+    assert result.endswith("** SUMMARY **\nchanges every call\n\n")
+    assert result.volatile_suffix == "** SUMMARY **\nchanges every call\n\n"
+    assert result.static_prefix + result.volatile_suffix == result
+
+
+def test_json_array_stream_parser_yields_elements_as_they_complete():
+    """Elements are returned once their closing delimiter has been seen."""
+    from helpers.json_stream import JsonArrayStreamParser
+
+    parser = JsonArrayStreamParser()
+    assert parser.feed('```json\n["Gand') == []
+    assert parser.feed('alf", "Bilbo') == ["Gandalf"]
+    assert parser.feed(' \\"B\\" Baggins", ["a, b"], {"k": "]"}') == [
+        'Bilbo "B" Baggins',
+        ["a, b"],
+    ]
+    assert not parser.finished
+    assert parser.feed("]\n```") == [{"k": "]"}]
+    assert parser.finished
+
+
+def test_json_array_stream_parser_empty_array():
+    from helpers.json_stream import JsonArrayStreamParser
+
+    parser = JsonArrayStreamParser()
+    assert parser.feed("[ ]") == []
+    assert parser.finished
+
+
+def test_schema_errors_checks_structured_output_subset():
+    from helpers.json_schema import schema_errors
+
+    schema = {
+        "type": "object",
+        "properties": {
+            "characters": {"type": "array", "items": {"type": "string"}},
+            "answer": {"type": "string", "pattern": "^(YES|NO, .+)$"},
+        },
+        "required": ["characters"],
+        "additionalProperties": False,
+    }
+    assert schema_errors({"characters": ["Gandalf"], "answer": "YES"}, schema) == []
+    assert schema_errors(["Gandalf"], schema) == ["$: expected object, got list"]
+    assert schema_errors({"characters": [1]}, schema) == [
+        "$.characters[0]: expected string, got int"
+    ]
+    assert len(schema_errors({"characters": [], "answer": "NO"}, schema)) == 1
+    assert len(schema_errors({"extra": 1}, schema)) == 2
+
+
+def test_parse_json_reply_ignores_fences_and_chatter():
+    from helpers.json_schema import parse_json_reply
+
+    assert parse_json_reply('```json\n{"a": 1}\n```') == {"a": 1}
+    assert parse_json_reply('Sure! {"a": [1, 2]} Hope that helps') == {"a": [1, 2]}
+    assert parse_json_reply("no json here") is None
@@ -1,10 +1,14 @@
-import json
 import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Type
 from unittest.mock import MagicMock, patch
 
 import pytest
 
 from ai import agent, ai, yesno
+from deadline import DeadlineExceeded
 from main import main
 from tools.hello import hello_tool
 
@@ -37,20 +41,14 @@ def test_ai_memoisation():
         # Check that the API was not called since recordings exist
         assert mock_client.chat.completions.create.call_count == 0
 
-        # Check that the recording file exists
-        assert os.path.exists(".ai_recordings/ai.json")
+        # Check that the recording was stored
+        from ai_test_helpers import _lookup
+        from recording_store import get_recording_store
 
-        # Check the content
-        with open(".ai_recordings/ai.json", "r") as f:
-            data = json.load(f)
-        assert len(data) >= 1  # May have more recordings
-        # Find the key for the test args
-        key = None
-        for k in data:
-            if data[k] == "Mocked AI response":
-                key = k
-                break
-        assert key is not None
+        # Resolved like memoise_for_tests does, the recording may predate v2 keys
+        args = ("test_system", "test_user", "test_model")
+        _, recorded = _lookup(get_recording_store("ai"), args, {})
+        assert recorded == "Mocked AI response"
 
 
 def test_agent_basic():
@@ -95,6 +93,279 @@ def test_agent_with_chat_history():
     )  # History should grow with continued conversation
 
 
+def test_ai_and_agent_share_http_pool(monkeypatch: pytest.MonkeyPatch):
+    """ai() and agent() clients go through one keep-alive connection pool."""
+    from ai import get_chat_model, get_client, get_http_client
+
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test-key")
+
+    http_client = get_http_client()
+    assert get_client()._client is http_client
+    assert get_chat_model("test_model").root_client._client is http_client
+    assert get_chat_model("test_model") is get_chat_model("test_model")
+
+
+def test_agent_executor_reused_for_same_model_tools_and_prompt(
+    monkeypatch: pytest.MonkeyPatch,
+):
+    """Retries with the same prompt reuse the built agent executor."""
+    from ai import _get_agent_executor
+
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test-key")
+
+    first = _get_agent_executor("test_model", [hello_tool], "System {prompt}")
+    assert _get_agent_executor("test_model", [hello_tool], "System {prompt}") is first
+    assert _get_agent_executor("test_model", [hello_tool], "Other prompt") is not first
+    assert _get_agent_executor("other_model", [hello_tool], "System {prompt}") is not (
+        first
+    )
+
+
+def test_agent_runs_tool_calls_of_one_step_concurrently(
+    monkeypatch: pytest.MonkeyPatch,
+):
+    """Tool calls returned together are executed at the same time, in order."""
+    import threading
+
+    from langchain.tools import StructuredTool
+
+    from ai import _get_agent_executor
+    from mock_llm import MockLLMServer, MockResponse
+
+    def responder(body: Dict[str, Any]) -> MockResponse:
+        if body["messages"][-1]["role"] == "tool":
+            return MockResponse(content="done")
+        calls = [("Wait", {"name": "first"}), ("Wait", {"name": "second"})]
+        return MockResponse(tool_calls=calls)
+
+    # Each call blocks until the other one has started
+    barrier = threading.Barrier(2, timeout=5)
+
+    def wait(name: str) -> str:
+        barrier.wait()
+        return f"waited {name}"
+
+    wait_tool = StructuredTool.from_function(  # type: ignore[reportUnknownMemberType]
+        func=wait, name="Wait", description="Wait for the other call."
+    )
+
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test-key")
+    with MockLLMServer(responder) as server:
+        monkeypatch.setattr("ai.OPENROUTER_BASE_URL", server.base_url)
+        executor = _get_agent_executor("concurrency_test_model", [wait_tool], "Go")
+        response = executor.invoke({"input": "wait twice", "chat_history": []})
+
+    assert response["output"] == "done"
+    assert [step[1] for step in response["intermediate_steps"]] == [
+        "waited first",
+        "waited second",
+    ]
+
+
+def test_native_agent_engine_runs_tool_calling_loop(
+    monkeypatch: pytest.MonkeyPatch,
+):
+    """The native engine talks to the API directly and returns the same shape."""
+    import asyncio
+
+    from langchain.schema import AIMessage, HumanMessage
+    from langchain.tools import StructuredTool
+
+    from ai import _arun_native_agent, _run_native_agent
+    from mock_llm import MockLLMServer, MockResponse
+
+    requests: List[Dict[str, Any]] = []
+
+    def responder(body: Dict[str, Any]) -> MockResponse:
+        requests.append(body)
+        messages = body["messages"]
+        if messages[-1]["role"] == "tool":
+            return MockResponse(content=" | ".join(m["content"] for m in messages[-2:]))
+        calls = [("Greet", {"name": "Bob"}), ("Missing", {})]
+        return MockResponse(tool_calls=calls)
+
+    def greet(name: str) -> str:
+        return f"Hello {name}"
+
+    greet_tool = StructuredTool.from_function(  # type: ignore[reportUnknownMemberType]
+        func=greet, name="Greet", description="Greet someone."
+    )
+    history = [HumanMessage(content="hi"), AIMessage(content="hello")]
+
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test-key")
+    with MockLLMServer(responder) as server:
+        monkeypatch.setattr("ai.OPENROUTER_BASE_URL", server.base_url)
+        monkeypatch.setattr("ai._client", None)
+        output, tool_calls = _run_native_agent(
+            "native_test_model", "System", "Greet Bob", [greet_tool], history, {}
+        )
+        async_output, async_tool_calls = asyncio.run(
+            _arun_native_agent(
+                "native_test_model", "System", "Greet Bob", [greet_tool], history, {}
+            )
+        )
+
+    assert output == ("Hello Bob | Missing is not a valid tool, try one of [Greet].")
+    assert tool_calls == [["Greet", {"name": "Bob"}], ["Missing", "{}"]]
+    assert (async_output, async_tool_calls) == (output, tool_calls)
+    assert [m["role"] for m in requests[0]["messages"]] == [
+        "system",
+        "user",
+        "assistant",
+        "user",
+    ]
+    assert requests[0]["tools"][0]["function"]["name"] == "Greet"
+
+
+def test_agent_async_records_usage_of_its_requests(
+    monkeypatch: pytest.MonkeyPatch,
+):
+    """LangChain's async requests go through the scheduling transport too."""
+    import asyncio
+
+    from ai import agent_async
+    from mock_llm import MockLLMServer, MockResponse
+    from usage import reset_usage, stage, usage_records
+
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test-key")
+    reset_usage()
+    with MockLLMServer(lambda _: MockResponse(content="done")) as server:
+        monkeypatch.setattr("ai.OPENROUTER_BASE_URL", server.base_url)
+        with stage("async_agent"):
+            output, _ = asyncio.run(
+                agent_async.__wrapped__(
+                    "System", "Say done", [], model="async_usage_test_model"
+                )
+            )
+
+    assert output == "done"
+    assert [(r.stage, r.model) for r in usage_records()] == [
+        ("async_agent", "async_usage_test_model")
+    ]
+    reset_usage()
+
+
+def test_unknown_agent_engine_is_rejected():
+    from ai import _resolve_agent_engine
+
+    assert _resolve_agent_engine("native") == "native"
+    with pytest.raises(ValueError, match="Unknown agent engine"):
+        _resolve_agent_engine("magic")
+
+
+def test_langchain_executor_is_imported_only_when_needed():
+    # A fresh interpreter, since this one has long imported LangChain
+    src = Path(__file__).parent.parent / "src"
+    script = (
+        "import sys, ai; "
+        "print(any(m in sys.modules for m in ('langchain.agents', 'langchain_openai')))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script], cwd=src, capture_output=True, text=True
+    )
+    assert result.stdout.strip() == "False", result.stderr
+
+
+def test_cache_control_markers_only_for_models_that_need_them():
+    from ai import _message_content
+    from helpers.context import Context
+
+    prompt = (
+        Context()
+        .add("Instructions", "x" * 5000)
+        .add("Character", "Frodo", volatile=True)
+        .build(cache_friendly=True)
+    )
+
+    blocks = _message_content("anthropic/claude-sonnet-4", prompt)
+    assert blocks[0]["cache_control"] == {"type": "ephemeral"}
+    assert blocks[0]["text"] == prompt.static_prefix
+    assert blocks[1] == {"type": "text", "text": prompt.volatile_suffix}
+
+    # Automatic prefix caching needs no markers, and plain strings pass through
+    assert _message_content("openai/gpt-4o-mini", prompt) == prompt
+    assert _message_content("anthropic/claude-sonnet-4", "plain") == "plain"
+
+
+def test_call_site_model_routing():
+    from ai import DEFAULT_MODEL, _resolve_call_site
+    from helpers.settings import CallSiteSettings
+
+    project = MagicMock()
+    project.call_sites = {
+        "completeness": CallSiteSettings(model="cheap/model", max_tokens=16)
+    }
+    with patch("ai.settings", return_value=project):
+        assert _resolve_call_site(None, "completeness") == (
+            "cheap/model",
+            {"max_tokens": 16},
+        )
+        # An explicit model still wins; unconfigured sites use the default
+        assert _resolve_call_site("other/model", "completeness")[0] == "other/model"
+        assert _resolve_call_site(None, "detection") == (DEFAULT_MODEL, {})
+    assert _resolve_call_site(None, None) == (DEFAULT_MODEL, {})
+
+
+def test_response_schema_uses_structured_outputs_or_local_validation():
+    from ai import YESNO_SCHEMA, _chat_messages, _conform_to_schema, _response_format
+
+    options = {"response_schema": YESNO_SCHEMA}
+    response_format = _response_format("openai/gpt-4o-mini", options)
+    assert response_format["json_schema"]["schema"] == YESNO_SCHEMA
+
+    # Without provider support the schema goes into the prompt instead
+    messages = _chat_messages("meta-llama/llama-3", "system", "question", options)
+    assert "JSON schema" in messages[1]["content"]
+    assert (
+        "JSON schema"
+        not in _chat_messages("openai/gpt-4o-mini", "system", "question", options)[1][
+            "content"
+        ]
+    )
+
+    assert _conform_to_schema('```json\n{"answer": "YES"}\n```', options) == (
+        '{"answer": "YES"}'
+    )
+    assert _conform_to_schema('{"answer": "MAYBE"}', options) is None
+    assert _conform_to_schema("YES", {}) == "YES"
+
+
+def test_yesno_structured_response():
+    """yesno reads the answer field of a structured reply."""
+    with patch("ai.ai") as mock_ai:
+        mock_ai.return_value = '{"answer": "NO, Gandalf is missing"}'
+        result, reason = yesno("Is everyone here?")
+        assert result is False
+        assert reason == "Gandalf is missing"
+
+
+def test_yesno_accepts_plain_answers_without_structured_outputs(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    """Models without structured outputs may answer a bare YES."""
+    # Keep recordings written by memoise_for_tests out of the repository
+    monkeypatch.chdir(tmp_path)
+    with patch("ai.get_client") as mock_get_client:
+        mock_client = MagicMock()
+        mock_response = MagicMock()
+        mock_response.choices = [MagicMock()]
+        mock_response.choices[0].message.content = "YES"
+        mock_client.chat.completions.create.return_value = mock_response
+        mock_get_client.return_value = mock_client
+
+        assert yesno("Is 2 + 2 = 4?", model="anthropic/claude-3.5-sonnet") == (
+            True,
+            "",
+        )
+        mock_response.choices[0].message.content = "NO, it is 5"
+        assert yesno("Is 2 + 2 = 5?", model="anthropic/claude-3.5-sonnet") == (
+            False,
+            "it is 5",
+        )
+
+    assert mock_client.chat.completions.create.call_count == 2
+
+
 def test_main_runs_without_error():
     # Test that main() runs without error (recording system handles determinism)
     try:
@@ -103,6 +374,35 @@ def test_main_runs_without_error():
         pytest.fail(f"main() raised an exception: {e}")
 
 
+@pytest.mark.parametrize(
+    "error, raised",
+    [(KeyboardInterrupt(), KeyboardInterrupt), (DeadlineExceeded("spent"), SystemExit)],
+)
+def test_usage_summary_is_printed_when_a_command_fails(
+    error: BaseException,
+    raised: Type[BaseException],
+    monkeypatch: pytest.MonkeyPatch,
+    capsys: pytest.CaptureFixture[str],
+):
+    from usage import record_usage, reset_usage
+
+    def failing(chapter_path: str, resume: bool) -> None:
+        record_usage("usage_test_model", 100, 20, 1.0)
+        raise error
+
+    reset_usage()
+    monkeypatch.setattr(
+        "sys.argv", ["fantranslate", "--usage", "extract_characters", "chapter.txt"]
+    )
+    monkeypatch.setattr("main.handle_extract_characters", failing)
+    with pytest.raises(raised):
+        main()
+
+    summary = capsys.readouterr().out.splitlines()
+    assert summary[-1].split()[:5] == ["TOTAL", "1", "100", "20", "120"]
+    reset_usage()
+
+
 def test_yesno_yes_response():
     """Test yesno function with YES response."""
     with patch("ai.ai") as mock_ai:
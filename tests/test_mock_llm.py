@@ -0,0 +1,97 @@
+import json
+import os
+from pathlib import Path
+
+import httpx
+from openai import OpenAI
+
+from mock_llm import (
+    MockLLMServer,
+    MockResponse,
+    PipelineResponder,
+    ScriptedResponder,
+    generate_corpus,
+)
+
+
+def test_scripted_responses_and_tool_calls():
+    responder = ScriptedResponder(
+        [
+            ("hello", MockResponse(content="Hi there")),
+            ("create", MockResponse(tool_calls=[("CreateCharacter", {"name": "Bob"})])),
+        ]
+    )
+    with MockLLMServer(responder) as server:
+        client = OpenAI(base_url=server.base_url, api_key="test", max_retries=0)
+
+        response = client.chat.completions.create(
+            model="m", messages=[{"role": "user", "content": "hello"}]
+        )
+        assert response.choices[0].message.content == "Hi there"
+        assert response.usage is not None
+
+        stream = client.chat.completions.create(
+            model="m",
+            messages=[{"role": "user", "content": "please create"}],
+            stream=True,
+        )
+        calls = [
+            call
+            for chunk in stream
+            if chunk.choices
+            for call in chunk.choices[0].delta.tool_calls or []
+        ]
+        assert calls[0].function is not None
+        assert calls[0].function.name == "CreateCharacter"
+        assert calls[0].function.arguments is not None
+        assert json.loads(calls[0].function.arguments) == {"name": "Bob"}
+
+    assert server.stats.requests == 2
+
+
+def test_injected_rate_limits_are_deterministic():
+    def statuses() -> list:
+        with MockLLMServer(rate_limit_rate=0.5, retry_after=3, seed=7) as server:
+            result = []
+            for _ in range(10):
+                response = httpx.post(
+                    f"{server.base_url}/chat/completions", json={"model": "m"}
+                )
+                result.append(response.status_code)
+                if response.status_code == 429:
+                    assert response.headers["retry-after"] == "3"
+            assert server.stats.rate_limited == result.count(429)
+            return result
+
+    first = statuses()
+    assert 429 in first and 200 in first
+    assert statuses() == first
+
+
+def test_generated_corpus_drives_pipeline_detection(tmp_path: Path):
+    corpus = generate_corpus(str(tmp_path), chapters=3, characters=5, seed=1)
+    assert len(corpus.chapters) == 3
+    assert len(corpus.characters) == 5
+    assert os.path.exists(tmp_path / "project.yml")
+    # Same seed, same corpus
+    again = generate_corpus(str(tmp_path / "again"), chapters=3, characters=5, seed=1)
+    assert again.characters == corpus.characters
+
+    chapter = Path(corpus.chapters[0]).read_text()
+    mentioned = [name for name in corpus.characters if name in chapter]
+    existing = mentioned[0]
+    responder = PipelineResponder(corpus.characters)
+    response = responder(
+        {
+            "messages": [
+                {"role": "system", "content": "You are a character detection judge."},
+                {
+                    "role": "user",
+                    "content": f"** EXISTING CHARACTERS **\n- {existing}\n\n"
+                    f"** CHAPTER TEXT **\n{chapter}\n\n",
+                },
+            ]
+        }
+    )
+    assert response.content is not None
+    assert json.loads(response.content) == {"characters": mentioned[1:]}
@@ -0,0 +1,233 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from recording_store import RecordingStore, get_recording_store
+
+
+def test_reads_legacy_json_and_appends_to_log(tmp_path: Path):
+    (tmp_path / "ai.json").write_text(json.dumps({"old": "legacy", "both": "legacy"}))
+    store = RecordingStore(str(tmp_path), "ai")
+    assert store.get("old") == "legacy"
+
+    assert store.put("both", "new")
+    assert store.put("none", None)
+    assert not store.put("bad", object())  # Not JSON serializable
+
+    # The legacy file is left alone, new recordings go to the log
+    assert json.loads((tmp_path / "ai.json").read_text())["both"] == "legacy"
+    assert len((tmp_path / "ai.log").read_text().splitlines()) == 2
+
+    reloaded = RecordingStore(str(tmp_path), "ai")
+    assert reloaded.get("both") == "new"
+    assert "none" in reloaded and reloaded.get("none", "missing") is None
+    assert "bad" not in reloaded
+    assert len(reloaded) == 3
+
+
+def test_torn_last_line_is_ignored(tmp_path: Path):
+    RecordingStore(str(tmp_path), "agent").put("done", ["output", []])
+    with open(tmp_path / "agent.log", "a", encoding="utf-8") as f:
+        f.write('torn\t["outp')
+
+    store = RecordingStore(str(tmp_path), "agent")
+    assert store.get("done") == ["output", []]
+    assert "torn" not in store
+
+
+def test_store_is_loaded_once_per_directory(tmp_path: Path):
+    first = get_recording_store("yesno", str(tmp_path / "a"))
+    assert get_recording_store("yesno", str(tmp_path / "a")) is first
+    assert get_recording_store("yesno", str(tmp_path / "b")) is not first
+
+
+def test_recording_keys_are_structural():
+    from langchain.schema import AIMessage, HumanMessage
+
+    from ai_test_helpers import _large_digests, _recording_key
+
+    assert _recording_key(("a:b",), {}) != _recording_key(("a", "b"), {})
+    assert _recording_key(("a",), {"model": None}) != _recording_key(("a",), {})
+    assert _recording_key([[HumanMessage(content="hi")]], {}) != _recording_key(
+        [[AIMessage(content="hi")]], {}
+    )
+
+    chapter = "x" * 10000
+    key = _recording_key(("system", chapter), {})
+    assert chapter in _large_digests
+    # An equal string built separately gets the same key
+    assert _recording_key(("system", "".join(["x"] * 10000)), {}) == key
+
+
+def test_recordings_with_legacy_keys_still_replay(tmp_path: Path):
+    from ai_test_helpers import _legacy_recording_key, _lookup
+
+    args = ("system", "user")
+    legacy_key = _legacy_recording_key(args, {})
+    (tmp_path / "ai.json").write_text(json.dumps({legacy_key: "recorded"}))
+
+    key, recorded = _lookup(RecordingStore(str(tmp_path), "ai"), args, {})
+    assert key != legacy_key
+    assert recorded == "recorded"
+
+
+def _record_many(directory: str, worker: int) -> None:
+    store = RecordingStore(directory, "ai")
+    for i in range(50):
+        store.put(f"{worker}-{i}", "x" * (i * 1000))
+
+
+def test_parallel_writers_do_not_lose_recordings(tmp_path: Path):
+    import multiprocessing
+
+    reader = RecordingStore(str(tmp_path), "ai")
+    with multiprocessing.get_context("spawn").Pool(4) as pool:
+        pool.starmap(_record_many, [(str(tmp_path), worker) for worker in range(4)])
+
+    # Recordings of other processes are found without reloading
+    assert reader.get("3-49") == "x" * 49000
+    store = RecordingStore(str(tmp_path), "ai")
+    assert len(store) == 200
+    assert all(
+        store.get(f"{w}-{i}") == "x" * (i * 1000) for w in range(4) for i in range(50)
+    )
+
+
+def test_writers_without_fcntl_use_a_lock_file(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    import os
+    import threading
+
+    monkeypatch.setattr("recording_store.fcntl", None)
+    # A lock left behind by a crashed writer is taken over
+    lock_path = tmp_path / "ai.log.lock"
+    lock_path.touch()
+    os.utime(lock_path, (0, 0))
+
+    writers = [
+        threading.Thread(target=_record_many, args=(str(tmp_path), worker))
+        for worker in range(4)
+    ]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+
+    assert not lock_path.exists()
+    store = RecordingStore(str(tmp_path), "ai")
+    assert len(store) == 200
+    assert store.get("2-30") == "x" * 30000
+
+
+def test_compact_keeps_only_tracked_hits(tmp_path: Path):
+    from ai_test_helpers import _legacy_recording_key, _lookup
+    from commands.recordings import format_recording_stats
+
+    legacy_key = _legacy_recording_key(("old",), {})
+    (tmp_path / "agent.json").write_text(json.dumps({legacy_key: "legacy hit"}))
+    untracked = RecordingStore(str(tmp_path), "yesno")
+    untracked.put("unused", "YES")
+
+    # Recorded by an earlier, untracked run
+    earlier = RecordingStore(str(tmp_path), "agent")
+    earlier.put("live", "hit")
+    earlier.put("dead", "never replayed")
+
+    store = RecordingStore(str(tmp_path), "agent")
+    store.track_hits()
+    key, _ = _lookup(store, ("old",), {})
+    _lookup(store, ("old",), {})
+    assert store.get("live") == "hit"  # Not a tracked replay
+    store.record_hit("live")
+    store.put("fresh", "recorded by the tracked run")
+
+    assert store.stats()["live"] == 3 and store.stats()["hits"] == 4
+    assert "agent                   4" in format_recording_stats(str(tmp_path))
+
+    assert store.compact() == (3, 1)
+    assert not (tmp_path / "agent.json").exists()
+    reloaded = RecordingStore(str(tmp_path), "agent")
+    assert reloaded.get(key) == "legacy hit"  # Moved to its current key
+    assert reloaded.get("live") == "hit" and "dead" not in reloaded
+    assert reloaded.get("fresh") == "recorded by the tracked run"
+
+    # Functions without tracked hits are left alone
+    assert RecordingStore(str(tmp_path), "yesno").compact() == (1, 0)
+
+
+def test_compact_does_not_lose_concurrent_writes(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    import os
+    import threading
+    import time
+
+    store = RecordingStore(str(tmp_path), "ai")
+    store.track_hits()
+    store.put("live", "hit")
+    store.record_hit("live")
+    # Another process that indexed the log before it was compacted
+    other = RecordingStore(str(tmp_path), "ai")
+    assert other.get("live") == "hit"
+
+    replace = os.replace
+    writer = threading.Thread(target=other.put, args=("late", "written meanwhile"))
+
+    def replace_while_writing(src: str, dst: str) -> None:
+        writer.start()
+        time.sleep(0.1)  # The writer is now waiting for the lock
+        replace(src, dst)
+
+    monkeypatch.setattr("recording_store.os.replace", replace_while_writing)
+    assert store.compact() == (1, 0)
+    writer.join()
+
+    reloaded = RecordingStore(str(tmp_path), "ai")
+    assert reloaded.get("late") == "written meanwhile"
+    assert reloaded.get("live") == "hit"
+    assert other.get("live") == "hit" and other.get("late") == "written meanwhile"
+
+
+def test_large_recordings_are_compressed(tmp_path: Path):
+    history = [
+        {"type": "AIMessage", "content": "word " * 2000, "additional_kwargs": {}}
+    ]
+    store = RecordingStore(str(tmp_path), "agent")
+    store.put("large", ["output", history])
+    store.put("small", "YES")
+
+    assert (tmp_path / "agent.log").stat().st_size < 1000
+    reloaded = RecordingStore(str(tmp_path), "agent")
+    assert reloaded.get("large") == ["output", history]
+    assert reloaded.get("small") == "YES"
+
+
+def test_replayed_chat_history_works_in_langchain_containers():
+    from langchain_core.chat_history import InMemoryChatMessageHistory
+    from langchain_core.prompt_values import ChatPromptValue
+
+    from ai_test_helpers import _deserialize
+
+    serialized = {"type": "HumanMessage", "content": "hi", "additional_kwargs": {}}
+    output, history = _deserialize(["output", [serialized, serialized]])
+
+    assert output == "output"
+    assert type(history) is list
+    assert len(InMemoryChatMessageHistory(messages=history).messages) == 2
+    assert ChatPromptValue(messages=history).to_messages() == history
+
+
+def test_large_input_digests_are_safe_across_threads():
+    from concurrent.futures import ThreadPoolExecutor
+
+    from ai_test_helpers import LARGE_DIGEST_CACHE_SIZE, _recording_key
+
+    # More distinct inputs than the cache holds, so threads evict each other's
+    chapters = [str(i) * 5000 for i in range(LARGE_DIGEST_CACHE_SIZE * 2)]
+    expected = [_recording_key((chapter,), {}) for chapter in chapters]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        for _ in range(3):
+            keys = list(pool.map(lambda c: _recording_key((c,), {}), chapters))
+            assert keys == expected
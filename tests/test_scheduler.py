@@ -0,0 +1,91 @@
+import json
+from typing import List
+from unittest.mock import patch
+
+import httpx
+
+from scheduler import (
+    RequestScheduler,
+    SchedulingTransport,
+    TokenBucket,
+    parse_retry_after,
+)
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_token_bucket_waits_once_capacity_is_spent():
+    clock = FakeClock()
+    bucket = TokenBucket(per_minute=60, clock=clock)
+
+    assert bucket.reserve(60) == 0.0
+    assert bucket.reserve(1) == 1.0  # One token per second refill
+    clock.now = 2.0
+    assert bucket.reserve(1) == 0.0
+
+
+def test_scheduler_throttles_after_rate_limit_and_recovers():
+    clock = FakeClock()
+    scheduler = RequestScheduler(requests_per_minute=60, clock=clock)
+    scheduler.set_model_limits("slow-model", 60, 1000)
+
+    scheduler.record_rate_limited("slow-model", retry_after=5)
+    assert scheduler.reserve("slow-model", 10) == 5.0
+    # Other models are unaffected
+    assert scheduler.reserve("other-model", 10) == 0.0
+
+    for _ in range(20):
+        scheduler.record_success("slow-model", 10, 10)
+    clock.now = 5.0
+    assert scheduler.reserve("slow-model", 10) == 0.0
+
+
+def test_parse_retry_after():
+    assert parse_retry_after(httpx.Headers({"retry-after": "3"})) == 3.0
+    assert parse_retry_after(httpx.Headers({"retry-after-ms": "1500"})) == 1.5
+    assert parse_retry_after(httpx.Headers({})) is None
+
+
+def test_transport_retries_rate_limited_requests():
+    statuses = [429, 429, 200]
+    models: List[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        models.append(json.loads(request.content)["model"])
+        status = statuses.pop(0)
+        if status == 429:
+            return httpx.Response(429, headers={"retry-after": "2"})
+        return httpx.Response(200, json={"usage": {"total_tokens": 7}})
+
+    scheduler = RequestScheduler()
+    transport = SchedulingTransport(scheduler, httpx.MockTransport(handler))
+    client = httpx.Client(transport=transport)
+
+    with patch("scheduler.time.sleep") as mock_sleep:
+        response = client.post("https://llm.test/chat", json={"model": "m"})
+
+    assert response.status_code == 200
+    assert models == ["m", "m", "m"]
+    # Each retry waited at least as long as the server asked for
+    assert len([c for c in mock_sleep.call_args_list if c.args[0] >= 2]) == 2
+
+
+def test_transport_gives_up_after_max_retries():
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(429)
+
+    scheduler = RequestScheduler(max_retries=2, base_delay=0)
+    client = httpx.Client(
+        transport=SchedulingTransport(scheduler, httpx.MockTransport(handler))
+    )
+
+    with patch("scheduler.time.sleep"):
+        response = client.post("https://llm.test/chat", json={"model": "m"})
+
+    assert response.status_code == 429
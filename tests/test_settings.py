@@ -151,3 +151,106 @@ def test_settings_translate_to_not_in_languages(tmp_path: Path):
 
     with pytest.raises(ValueError, match="'translate_to' must be in 'languages'"):
         settings()
+
+
+def test_settings_cache_defaults_to_disabled(tmp_path: Path):
+    os.chdir(str(tmp_path))
+    project_yml = {"languages": ["ru"], "translate_from": "en", "translate_to": "ru"}
+    with open("project.yml", "w") as f:
+        yaml.dump(project_yml, f)
+
+    assert settings().cache.enabled is False
+
+
+def test_settings_cache_section(tmp_path: Path):
+    os.chdir(str(tmp_path))
+    project_yml = {
+        "languages": ["ru"],
+        "translate_from": "en",
+        "translate_to": "ru",
+        "cache": {"enabled": True, "max_entries": 50, "ttl_days": 2},
+    }
+    with open("project.yml", "w") as f:
+        yaml.dump(project_yml, f)
+
+    result = settings()
+    assert result.cache.enabled is True
+    assert result.cache.max_entries == 50
+    assert result.cache.ttl_days == 2
+    assert result.cache.max_size_mb == 100
+
+
+def test_settings_cache_invalid(tmp_path: Path):
+    os.chdir(str(tmp_path))
+    project_yml = {
+        "languages": ["ru"],
+        "translate_from": "en",
+        "translate_to": "ru",
+        "cache": {"enabled": "yes"},
+    }
+    with open("project.yml", "w") as f:
+        yaml.dump(project_yml, f)
+
+    with pytest.raises(ValueError, match="'cache.enabled' must be a boolean"):
+        settings()
+
+
+def test_settings_call_sites(tmp_path: Path):
+    os.chdir(str(tmp_path))
+    project_yml = {
+        "languages": ["ru"],
+        "translate_from": "en",
+        "translate_to": "ru",
+        "call_sites": {
+            "completeness": {"model": "cheap/model", "max_tokens": 16, "timeout": 20},
+            "extraction": {"model": "strong/model", "fallbacks": ["backup/model"]},
+        },
+        "circuit_breaker": {"failure_threshold": 3, "slow_call_seconds": 30},
+    }
+    with open("project.yml", "w") as f:
+        yaml.dump(project_yml, f)
+
+    result = settings()
+    assert result.call_sites["completeness"].model == "cheap/model"
+    assert result.call_sites["completeness"].max_tokens == 16
+    assert result.call_sites["completeness"].timeout == 20.0
+    assert result.call_sites["extraction"].max_tokens is None
+    assert result.call_sites["extraction"].fallbacks == ["backup/model"]
+    assert result.call_sites["completeness"].fallbacks == []
+    assert result.circuit_breaker.failure_threshold == 3
+    assert result.circuit_breaker.slow_call_seconds == 30.0
+    assert result.circuit_breaker.reset_seconds == 30
+    assert "detection" not in result.call_sites
+
+
+def test_settings_call_sites_unknown_name(tmp_path: Path):
+    os.chdir(str(tmp_path))
+    project_yml = {
+        "languages": ["ru"],
+        "translate_from": "en",
+        "translate_to": "ru",
+        "call_sites": {"summarize": {"model": "cheap/model"}},
+    }
+    with open("project.yml", "w") as f:
+        yaml.dump(project_yml, f)
+
+    with pytest.raises(ValueError, match="Unknown call site 'summarize'"):
+        settings()
+
+
+def test_settings_hedging_section(tmp_path: Path):
+    os.chdir(str(tmp_path))
+    project_yml = {
+        "languages": ["ru"],
+        "translate_from": "en",
+        "translate_to": "ru",
+        "hedging": {"enabled": True, "call_sites": ["completeness"]},
+    }
+    with open("project.yml", "w") as f:
+        yaml.dump(project_yml, f)
+
+    result = settings()
+    assert result.hedging.enabled is True
+    assert result.hedging.call_sites == ["completeness"]
+    assert result.hedging.percentile == 95
+    assert result.hedging.max_extra_ratio == 0.1
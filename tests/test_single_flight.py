@@ -0,0 +1,79 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+from unittest.mock import patch
+
+import pytest
+
+from single_flight import AsyncSingleFlight, SingleFlight
+
+
+def test_concurrent_duplicates_share_one_call():
+    flight: SingleFlight[str] = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    joined = threading.Semaphore(0)
+    calls: List[str] = []
+
+    def slow() -> str:
+        calls.append("call")
+        started.set()
+        release.wait(5)
+        return "summary"
+
+    with patch("single_flight.log_trace", side_effect=lambda *_: joined.release()):
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            futures = [pool.submit(flight.do, "key", slow)]
+            started.wait(5)
+            futures += [pool.submit(flight.do, "key", slow) for _ in range(3)]
+            for _ in range(3):
+                joined.acquire(timeout=5)
+            release.set()
+            results = [f.result() for f in futures]
+
+    assert results == ["summary"] * 4
+    assert len(calls) == 1
+    # Nothing is kept afterwards: a new request runs again
+    assert flight.do("key", lambda: "fresh") == "fresh"
+
+
+def test_errors_reach_every_waiter():
+    flight: SingleFlight[str] = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def failing() -> str:
+        started.set()
+        release.wait(5)
+        raise RuntimeError("boom")
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        leader = pool.submit(flight.do, "key", failing)
+        started.wait(5)
+        follower = pool.submit(flight.do, "key", lambda: "not called")
+        release.set()
+        with pytest.raises(RuntimeError):
+            leader.result()
+        with pytest.raises(RuntimeError):
+            follower.result()
+
+
+def test_async_duplicates_share_one_call():
+    flight: AsyncSingleFlight[str] = AsyncSingleFlight()
+    calls: List[str] = []
+
+    async def slow() -> str:
+        calls.append("call")
+        await asyncio.sleep(0.01)
+        return "translated"
+
+    async def run() -> List[str]:
+        return list(
+            await asyncio.gather(
+                flight.do("a", slow), flight.do("a", slow), flight.do("b", slow)
+            )
+        )
+
+    assert asyncio.run(run()) == ["translated"] * 3
+    assert len(calls) == 2
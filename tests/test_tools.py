@@ -3,13 +3,16 @@ from unittest.mock import MagicMock, patch
 
 from helpers.settings import Settings
 from tools.character import (
+    UpsertCharacterItem,
     add_character_short_name,
+    character_collection,
     character_tools,
     create_character,
     get_all_characters,
     get_character_translation,
     search_character,
     set_character_gender,
+    upsert_characters,
 )
 from tools.hello import hello_tool
 
@@ -23,12 +26,13 @@ def test_hello_tool():
 
 def test_character_tools():
     """Test that character tools are defined."""
-    assert len(character_tools) == 6
+    assert len(character_tools) == 7
     names = [tool.name for tool in character_tools]
     assert "SearchCharacter" in names
     assert "CreateCharacter" in names
     assert "AddCharacterShortName" in names
     assert "SetCharacterGender" in names
+    assert "UpsertCharacters" in names
     assert "GetCharacterTranslation" in names
     assert "GetAllCharacters" in names
 
@@ -170,3 +174,72 @@ def test_get_all_characters(
     assert "Gandalf" in result
     # Should not contain characteristics
     assert "<characteristics>" not in result
+
+
+@patch("models.character.settings")
+@patch("models.character_collection.settings")
+def test_upsert_characters(
+    mock_collection_settings: MagicMock, mock_character_settings: MagicMock
+) -> None:
+    """Test creating and updating several characters in one call."""
+    settings_obj = Settings(
+        languages=["en", "ru", "fr"], translate_from="jp", translate_to="en"
+    )
+    mock_collection_settings.return_value = settings_obj
+    mock_character_settings.return_value = settings_obj
+    result = upsert_characters(
+        [
+            UpsertCharacterItem(
+                name="Samwise Gamgee",
+                short_names=["Sam", "Samwise Gamgee"],
+                gender="male",
+                characteristics=["A loyal gardener"],
+            ),
+            UpsertCharacterItem(name="Galadriel", gender="female"),
+            UpsertCharacterItem(name=" "),
+        ]
+    )
+    lines = result.splitlines()
+    assert len(lines) == 3
+    assert lines[0].startswith("1. 'Samwise Gamgee': created")
+    assert "skipped short names" in lines[0]
+    assert lines[1] == "2. 'Galadriel': created"
+    assert lines[2].startswith("3. Error upserting character")
+
+    result = upsert_characters(
+        [UpsertCharacterItem(name="Sam", characteristics=["A loyal gardener"])]
+    )
+    assert "updated existing character 'Samwise Gamgee'" in result
+    search = search_character("Sam")
+    assert "<short_name>Sam</short_name>" in search
+    assert "<confidence>2</confidence>" in search
+
+
+@patch("models.character.settings")
+@patch("models.character_collection.settings")
+def test_upsert_characters_reports_near_misses(
+    mock_collection_settings: MagicMock, mock_character_settings: MagicMock
+) -> None:
+    """A name only close to an existing character is not merged into it."""
+    settings_obj = Settings(
+        languages=["en", "ru", "fr"], translate_from="jp", translate_to="en"
+    )
+    mock_collection_settings.return_value = settings_obj
+    mock_character_settings.return_value = settings_obj
+    upsert_characters([UpsertCharacterItem(name="Meriadoc", gender="male")])
+    count = len(character_collection.characters)
+
+    result = upsert_characters(
+        [
+            UpsertCharacterItem(name="Meriadok", gender="female"),
+            UpsertCharacterItem(name="meriadoc", characteristics=["A hobbit"]),
+        ]
+    )
+    lines = result.splitlines()
+    assert lines[0].startswith("1. Error upserting character 'Meriadok'")
+    assert "'Meriadoc'" in lines[0]
+    assert lines[1] == "2. 'meriadoc': updated existing character 'Meriadoc'"
+    assert len(character_collection.characters) == count
+    meriadoc = character_collection.get("Meriadoc")
+    assert meriadoc is not None and meriadoc.gender is not None
+    assert meriadoc.gender.original_text == "male"
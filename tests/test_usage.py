@@ -0,0 +1,71 @@
+import json
+
+import httpx
+
+from scheduler import RequestScheduler, SchedulingTransport
+from usage import (
+    format_usage_summary,
+    record_usage,
+    reset_usage,
+    stage,
+    usage_by_stage,
+    usage_records,
+)
+
+
+def test_usage_is_attributed_to_the_current_stage():
+    reset_usage()
+    with stage("detection_judge"):
+        record_usage("m", 100, 20, 1.5, cost=0.01)
+        record_usage("m", 50, 10, 0.5, cost=0.02)
+    record_usage("m", 5, 5, 0.1)
+
+    totals = usage_by_stage()
+    assert list(totals) == ["detection_judge", "other"]
+    assert totals["detection_judge"].calls == 2
+    assert totals["detection_judge"].total_tokens == 180
+    assert totals["detection_judge"].cost is not None
+    assert round(totals["detection_judge"].cost, 4) == 0.03
+    assert totals["other"].cost is None
+
+    summary = format_usage_summary()
+    assert "detection_judge" in summary
+    assert summary.splitlines()[-1].split()[:5] == ["TOTAL", "3", "155", "35", "190"]
+    reset_usage()
+    assert format_usage_summary() == "No LLM calls were made."
+
+
+def test_transport_records_usage_of_plain_and_streamed_responses():
+    def handler(request: httpx.Request) -> httpx.Response:
+        if json.loads(request.content).get("stream"):
+            events = (
+                b'data: {"choices": [{"delta": {"content": "hi"}}]}\n\n'
+                b'data: {"choices": [], "usage": {"prompt_tokens": 3, '
+                b'"completion_tokens": 4, "cost": 0.5}}\n\n'
+                b"data: [DONE]\n\n"
+            )
+            return httpx.Response(200, content=iter([events]))
+        return httpx.Response(
+            200, json={"usage": {"prompt_tokens": 10, "completion_tokens": 2}}
+        )
+
+    reset_usage()
+    client = httpx.Client(
+        transport=SchedulingTransport(RequestScheduler(), httpx.MockTransport(handler))
+    )
+    with stage("summary"):
+        client.post("https://llm.test/chat", json={"model": "a"})
+        with client.stream(
+            "POST", "https://llm.test/chat", json={"model": "b", "stream": True}
+        ) as response:
+            response.read()
+
+    records = usage_records()
+    assert [
+        (r.stage, r.model, r.prompt_tokens, r.completion_tokens) for r in records
+    ] == [
+        ("summary", "a", 10, 2),
+        ("summary", "b", 3, 4),
+    ]
+    assert records[1].cost == 0.5
+    reset_usage()